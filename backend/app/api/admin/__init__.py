@@ -10,6 +10,8 @@ from .subscription import router as subscription_router
 from .insights import router as insights_router
 from .finance import router as finance_router
 from .email import router as email_router
+from .metrics import router as metrics_router
+from .logs import router as logs_router
 
 routers = [
     # admin_router,
@@ -22,4 +24,6 @@ routers = [
     insights_router,
     finance_router,
     email_router,
+    metrics_router,
+    logs_router,
 ]
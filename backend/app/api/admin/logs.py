@@ -0,0 +1,67 @@
+# backend/app/api/admin/logs.py
+"""Admin endpoints for log activity and the log retention job."""
+
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from app.auth.supabase_auth import get_supabase_user
+from app.services.log_retention import LogRetentionInProgress, log_retention_job
+from app.storage.log_retention import LOG_SOURCES, get_log_activity, get_log_compaction_state
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def require_admin(user=Depends(get_supabase_user)):
+    role = user.get("user_metadata", {}).get("role")
+    if role != "admin":
+        logger.warning(f"⛔ Access denied: user {user['id']} with role '{role}' tried to access admin route")
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
+
+@router.get("/admin/logs/activity")
+async def get_log_activity_series(
+    source: str,
+    granularity: Literal["hour", "day"] = "day",
+    days: int = Query(30, ge=1, le=730),
+    key: Optional[str] = None,
+    user_id: Optional[str] = None,
+    vehicle_id: Optional[str] = None,
+    user=Depends(require_admin),
+):
+    """
+    Returns counts, durations, bytes and cost per bucket and key for one log
+    table over the last `days` days, from rollups and recent raw rows alike.
+    """
+    if source not in LOG_SOURCES:
+        raise HTTPException(status_code=400, detail=f"Unknown source, expected one of {', '.join(LOG_SOURCES)}")
+    if granularity == "hour" and days > 31:
+        raise HTTPException(status_code=400, detail="Hourly activity is limited to 31 days")
+    end = datetime.now(timezone.utc)
+    return await get_log_activity(
+        source,
+        end - timedelta(days=days),
+        end,
+        granularity=granularity,
+        key=key,
+        user_id=user_id,
+        vehicle_id=vehicle_id,
+    )
+
+@router.get("/admin/logs/retention")
+async def get_log_retention_status(user=Depends(require_admin)):
+    """Returns the compaction boundary per log table and the counters of the retention job."""
+    return {
+        "sources": await get_log_compaction_state(),
+        "job": log_retention_job.stats(),
+    }
+
+@router.post("/admin/logs/retention/run")
+async def run_log_retention(user=Depends(require_admin)):
+    """Runs the log compaction and pruning now and returns what it did per table."""
+    logger.info(f"👮 Admin {user['id']} started a log retention run")
+    try:
+        return await log_retention_job.run_once()
+    except LogRetentionInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
@@ -0,0 +1,57 @@
+# backend/app/api/admin/metrics.py
+"""Admin endpoints exposing in-process runtime metrics (queues, caches, connection pools)."""
+
+import logging
+from fastapi import APIRouter, Depends, HTTPException
+from app.auth.supabase_auth import get_supabase_user
+from app.enode.client import enode_client
+from app.lib.api_key_utils import api_key_user_cache
+from app.lib.supabase import get_supabase_pool_stats
+from app.services.charging_samples import charging_sample_writer
+from app.services.charging_sessions import charging_session_detector
+from app.services.charging_stats import charging_stats_cache
+from app.services.enode_reconcile import enode_reconciler
+from app.services.ha_push import ha_push_dispatcher
+from app.services.log_retention import log_retention_job
+from app.services.rate_limiter import poll_counter
+from app.services.status_panel import status_panel_cache
+from app.services.status_snapshots import status_snapshots
+from app.services.telemetry_writer import telemetry_writer
+from app.services.vehicle_refresher import vehicle_refresher
+from app.services.vehicle_stream import vehicle_stream_hub
+from app.services.webhook_ingest import webhook_ingestor
+from app.storage.vehicle import vehicle_change_tracker
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def require_admin(user=Depends(get_supabase_user)):
+    role = user.get("user_metadata", {}).get("role")
+    if role != "admin":
+        logger.warning(f"⛔ Access denied: user {user['id']} with role '{role}' tried to access admin route")
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
+
+@router.get("/admin/metrics")
+async def get_runtime_metrics(user=Depends(require_admin)):
+    """Returns counters from the background workers and caches of this process."""
+    return {
+        "telemetry_writer": telemetry_writer.stats(),
+        "api_key_user_cache": api_key_user_cache.stats(),
+        "rate_limit_counters": poll_counter.stats(),
+        "supabase_pool": get_supabase_pool_stats(),
+        "webhook_ingest": webhook_ingestor.stats(),
+        "charging_samples": charging_sample_writer.stats(),
+        "charging_sessions": charging_session_detector.stats(),
+        "charging_stats_cache": charging_stats_cache.stats(),
+        "ha_push": ha_push_dispatcher.stats(),
+        "vehicle_writes": vehicle_change_tracker.stats(),
+        "status_snapshots": status_snapshots.stats(),
+        "status_panel": status_panel_cache.stats(),
+        "ha_stream": vehicle_stream_hub.stats(),
+        "enode_client": enode_client.stats(),
+        "vehicle_refresher": vehicle_refresher.stats(),
+        "enode_reconcile": enode_reconciler.stats(),
+        "log_retention": log_retention_job.stats(),
+    }
@@ -30,6 +30,11 @@ def require_admin(user=Depends(get_supabase_user)):
 async def list_settings():
     return await settings.get_all_settings()
 
+@router.get("/admin/settings/snapshot")
+async def get_settings_snapshot(user=Depends(require_admin)):
+    """Returns the version and age of the in-memory settings snapshot of this process."""
+    return settings.settings_snapshot.info()
+
 @router.post("/admin/settings")
 async def create_setting(setting: dict, user=Depends(require_admin)):
     return await settings.add_setting(setting)
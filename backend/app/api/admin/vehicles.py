@@ -5,6 +5,8 @@ import logging
 from fastapi import APIRouter, Depends, HTTPException
 from app.auth.supabase_auth import get_supabase_user
 from app.enode.vehicle import get_all_vehicles
+from app.services.enode_reconcile import ReconcileInProgress, enode_reconciler
+from app.storage.enode_reconcile import get_recent_reconcile_runs
 
 logger = logging.getLogger(__name__)
 
@@ -37,3 +39,23 @@ async def list_all_vehicles(user=Depends(require_admin)):
     except Exception as e:
         logger.error(f"[❌ Enode API] Failed to fetch vehicles: {e}")
         raise HTTPException(status_code=502, detail="Failed to fetch vehicles from Enode")
+
+@router.post("/admin/vehicles/reconcile")
+async def run_vehicle_reconcile(user=Depends(require_admin)):
+    """
+    Runs one increment of the Enode fleet reconciliation now and returns its
+    drift counters. The pass continues from its stored cursor.
+    """
+    logger.info(f"👮 Admin {user['id']} started an Enode reconciliation run")
+    try:
+        return await enode_reconciler.run_once()
+    except ReconcileInProgress as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"[❌ reconcile] Manual run failed: {e}")
+        raise HTTPException(status_code=502, detail="Reconciliation run failed, see last_error of the pass")
+
+@router.get("/admin/vehicles/reconcile/runs")
+async def list_vehicle_reconcile_runs(limit: int = 20, user=Depends(require_admin)):
+    """Returns the latest reconciliation passes with their cursor and drift counters."""
+    return await get_recent_reconcile_runs(limit=min(max(limit, 1), 100))
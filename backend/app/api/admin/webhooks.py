@@ -47,7 +47,7 @@ async def list_enode_webhooks(user=Depends(require_admin)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/webhook/logs")
-def fetch_webhook_logs(
+async def fetch_webhook_logs(
     event: str | None = Query(None),
     user_q: str | None = Query(None),
     vehicle_q: str | None = Query(None),
@@ -56,7 +56,7 @@ def fetch_webhook_logs(
 ):
     try:
         logger.info(f"[🔍] Fetching webhook logs with filters: event={event}, user={user_q}, vehicle={vehicle_q}, limit={limit}")
-        logs = get_webhook_logs(
+        logs = await get_webhook_logs(
             limit=limit,
             event_filter=event,
             user_filter=user_q,
@@ -1,21 +1,22 @@
 """FastAPI dependencies for rate limiting and subscription tier requirements."""
 
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import AsyncIterator, Optional
 from fastapi import Depends, HTTPException, Request, BackgroundTasks
 
 from app.auth.supabase_auth import get_supabase_user
 from app.auth.api_key_auth import get_api_key_user
+from app.dependencies.request_context import RequestContext, get_request_context
 # MODIFIED: Import more specific user functions
 from app.storage.user import get_user_rate_limit_data, decrement_purchased_api_tokens
-from app.storage.poll_logs import log_poll, count_polls_since, count_polls_since_for_vehicle
-from app.storage.vehicles import get_vehicle_by_id_and_user_id
+from app.services.rate_limiter import SCOPE_USER, SCOPE_VEHICLE, counts_against_allowance, poll_counter
+from app.storage.poll_logs import log_poll, count_polls_since
 from app.storage.settings import get_setting_by_name
 from app.logger import logger # NEW: Import logger
 
 # TODO: This function can be removed once pydantic-settings is fully implemented.
 async def _get_setting_value(setting_name: str, default_value: int) -> int:
-    """Retrieves a setting value by name, with a fallback default."""
+    """Retrieves a setting value by name (from the settings snapshot), with a fallback default."""
     s = await get_setting_by_name(setting_name)
     if s:
         return int(s.get("value", default_value))
@@ -23,150 +24,213 @@ async def _get_setting_value(setting_name: str, default_value: int) -> int:
 
 # TODO: Define tier names (e.g., "free", "basic", "pro") as constants or an Enum.
 
+# Endpoints that are rate-limited and logged as polls
+RATE_LIMITED_ENDPOINTS = [
+    "/api/status/",
+    "/api/ha/status/",
+    "/api/ha/charging/",
+]
+
+
+class PollAllowance:
+    """
+    Monthly poll allowance of an API-key user, resolved once per request.
+
+    Free users are counted per user; basic and pro users per vehicle. Once the
+    allowance is used up, polls are paid with purchased one-time tokens.
+    """
+
+    def __init__(self, user_id: str, record: dict, settings: dict[str, int], now: datetime):
+        self.user_id = user_id
+        self.now = now
+        self.tier = record.get("tier", "free")
+        self.linked_vehicle_count = record.get("linked_vehicle_count", 0)
+        # Purchased tokens not yet spent by this request
+        self.purchased_api_tokens = record.get("purchased_api_tokens", 0)
+
+        # NEW: Get the date when the monthly allowance resets
+        tier_reset_date_str = record.get("tier_reset_date")
+        tier_reset_date = None
+        if tier_reset_date_str:
+            try:
+                # Assuming tier_reset_date is in ISO format (e.g., 'YYYY-MM-DDTHH:MM:SS.ffffff+HH:MM')
+                tier_reset_date = datetime.fromisoformat(tier_reset_date_str)
+                # Ensure it's timezone-aware if 'now' is timezone-aware
+                if tier_reset_date.tzinfo is None:
+                    tier_reset_date = tier_reset_date.replace(tzinfo=timezone.utc)
+            except ValueError:
+                # Handle cases where the string is not a valid ISO format
+                tier_reset_date = None # Fallback to default if parsing fails
+
+        # MODIFIED: Use a monthly window based on the reset date
+        if tier_reset_date and tier_reset_date > now:
+            self.window_start = tier_reset_date - timedelta(days=30) # Approximate, cron will handle exact reset
+        else:
+            self.window_start = now - timedelta(days=30)
+
+        # Determine the effective tier for rate limiting based on trial/subscription status
+        self.effective_tier = self.tier
+        if self.tier in ["basic", "pro"]:
+            # If trial has ended or no active subscription, treat as free for rate limiting
+            # tier_reset_date being None or in the past implies no active subscription or trial
+            if not tier_reset_date or tier_reset_date <= now:
+                self.effective_tier = "free"
+                logger.info(f"[INFO] User {user_id} (original tier: {self.tier}) is falling back to FREE tier for rate limiting due to expired trial or no active subscription.")
+
+        if self.effective_tier in ["basic", "pro"]:
+            self.max_calls = settings[f"rate_limit.{self.tier}.max_calls"]
+            self.max_linked_vehicles = settings[f"rate_limit.{self.tier}.max_linked_vehicles"]
+        else: # Default to free tier
+            self.max_calls = settings["rate_limit.free.max_calls"]
+            self.max_linked_vehicles = 0
+
+    @property
+    def per_vehicle(self) -> bool:
+        """True if polls are counted per vehicle rather than per user."""
+        return self.effective_tier in ["basic", "pro"]
+
+    def check_linked_vehicles(self) -> None:
+        """Raises 403 if the user has more linked vehicles than the tier allows."""
+        if self.linked_vehicle_count > self.max_linked_vehicles:
+            raise HTTPException(status_code=403, detail=f"{self.tier.capitalize()} tier allows max {self.max_linked_vehicles} linked vehicles. You have {self.linked_vehicle_count}.")
+
+    def take(self, current_count: int) -> bool:
+        """
+        Admits one poll given the polls already counted in the window.
+        Returns True if it has to be paid with a purchased token.
+        """
+        if current_count < self.max_calls:
+            return False
+        if self.purchased_api_tokens > 0:
+            # User has exhausted monthly allowance, but has purchased tokens.
+            # The token is only taken once the response is known (see bill).
+            self.purchased_api_tokens -= 1
+            return True
+        # No monthly allowance and no purchased tokens left.
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded for {self.tier} tier. Monthly allowance ({current_count}/{self.max_calls}) and purchased tokens (0) are exhausted."
+        )
+
+    async def bill(self, ctx: RequestContext, vehicle_id: Optional[str], use_purchased_token: bool, not_modified: bool) -> None:
+        """
+        Counts an answered poll against the allowance. Counters are updated
+        before the response is sent, so concurrent requests see it.
+        """
+        if not counts_against_allowance(not_modified):
+            return
+        if use_purchased_token:
+            await ctx.call(decrement_purchased_api_tokens, self.user_id)
+        await poll_counter.record(SCOPE_USER, self.user_id, self.now)
+        if vehicle_id:
+            await poll_counter.record(SCOPE_VEHICLE, vehicle_id, self.now)
+
+
+async def get_poll_allowance(user_id: str, ctx: RequestContext) -> PollAllowance:
+    """Loads the rate-limit record and settings of a user. Raises 404 for unknown users."""
+    # MODIFIED: Fetch all required user data in one call
+    record = await ctx.get_rate_limit_data(user_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="User not found.")
+
+    # Load settings dynamically
+    settings = {
+        "rate_limit.free.max_calls": await _get_setting_value("rate_limit.free.max_calls", 300),
+        "rate_limit.basic.max_calls": await _get_setting_value("rate_limit.basic.max_calls", 2000),
+        "rate_limit.pro.max_calls": await _get_setting_value("rate_limit.pro.max_calls", 10000),
+        "rate_limit.basic.max_linked_vehicles": await _get_setting_value("rate_limit.basic.max_linked_vehicles", 2),
+        "rate_limit.pro.max_linked_vehicles": await _get_setting_value("rate_limit.pro.max_linked_vehicles", 5),
+    }
+    return PollAllowance(user_id, record, settings, datetime.now(timezone.utc))
+
+
 async def api_key_rate_limit(
     request: Request,
     background_tasks: BackgroundTasks,
-    user=Depends(get_api_key_user)
-) -> None:
+    user=Depends(get_api_key_user),
+    ctx: RequestContext = Depends(get_request_context),
+) -> AsyncIterator[None]:
     """
     Rate limit for API-key authenticated users, based on a monthly tier allowance
     plus a balance of purchased one-time tokens.
     """
     user_id = user.id
-    # MODIFIED: Fetch all required user data in one call
-    record = await get_user_rate_limit_data(user_id)
-    if not record:
-        raise HTTPException(status_code=404, detail="User not found.")
+    ctx.user = user
+    allowance = await get_poll_allowance(user_id, ctx)
+    log_vehicle_id = None
 
-    tier = record.get("tier", "free")
-    linked_vehicle_count = record.get("linked_vehicle_count", 0)
-    # NEW: Get purchased token balance
-    purchased_api_tokens = record.get("purchased_api_tokens", 0)
-    # NEW: Get the date when the monthly allowance resets
-    tier_reset_date_str = record.get("tier_reset_date")
-    tier_reset_date = None
-    if tier_reset_date_str:
-        try:
-            # Assuming tier_reset_date is in ISO format (e.g., 'YYYY-MM-DDTHH:MM:SS.ffffff+HH:MM')
-            tier_reset_date = datetime.fromisoformat(tier_reset_date_str)
-            # Ensure it's timezone-aware if 'now' is timezone-aware
-            if tier_reset_date.tzinfo is None:
-                tier_reset_date = tier_reset_date.replace(tzinfo=timezone.utc)
-        except ValueError:
-            # Handle cases where the string is not a valid ISO format
-            tier_reset_date = None # Fallback to default if parsing fails
+    path_vehicle_id = request.path_params.get("vehicle_id")
 
-    now = datetime.now(timezone.utc)
-    # MODIFIED: Use a monthly window based on the reset date
-    if tier_reset_date and tier_reset_date > now:
-        window_start = tier_reset_date - timedelta(days=30) # Approximate, cron will handle exact reset
-    else:
-        window_start = now - timedelta(days=30)
+    # Check if the current path is a vehicle-specific endpoint
+    is_vehicle_specific_endpoint = request.url.path.startswith("/api/ha/status/") or request.url.path.startswith("/api/ha/charging/")
 
-    # Determine the effective tier for rate limiting based on trial/subscription status
-    effective_tier = tier
-    if tier in ["basic", "pro"]:
-        # If trial has ended or no active subscription, treat as free for rate limiting
-        # tier_reset_date being None or in the past implies no active subscription or trial
-        if not tier_reset_date or tier_reset_date <= now:
-            effective_tier = "free"
-            logger.info(f"[INFO] User {user_id} (original tier: {tier}) is falling back to FREE tier for rate limiting due to expired trial or no active subscription.")
+    if allowance.per_vehicle and is_vehicle_specific_endpoint:
+        if not path_vehicle_id:
+            raise HTTPException(status_code=400, detail=f"Vehicle ID is required in the URL path for {allowance.tier} tier for this endpoint.")
 
+        # Loaded once per request; the handler reuses the same row.
+        vehicle = await ctx.get_vehicle(path_vehicle_id)
+        if not vehicle or vehicle.get("user_id") != user_id:
+            raise HTTPException(status_code=404, detail="Vehicle not found or does not belong to user.")
 
-    max_calls = 0
-    max_linked_vehicles = 0
-    current_count = 0
-    log_vehicle_id = None
+        allowance.check_linked_vehicles()
 
-    # Load settings dynamically
-    free_max_calls = await _get_setting_value("rate_limit.free.max_calls", 300)
-    basic_max_calls = await _get_setting_value("rate_limit.basic.max_calls", 2000)
-    pro_max_calls = await _get_setting_value("rate_limit.pro.max_calls", 10000)
-    basic_max_linked_vehicles = await _get_setting_value("rate_limit.basic.max_linked_vehicles", 2)
-    pro_max_linked_vehicles = await _get_setting_value("rate_limit.pro.max_linked_vehicles", 5)
+        current_count = await poll_counter.count_since(SCOPE_VEHICLE, path_vehicle_id, allowance.window_start)
+        log_vehicle_id = path_vehicle_id
+    else:
+        # Free tier, or not a vehicle-specific endpoint (like /api/ha/vehicles):
+        # count calls for the user, not a specific vehicle
+        current_count = await poll_counter.count_since(SCOPE_USER, user_id, allowance.window_start)
 
-    path_vehicle_id = request.path_params.get("vehicle_id")
+    # MODIFIED: Main rate limit logic with token fallback
+    use_purchased_token = allowance.take(current_count)
+
+    if not any(request.url.path.startswith(ep) for ep in RATE_LIMITED_ENDPOINTS):
+        yield
+        return
+
+    # The poll is billed after the handler has run, because a 304 answer to a
+    # conditional request is only billed with NOT_MODIFIED_POLLS_COUNT. The
+    # poll_logs insert (the billing record) runs as a background task.
+    try:
+        yield
+    finally:
+        await allowance.bill(ctx, log_vehicle_id, use_purchased_token, ctx.not_modified)
+        background_tasks.add_task(
+            log_poll,
+            user_id=user_id,
+            endpoint=request.url.path,
+            timestamp=allowance.now,
+            vehicle_id=log_vehicle_id,
+            not_modified=ctx.not_modified,
+        )
 
-    if effective_tier == "free":
-        max_calls = free_max_calls
-        current_count = await count_polls_since(user_id, window_start)
-    elif effective_tier in ["basic", "pro"]:
-        if tier == "basic":
-            max_calls = basic_max_calls
-            max_linked_vehicles = basic_max_linked_vehicles
-        else: # pro
-            max_calls = pro_max_calls
-            max_linked_vehicles = pro_max_linked_vehicles
-
-        # Check if the current path is a vehicle-specific endpoint
-        is_vehicle_specific_endpoint = request.url.path.startswith("/api/ha/status/") or request.url.path.startswith("/api/ha/charging/")
-
-        if is_vehicle_specific_endpoint:
-            if not path_vehicle_id:
-                raise HTTPException(status_code=400, detail=f"Vehicle ID is required in the URL path for {tier} tier for this endpoint.")
-
-            vehicle = await get_vehicle_by_id_and_user_id(path_vehicle_id, user_id)
-            if not vehicle:
-                raise HTTPException(status_code=404, detail="Vehicle not found or does not belong to user.")
-
-            if linked_vehicle_count > max_linked_vehicles:
-                raise HTTPException(status_code=403, detail=f"{tier.capitalize()} tier allows max {max_linked_vehicles} linked vehicles. You have {linked_vehicle_count}.")
-
-            current_count = await count_polls_since_for_vehicle(path_vehicle_id, window_start)
-            log_vehicle_id = path_vehicle_id
-        else: # Not a vehicle-specific endpoint, like /api/ha/vehicles
-            # For non-vehicle specific endpoints, count calls for the user, not a specific vehicle
-            current_count = await count_polls_since(user_id, window_start)
-            log_vehicle_id = None # No specific vehicle for logging this type of call
-    else: # Default to free tier
-        max_calls = free_max_calls
-        current_count = await count_polls_since(user_id, window_start)
 
-    # MODIFIED: Main rate limit logic with token fallback
-    if current_count >= max_calls:
-        if purchased_api_tokens > 0:
-            # User has exhausted monthly allowance, but has purchased tokens.
-            # Decrement token balance and allow the request.
-            await decrement_purchased_api_tokens(user_id)
-            # Log this as a token-based call for clarity, could add a flag to log_poll if needed
-        else:
-            # No monthly allowance and no purchased tokens left.
-            raise HTTPException(
-                status_code=429,
-                detail=f"Rate limit exceeded for {tier} tier. Monthly allowance ({current_count}/{max_calls}) and purchased tokens (0) are exhausted."
-            )
-    
-    # Define endpoints that should be rate-limited and logged
-    rate_limited_endpoints = [
-        "/api/status/",
-        "/api/ha/status/",
-        "/api/ha/charging/",
-    ]
-
-    # Schedule logging as a background task only for specified endpoints
-    if any(request.url.path.startswith(ep) for ep in rate_limited_endpoints):
-        background_tasks.add_task(log_poll, user_id=user_id, endpoint=request.url.path, timestamp=now, vehicle_id=log_vehicle_id)
-
-
-async def require_pro_tier(user=Depends(get_api_key_user)) -> None:
+async def require_pro_tier(
+    user=Depends(get_api_key_user),
+    ctx: RequestContext = Depends(get_request_context),
+) -> None:
     """
     Dependency to ensure the user has a 'pro' subscription tier.
     """
     user_id = user.id
     # MODIFIED: Use the more efficient data fetcher
-    record = await get_user_rate_limit_data(user_id)
+    record = await ctx.get_rate_limit_data(user_id)
     tier = record.get("tier", "free") if record else "free"
 
     if tier != "pro":
         raise HTTPException(status_code=403, detail="This feature is only available for Pro users.")
 
-async def require_basic_or_pro_tier(user=Depends(get_api_key_user)) -> None:
+async def require_basic_or_pro_tier(
+    user=Depends(get_api_key_user),
+    ctx: RequestContext = Depends(get_request_context),
+) -> None:
     """
     Dependency to ensure the user has a 'basic' or 'pro' subscription tier.
     """
     user_id = user.id
     # MODIFIED: Use the more efficient data fetcher
-    record = await get_user_rate_limit_data(user_id)
+    record = await ctx.get_rate_limit_data(user_id)
     tier = record.get("tier", "free") if record else "free"
 
     if tier == "free":
@@ -204,7 +268,7 @@ async def rate_limit_dependency(
 
     now = datetime.now(timezone.utc)
     since = now - window
-    count = await count_polls_since(user_id, since)
+    count = await count_polls_since(user_id, since, include_not_modified=True)
     if count >= max_calls:
         raise HTTPException(
             status_code=429,
@@ -5,16 +5,43 @@ Home Assistant API endpoints for EVLink backend.
 """
 import json
 import logging
-from fastapi import APIRouter, Depends, HTTPException, Body
+from typing import Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Body, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field
 from postgrest.exceptions import APIError
 
 from app.auth.api_key_auth import get_api_key_user
+from app.config import HA_STATUS_BATCH_MAX_IDS
+from app.lib.telemetry_middleware import no_payload_capture
+from app.lib.timestamps import parse_updated_at
 from app.models.user import User
-from app.storage.vehicle import get_all_cached_vehicles, get_vehicle_by_id
+from app.services.status_snapshots import (
+    KIND_HA,
+    KIND_LEGACY,
+    StatusSnapshot,
+    body_etag,
+    encode_body,
+    is_not_modified,
+    not_modified_response,
+    status_snapshots,
+    validator_headers,
+)
+from app.services.vehicle_stream import StreamLimitExceeded, state_payload, vehicle_stream_hub
+from app.services.rate_limiter import SCOPE_USER, SCOPE_VEHICLE, poll_counter
+from app.storage.poll_logs import log_polls
+from app.storage.vehicle import (
+    HA_VEHICLE_FIELDS,
+    get_all_cached_vehicles,
+    get_vehicle_status_by_id,
+    get_vehicle_statuses_by_ids,
+    vehicle_cache_of,
+)
 from app.enode.vehicle import set_vehicle_charging
-from app.api.dependencies import api_key_rate_limit, require_pro_tier, require_basic_or_pro_tier
+from app.api.dependencies import api_key_rate_limit, get_poll_allowance, require_pro_tier, require_basic_or_pro_tier
 from app.dependencies.auth import get_current_user
+from app.dependencies.request_context import RequestContext, get_request_context
 from app.storage.user import get_user_by_id 
 
 # Create a module-specific logger
@@ -50,10 +77,49 @@ def _handle_api_error(e: APIError, vehicle_id: str, context: str):
     logger.error("[%s] API error fetching vehicle %s: %s", context, vehicle_id, payload, exc_info=True)
     raise HTTPException(status_code=502, detail="Error fetching vehicle data")
 
+async def _status_response(kind: str, vehicle_id: str, vehicle: dict, ctx: RequestContext, request: Request) -> Response:
+    """
+    Returns the pre-encoded status body of a vehicle, or a 304 if the client
+    already has it. The snapshot is rebuilt from the vehicle cache only when
+    the row changed since it was built.
+    """
+    snapshot = status_snapshots.get(kind, vehicle_id, vehicle.get("updated_at"))
+    if snapshot is None:
+        snapshot = await _build_status_snapshot(kind, vehicle_id, ctx)
+
+    response = snapshot.to_response(request)
+    # Lets api_key_rate_limit bill the poll at the not-modified rate
+    ctx.not_modified = response.status_code == 304
+    return ctx.apply_headers(response)
+
+async def _build_status_snapshot(kind: str, vehicle_id: str, ctx: RequestContext) -> StatusSnapshot:
+    """Reads the status fields of a vehicle and stores a fresh snapshot."""
+    try:
+        row = await ctx.call(get_vehicle_status_by_id, vehicle_id)
+    except APIError as e:
+        _handle_api_error(e, vehicle_id, "get_vehicle_status")
+    except Exception as e:
+        logger.error(
+            "[get_vehicle_status] Unexpected error fetching vehicle %s: %s",
+            vehicle_id,
+            e,
+            exc_info=True,
+        )
+        raise HTTPException(status_code=502, detail="Error fetching vehicle data")
+
+    if not row:
+        logger.warning("[get_vehicle_status] Vehicle not found: %s", vehicle_id)
+        raise HTTPException(status_code=404, detail="Vehicle not found")
+
+    return status_snapshots.put(kind, row, vehicle_cache_of(row))
+
 @router.get("/ha/me", 
             summary="Get current user information for Home Assistant",
             )
-async def get_current_user_info(user: User = Depends(get_api_key_user)):
+async def get_current_user_info(
+    user: User = Depends(get_api_key_user),
+    ctx: RequestContext = Depends(get_request_context),
+):
     """
     Endpoint to get the current user information for Home Assistant integration.
     Returns user ID and tier.
@@ -61,7 +127,7 @@ async def get_current_user_info(user: User = Depends(get_api_key_user)):
     logger.info("[get_current_user_info] Fetching user info for user_id=%s", user.id)
     
     try:
-        public_user = await get_user_by_id(user.id)
+        public_user = await ctx.call(get_user_by_id, user.id)
     except APIError as e:
         _handle_api_error(e, user.id, "get_current_user_info")
     except Exception as e:
@@ -89,7 +155,12 @@ async def get_current_user_info(user: User = Depends(get_api_key_user)):
 
 @router.get("/status/{vehicle_id}",
             dependencies=[Depends(api_key_rate_limit)],)
-async def get_vehicle_status(vehicle_id: str, user: User = Depends(get_api_key_user)):
+async def get_vehicle_status(
+    vehicle_id: str,
+    request: Request,
+    user: User = Depends(get_api_key_user),
+    ctx: RequestContext = Depends(get_request_context),
+):
     logger.info(                                                                                                                                                                                                                                            
         "[get_vehicle_status] Fetching full status for vehicle_id=%s, user_id=%s",
         vehicle_id,
@@ -97,7 +168,7 @@ async def get_vehicle_status(vehicle_id: str, user: User = Depends(get_api_key_u
     )
 
     try:
-        vehicle = await get_vehicle_by_id(vehicle_id)
+        vehicle = await ctx.get_vehicle(vehicle_id)
     except APIError as e:
         _handle_api_error(e, vehicle_id, "get_vehicle_status")
     except Exception as e:
@@ -121,58 +192,22 @@ async def get_vehicle_status(vehicle_id: str, user: User = Depends(get_api_key_u
         )
         raise HTTPException(status_code=403, detail="Access denied")
 
-    try:
-        cache = json.loads(vehicle["vehicle_cache"])
-    except json.JSONDecodeError as e:
-        logger.error(
-            "[get_vehicle_status] JSON decode error for vehicle_cache %s: %s",
-            vehicle_id,
-            e,
-            exc_info=True,
-        )
-        raise HTTPException(status_code=500, detail=f"Invalid vehicle cache: {e}")
-
-    charge = cache.get("chargeState", {})
-    info = cache.get("information", {})
-    location = cache.get("location", {})
-    last_seen = cache.get("lastSeen")
-    is_reachable = cache.get("isReachable")
-    odometer = cache.get("odometer", {})
-    vendor = cache.get("vendor")
-    smart_charging_policy = cache.get("smartChargingPolicy", {})
-
-    return {
-        # legacy keys (to be removed later)
-        "batteryLevel": charge.get("batteryLevel"),
-        "range": charge.get("range"),
-        "isCharging": charge.get("isCharging"),
-        "isPluggedIn": charge.get("isPluggedIn"),
-        "chargingState": charge.get("powerDeliveryState"),
-        # old keys (to be used in Home Assistant)
-        "vehicleName": f"{info.get('brand', '')} {info.get('model', '')}",
-        "latitude": location.get("latitude"),
-        "longitude": location.get("longitude"),
-        "lastSeen": last_seen,
-        "isReachable": is_reachable,
-        # new full block for future Home Assistant sensors
-        "chargeState": charge,
-        "information": info,
-        "location": location,
-        "odometer": odometer,
-        "vendor": vendor,
-        "smartChargingPolicy": smart_charging_policy,
-    }
+    return await _status_response(KIND_LEGACY, vehicle_id, vehicle, ctx, request)
 
 @router.get("/ha/vehicles",)
-async def get_vehicles(user: User = Depends(get_api_key_user)):
+async def get_vehicles(
+    request: Request,
+    user: User = Depends(get_api_key_user),
+    ctx: RequestContext = Depends(get_request_context),
+):
     """
     Endpoint to get all vehicles for the current user.
-    Returns a list of vehicle IDs and names.
+    Returns a list of vehicle IDs and names. Supports If-None-Match/If-Modified-Since.
     """
     logger.info("[get_vehicles] Fetching vehicles for user_id=%s", user.id)
 
     try:
-        vehicles = get_all_cached_vehicles(user.id)
+        vehicles = await ctx.call(get_all_cached_vehicles, user.id, fields=HA_VEHICLE_FIELDS)
         logger.debug("[get_vehicles] Vehicles fetched: %s", vehicles)
     except APIError as e:
         _handle_api_error(e, user.id, "get_vehicles")
@@ -198,24 +233,20 @@ async def get_vehicles(user: User = Depends(get_api_key_user)):
             logger.warning("Vehicle saknar vehicle_id eller id: %r", vehicle)
             continue
         result.append(unpack_vehicle(vehicle, vehicle_id))
-    return result
+
+    body, etag = encode_body(result)
+    updated = [dt for dt in (parse_updated_at(v.get("updated_at")) for v in vehicles) if dt]
+    last_modified = max(updated).replace(microsecond=0) if updated else None
+    if is_not_modified(request, etag, last_modified):
+        return ctx.apply_headers(not_modified_response(etag, last_modified))
+    return ctx.apply_headers(Response(content=body, media_type="application/json", headers=validator_headers(etag, last_modified)))
     
 
 def unpack_vehicle(vehicle, vehicle_id):
     """
     Unpack vehicle data from the database format to a more usable format.
     """
-    try:
-        cache = json.loads(vehicle["vehicle_cache"])
-    except json.JSONDecodeError as e:
-        logger.error(
-            "[get_vehicle_status] JSON decode error for vehicle_cache %s: %s",
-            vehicle_id,
-            e,
-            exc_info=True,
-        )
-        raise HTTPException(status_code=500, detail=f"Invalid vehicle cache: {e}")
-
+    cache = vehicle_cache_of(vehicle)
     charge = cache.get("chargeState", {})
     info = cache.get("information", {})
     location = cache.get("location", {})
@@ -243,7 +274,12 @@ def unpack_vehicle(vehicle, vehicle_id):
 
 @router.get("/ha/status/{vehicle_id}",
             dependencies=[Depends(api_key_rate_limit)],)
-async def get_vehicle_status(vehicle_id: str, user: User = Depends(get_api_key_user)):
+async def get_vehicle_status(
+    vehicle_id: str,
+    request: Request,
+    user: User = Depends(get_api_key_user),
+    ctx: RequestContext = Depends(get_request_context),
+):
     logger.info(                                                                                                                                                                                                                                            
         "[get_vehicle_status] Fetching full status for vehicle_id=%s, user_id=%s",
         vehicle_id,
@@ -251,7 +287,7 @@ async def get_vehicle_status(vehicle_id: str, user: User = Depends(get_api_key_u
     )
 
     try:
-        vehicle = await get_vehicle_by_id(vehicle_id)
+        vehicle = await ctx.get_vehicle(vehicle_id)
     except APIError as e:
         _handle_api_error(e, vehicle_id, "get_vehicle_status")
     except Exception as e:
@@ -275,39 +311,160 @@ async def get_vehicle_status(vehicle_id: str, user: User = Depends(get_api_key_u
         )
         raise HTTPException(status_code=403, detail="Access denied")
 
+    return await _status_response(KIND_HA, vehicle_id, vehicle, ctx, request)
+
+@router.get("/ha/status",
+            summary="Get the status of several vehicles in one request",
+            )
+async def get_vehicle_statuses(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    ids: list[str] = Query(..., description="Vehicle IDs, comma-separated or as repeated parameters"),
+    user: User = Depends(get_api_key_user),
+    ctx: RequestContext = Depends(get_request_context),
+):
+    """
+    Status of several vehicles, as returned by /api/ha/status/{vehicle_id}:
+      { "vehicles": { "<vehicle_id>": {...} }, "errors": { "<vehicle_id>": { "status": 404, "detail": "..." } } }
+    The API key and allowance are checked once and all vehicles are read in
+    one query; every vehicle returned is billed as one poll. Supports
+    If-None-Match/If-Modified-Since for the response as a whole.
+    """
+    vehicle_ids = list(dict.fromkeys(i.strip() for raw in ids for i in raw.split(",") if i.strip()))
+    if not vehicle_ids:
+        raise HTTPException(status_code=400, detail="At least one vehicle ID is required")
+    if len(vehicle_ids) > HA_STATUS_BATCH_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {HA_STATUS_BATCH_MAX_IDS} vehicle IDs per request")
+
+    logger.info("[get_vehicle_statuses] Fetching status for %d vehicle(s), user_id=%s", len(vehicle_ids), user.id)
+    ctx.user = user
+    allowance = await get_poll_allowance(user.id, ctx)
+
     try:
-        cache = json.loads(vehicle["vehicle_cache"])
-    except json.JSONDecodeError as e:
+        rows = await ctx.call(get_vehicle_statuses_by_ids, vehicle_ids)
+    except APIError as e:
+        _handle_api_error(e, user.id, "get_vehicle_statuses")
+    except Exception as e:
         logger.error(
-            "[get_vehicle_status] JSON decode error for vehicle_cache %s: %s",
-            vehicle_id,
+            "[get_vehicle_statuses] Unexpected error fetching vehicles for user %s: %s",
+            user.id,
             e,
             exc_info=True,
         )
-        raise HTTPException(status_code=500, detail=f"Invalid vehicle cache: {e}")
+        raise HTTPException(status_code=502, detail="Error fetching vehicle data")
 
-    charge = cache.get("chargeState", {})
-    info = cache.get("information", {})
-    location = cache.get("location", {})
-    last_seen = cache.get("lastSeen")
-    is_reachable = cache.get("isReachable")
-    odometer = cache.get("odometer", {})
-    vendor = cache.get("vendor")
-    smart_charging_policy = cache.get("smartChargingPolicy", {})
-    capabilities = cache.get("capabilities", {})
-    
-    return {
-        "vehicleName": f"{info.get('brand', '')} {info.get('model', '')}",
-        "isReachable": is_reachable,
-        "chargeState": charge,
-        "information": info,
-        "location": location,
-        "odometer": odometer,
-        "vendor": vendor,
-        "smartChargingPolicy": smart_charging_policy,
-        "capabilities": capabilities,
-        "lastSeen": last_seen,
-    }
+    rows_by_id = {row["id"]: row for row in rows}
+    errors: dict[str, dict] = {}
+    owned = []
+    for vehicle_id in vehicle_ids:
+        row = rows_by_id.get(vehicle_id)
+        if not row:
+            errors[vehicle_id] = {"status": 404, "detail": "Vehicle not found"}
+        elif row.get("user_id") != user.id:
+            logger.warning(
+                "[get_vehicle_statuses] Access denied for user_id=%s on vehicle_id=%s",
+                user.id,
+                vehicle_id,
+            )
+            errors[vehicle_id] = {"status": 403, "detail": "Access denied"}
+        else:
+            owned.append(row)
+
+    # Each vehicle is admitted against its own allowance (basic/pro) or the
+    # user's, in which case the vehicles admitted before it count too
+    user_count = 0
+    if owned and allowance.per_vehicle:
+        allowance.check_linked_vehicles()
+    elif owned:
+        user_count = await poll_counter.count_since(SCOPE_USER, user.id, allowance.window_start)
+    admitted = []
+    for row in owned:
+        if allowance.per_vehicle:
+            current_count = await poll_counter.count_since(SCOPE_VEHICLE, row["id"], allowance.window_start)
+        else:
+            current_count = user_count + len(admitted)
+        try:
+            use_purchased_token = allowance.take(current_count)
+        except HTTPException as e:
+            errors[row["id"]] = {"status": e.status_code, "detail": e.detail}
+            continue
+        admitted.append((row, use_purchased_token))
+
+    snapshots = {}
+    for row, _ in admitted:
+        snapshot = status_snapshots.get(KIND_HA, row["id"], row.get("updated_at"))
+        if snapshot is None:
+            snapshot = status_snapshots.put(KIND_HA, row, vehicle_cache_of(row))
+        snapshots[row["id"]] = snapshot
+
+    # Assembled from the pre-encoded bodies of the snapshots
+    body = b"".join([
+        b'{"vehicles":{',
+        b",".join(json.dumps(vehicle_id).encode("utf-8") + b":" + snapshot.body for vehicle_id, snapshot in snapshots.items()),
+        b'},"errors":',
+        json.dumps(errors, separators=(",", ":")).encode("utf-8"),
+        b"}",
+    ])
+    etag = body_etag(body)
+    last_modified = max((snapshot.last_modified for snapshot in snapshots.values()), default=None)
+    ctx.not_modified = is_not_modified(request, etag, last_modified)
+
+    # Billed like one /api/ha/status/{vehicle_id} poll per vehicle returned;
+    # as there, only per-vehicle allowances record which vehicle was polled
+    for row, use_purchased_token in admitted:
+        if row["id"] in snapshots:
+            await allowance.bill(ctx, row["id"] if allowance.per_vehicle else None, use_purchased_token, ctx.not_modified)
+    request.state.billed_polls = len(snapshots)
+    background_tasks.add_task(
+        log_polls,
+        user_id=user.id,
+        endpoint=request.url.path,
+        timestamp=allowance.now,
+        vehicle_ids=list(snapshots) if allowance.per_vehicle else [None] * len(snapshots),
+        not_modified=ctx.not_modified,
+    )
+
+    if ctx.not_modified:
+        return ctx.apply_headers(not_modified_response(etag, last_modified))
+    return ctx.apply_headers(Response(content=body, media_type="application/json", headers=validator_headers(etag, last_modified)))
+
+@router.get("/ha/stream",
+            summary="Stream vehicle status changes (Server-Sent Events)",
+            dependencies=[Depends(require_pro_tier)],
+            )
+@no_payload_capture
+async def stream_vehicle_status(
+    user: User = Depends(get_api_key_user),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    resume_from: Optional[str] = Query(None, alias="last_event_id"),
+):
+    """
+    Server-Sent Events stream of the user's vehicles. Starts with a `state`
+    event per vehicle, followed by a `delta` event (changed fields only) each
+    time a vehicle is updated, and a comment line as heartbeat. Reconnecting
+    with the Last-Event-ID header (or the `last_event_id` query parameter)
+    resumes after that event. Streams are not billed as polls.
+    """
+    logger.info("[stream_vehicle_status] Opening stream for user_id=%s", user.id)
+
+    async def load_state() -> list[dict]:
+        vehicles = await get_all_cached_vehicles(user.id, fields=HA_VEHICLE_FIELDS)
+        return [state_payload(v["id"], vehicle_cache_of(v), v.get("updated_at")) for v in vehicles]
+
+    try:
+        frames = vehicle_stream_hub.stream(user.id, last_event_id or resume_from, load_state)
+    except StreamLimitExceeded as e:
+        logger.warning("[stream_vehicle_status] Rejecting stream for user_id=%s: %s", user.id, e)
+        raise HTTPException(status_code=429, detail=str(e))
+
+    # The background task also runs when the client disconnects before the
+    # first frame, so the stream's slot is always released
+    return StreamingResponse(
+        frames,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(frames.aclose),
+    )
 
 # -------------------------------------------------------------------
 # Pydantic model for charging action
@@ -335,6 +492,7 @@ async def post_vehicle_charging(
     vehicle_id: str,
     body: ChargingActionRequest = Body(...),
     user: User = Depends(get_api_key_user),
+    ctx: RequestContext = Depends(get_request_context),
 ):
     """
     Endpoint to start or stop charging for a given vehicle. Expects JSON:
@@ -350,7 +508,7 @@ async def post_vehicle_charging(
 
     # 1) Fetch vehicle to verify ownership
     try:
-        vehicle = await get_vehicle_by_id(vehicle_id)
+        vehicle = await ctx.get_vehicle(vehicle_id)
     except APIError as e:
         _handle_api_error(e, vehicle_id, "post_vehicle_charging")
     except Exception as e:
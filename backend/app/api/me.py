@@ -7,6 +7,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 
 from app.auth.supabase_auth import get_supabase_user
+from app.config import NOT_MODIFIED_POLLS_COUNT
 from app.logger import logger
 from app.services.brevo import add_or_update_brevo_contact
 from app.storage.poll_logs import count_polls_since, count_polls_in_period # NEW: Import count_polls_in_period
@@ -184,7 +185,8 @@ async def get_api_usage_stats(user=Depends(get_supabase_user)):
         start_time = datetime.now(timezone.utc) - timedelta(days=30)
         logger.info(f"[API Usage] User {user_id} (Tier: {user_tier}) is FREE, using rolling 30-day window: {start_time} to {end_time}")
 
-    current_calls = await count_polls_in_period(user_id, start_time, end_time)
+    # Counted like the rate limiter does, so 304 answers only show up when they are billed
+    current_calls = await count_polls_in_period(user_id, start_time, end_time, include_not_modified=NOT_MODIFIED_POLLS_COUNT)
 
     return ApiUsageStatsResponse(
         current_calls=current_calls,
@@ -1,21 +1,21 @@
 # 📄 backend/app/api/private.py
 
 from fastapi import APIRouter, Body, Depends, HTTPException, Path, Query
-from datetime import datetime, timezone, timedelta
 
 from pydantic import BaseModel
 from app.auth.supabase_auth import get_supabase_user
 from app.enode.link import create_link_session
-from app.enode.user import get_user_vehicles_enode, unlink_vendor
+from app.enode.user import unlink_vendor
 from app.storage.api_key import create_api_key, get_api_key_info
-from app.storage.insights import get_global_stats_row, get_user_stats_row
 from app.storage.invoice import get_user_invoices
 from app.storage.subscription import get_user_record, get_user_subscription
 from app.storage.user import get_ha_webhook_settings, get_onboarding_status, set_ha_webhook_settings, update_notify_offline, update_user_terms
 from app.api.dependencies import require_pro_tier
-from app.storage.vehicle import get_all_cached_vehicles, get_vehicle_by_vehicle_id, save_vehicle_data_with_client
+from app.services.charging_stats import charging_stats_cache
+from app.lib.timestamps import parse_updated_at
+from app.services.vehicle_refresher import RefreshFailed, vehicle_refresher
+from app.storage.vehicle import get_all_cached_vehicles, get_vehicle_by_vehicle_id, vehicle_cache_of
 
-import json
 import logging
 
 
@@ -25,8 +25,6 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-CACHE_EXPIRATION_MINUTES = 5
-
 class LinkVehicleRequest(BaseModel):
     vendor: str
 
@@ -50,60 +48,55 @@ class SubscriptionStatusResponse(BaseModel):
 
 @router.get("/user/vehicles", response_model=list)
 async def get_user_vehicles(user=Depends(get_supabase_user)):
-    """Fetches all vehicles linked to the current user, utilizing a cache."""
+    """
+    Fetches all vehicles linked to the current user from the cache. A stale
+    cache is served as is while a background refresh from Enode runs; only a
+    user without any cached vehicle waits for Enode.
+    """
     user_id = user["id"]
-    now = datetime.now(timezone.utc)
 
     logger.info(f"🔐 Authenticated user: {user_id} ({user['email']})")
 
-    cached_data = get_all_cached_vehicles(user_id)
+    cached_data = await get_all_cached_vehicles(user_id)
     logger.debug(f"[DEBUG] cached_data: {cached_data}")
-    vehicles_from_cache = []
 
     if cached_data:
-        try:
-            updated_at = datetime.fromisoformat(cached_data[0]["updated_at"])
-            logger.debug(f"[DEBUG] now: {now}")
-            logger.debug(f"[DEBUG] updated_at: {updated_at}")
-            logger.debug(f"[DEBUG] now - updated_at: {now - updated_at}")
-            logger.debug(f"[DEBUG] threshold: {timedelta(minutes=CACHE_EXPIRATION_MINUTES)}")
-            if now - updated_at < timedelta(minutes=CACHE_EXPIRATION_MINUTES):
-                for row in cached_data:
-                    vehicle_obj = json.loads(row["vehicle_cache"]) if isinstance(row["vehicle_cache"], str) else row["vehicle_cache"]
-                    vehicle_obj["db_id"] = row["id"]
-                    vehicles_from_cache.append(vehicle_obj)
-                logger.info(f"✅ Serving {len(vehicles_from_cache)} vehicles from cache")
-                return vehicles_from_cache
-            else:
-                logger.info("ℹ️ Cache expired")
-        except Exception as e:
-            logger.warning(f"[⚠️ cache] Failed to parse updated_at: {e}")
-
+        if any(vehicle_refresher.is_stale(parse_updated_at(row.get("updated_at"))) for row in cached_data):
+            vehicle_refresher.schedule(user_id)
+            logger.info(f"ℹ️ Cache expired, serving {len(cached_data)} cached vehicle(s) while refreshing")
+        else:
+            logger.info(f"✅ Serving {len(cached_data)} vehicles from cache")
+        return _vehicles_from_cache(cached_data)
+
+    # Nothing cached yet (e.g. right after linking): wait for the first fetch
     try:
-        fresh_vehicles = await get_user_vehicles_enode(user_id)
-        logger.info(f"🔄 Fetched {len(fresh_vehicles)} fresh vehicle(s) from Enode")
-
-        for vehicle in fresh_vehicles:
-            vehicle["userId"] = user_id
-            await save_vehicle_data_with_client(vehicle)
-
-        logger.info(f"💾 Saved {len(fresh_vehicles)} vehicle(s) to Supabase")
-
-        # Fetch the cache again and return from the newly populated cache
-        cached_data = get_all_cached_vehicles(user_id)
-        logger.debug(f"[DEBUG] post-save cached_data: {cached_data}")
-        vehicles_from_cache = []
-        for row in cached_data:
-            vehicle_obj = json.loads(row["vehicle_cache"]) if isinstance(row["vehicle_cache"], str) else row["vehicle_cache"]
-            vehicle_obj["db_id"] = row["id"]
-            vehicles_from_cache.append(vehicle_obj)
-        logger.info(f"✅ Returning {len(vehicles_from_cache)} vehicles (after fresh fetch)")
-        return vehicles_from_cache
-
+        await vehicle_refresher.refresh(user_id)
+        cached_data = await get_all_cached_vehicles(user_id)
+    except RefreshFailed as e:
+        # A failed fetch is not retried within the throttle interval; an
+        # empty list would look like the user has no vehicles
+        logger.warning(f"[⚠️ fetch_fresh] {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Vehicles are temporarily unavailable, please try again shortly",
+            headers={"Retry-After": str(max(int(vehicle_refresher.min_interval), 1))},
+        )
     except Exception as e:
         logger.error(f"[❌ fetch_fresh] Failed to fetch or save vehicles: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch vehicles")
 
+    logger.info(f"✅ Returning {len(cached_data)} vehicles (after fresh fetch)")
+    return _vehicles_from_cache(cached_data)
+
+def _vehicles_from_cache(cached_data: list[dict]) -> list[dict]:
+    """Enode vehicle objects of `vehicles` rows, with their database ID as db_id."""
+    vehicles = []
+    for row in cached_data:
+        vehicle_obj = vehicle_cache_of(row)
+        vehicle_obj["db_id"] = row["id"]
+        vehicles.append(vehicle_obj)
+    return vehicles
+
 @router.get("/vehicle/by_vid")
 async def get_vehicle_by_vid(
     vehicle_id: str = Query(..., alias="vehicle_id"),
@@ -131,7 +124,7 @@ async def create_user_api_key(user_id: str = Path(...), user=Depends(get_supabas
         raise HTTPException(status_code=403, detail="Not authorized to create API key for another user")
 
     logger.info(f"🔑 Creating API key for user: {user_id}")
-    raw_key = create_api_key(user_id)
+    raw_key = await create_api_key(user_id)
     logger.info(f"✅ API key created for user: {user_id}")
     return {"api_key": raw_key}
 
@@ -142,7 +135,7 @@ async def get_user_api_key_info(user_id: str = Path(...), user=Depends(get_supab
         raise HTTPException(status_code=403, detail="Not authorized to view API key for another user")
 
     logger.info(f"🔍 Looking up API key for user: {user_id}")
-    info = get_api_key_info(user_id)
+    info = await get_api_key_info(user_id)
 
     if info:
         logger.info(f"✅ Found API key created at: {info['created_at']}")
@@ -253,7 +246,7 @@ async def api_get_webhook(user_id: str, user=Depends(get_supabase_user)):
     """Gets the Home Assistant webhook settings for a user."""
     if user["id"] != user_id and user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Not allowed")
-    webhook = get_ha_webhook_settings(user_id)
+    webhook = await get_ha_webhook_settings(user_id)
     if webhook is None:
         raise HTTPException(status_code=404, detail="Webhook not found")
     return webhook
@@ -271,7 +264,7 @@ async def api_patch_webhook(
     webhook_id = body.get("webhook_id")
     if url is None or webhook_id is None:
         raise HTTPException(status_code=400, detail="Missing webhook_url or webhook_id")
-    updated = set_ha_webhook_settings(user_id, url, webhook_id)
+    updated = await set_ha_webhook_settings(user_id, url, webhook_id)
     return updated
 
 @router.get("/user/{user_id}/subscription")
@@ -303,7 +296,7 @@ async def api_get_user_invoices(
 @router.get("/stats/global")
 async def get_global_stats():
     """Retrieves global, system-wide statistics."""
-    row = get_global_stats_row()
+    row = await charging_stats_cache.get_global()
     if not row:
         raise HTTPException(status_code=404, detail="No global stats found")
     return row
@@ -312,7 +305,7 @@ async def get_global_stats():
 async def get_user_stats(user=Depends(get_supabase_user)):
     """Retrieves statistics for the current authenticated user."""
     user_id = user["id"]
-    row = get_user_stats_row(user_id)
+    row = await charging_stats_cache.get_user(user_id)
     if not row:
         raise HTTPException(status_code=404, detail="No stats found for this user")
     return row
@@ -8,7 +8,8 @@ from pydantic import BaseModel, EmailStr
 
 from app.enode.link import get_link_result
 from app.storage.interest import assign_interest_user, get_interest_by_access_code, save_interest
-from app.storage.status_logs import calculate_uptime, get_daily_status, get_status_panel_data
+from app.storage.status_logs import calculate_uptime
+from app.services.status_panel import status_panel_cache
 from app.services.brevo import add_or_update_brevo_contact, remove_brevo_contact_from_list
 from app.storage.newsletter import create_newsletter_request, remove_public_subscriber, verify_newsletter_request
 from app.services.email_utils import send_newsletter_verification_email
@@ -49,7 +50,7 @@ async def ping():
 async def submit_interest(data: InterestSubmission, request: Request):
     """Submits a user's interest in the service before launch."""
     try:
-        save_interest(data.name, data.email)
+        await save_interest(data.name, data.email)
         return {"message": "Thanks! We'll notify you when we launch."}
     except Exception as e:
         logger.error(f"❌ Interest submission error: {e}", exc_info=True)
@@ -97,7 +98,7 @@ async def webhook_status_panel(
     to_date: datetime = Query(...)
 ):
     """Provides data for the public webhook status panel."""
-    return await get_status_panel_data(category, from_date, to_date)
+    return await status_panel_cache.get_panel(category, from_date, to_date)
 
 
 @router.get("/public/status/webhook/uptime")
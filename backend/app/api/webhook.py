@@ -6,15 +6,13 @@ from fastapi import APIRouter, Request, Header, HTTPException
 import logging
 
 from fastapi.responses import JSONResponse
-import httpx
 
 from app.api.payments import process_successful_payment_intent
 from app.config import ENODE_WEBHOOK_SECRET, STRIPE_WEBHOOK_SECRET
-from app.lib.webhook_logic import process_event
-from app.storage.user import add_user_sms_credits, add_purchased_api_tokens, get_ha_webhook_settings, get_user_by_id, get_user_id_by_stripe_customer_id, remove_stripe_customer_id, update_user_subscription, update_user
-from app.storage.subscription import get_price_id_map, update_subscription_status, upsert_subscription_from_stripe, get_user_record
+from app.storage.user import add_user_sms_credits, add_purchased_api_tokens, get_user_by_id, get_user_id_by_stripe_customer_id, remove_stripe_customer_id, update_user_subscription, update_user
+from app.storage.subscription import get_price_id_map, update_subscription_status, upsert_subscription_from_stripe
 from app.enode.verify import verify_signature
-from app.storage.webhook import save_webhook_event
+from app.services.webhook_ingest import webhook_ingestor
 from app.services.stripe_utils import log_stripe_webhook
 from app.storage.invoice import find_subscription_id, upsert_invoice_from_stripe
 
@@ -23,75 +21,37 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-async def push_to_homeassistant(event: dict, user_id: str | None):
-    """Pushes a single event to Home Assistant via webhook settings in the DB."""
-    if not user_id:
-        # No logs, just silent return if user is missing (e.g., system hook)
-        return
-
-    # Retrieve the user's tier
-    user_record = await get_user_record(user_id)
-    if not user_record or user_record.get("tier") != "pro":
-        logger.info("Webhook push skipped for user %s: Not a Pro tier user.", user_id)
-        return
-
-    settings = get_ha_webhook_settings(user_id)
-    if not settings or not settings.get("ha_webhook_id") or not settings.get("ha_external_url"):
-        logger.error("HA Webhook ID/URL missing in database for user_id=%s", user_id)
-        return
-
-    url = f"{settings['ha_external_url'].rstrip('/')}/api/webhook/{settings['ha_webhook_id']}"
-    logger.debug("Pushing to HA webhook %s → %s", url, event)
-    try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(url, json=event, timeout=10.0)
-            resp.raise_for_status()
-            logger.info("Successfully pushed event to HA: HTTP %s", resp.status_code)
-    except Exception as e:
-        logger.error("Failed to push to HA webhook: %s", e)
-
-
 @router.post("/webhook/enode")
 async def handle_webhook(
     request: Request,
     x_enode_signature: str = Header(None),
 ):
-    """Handles incoming webhooks from Enode, verifies signature, and processes events."""
+    """
+    Handles incoming webhooks from Enode: verifies the signature and queues the
+    payload for `webhook_ingestor`, which stores and processes it in the background.
+    """
+    raw_body = await request.body()
+
+    # Verify the signature first
+    if not verify_signature(raw_body, x_enode_signature):
+        logger.error("❌ Invalid signature – possible spoofed webhook")
+        raise HTTPException(status_code=401, detail="Invalid signature")
+
+    # Convert to JSON after verification
     try:
-        raw_body = await request.body()
-
-        # Verify the signature first
-        if not verify_signature(raw_body, x_enode_signature):
-            logger.error("❌ Invalid signature – possible spoofed webhook")
-            raise HTTPException(status_code=401, detail="Invalid signature")
-
-        # Convert to JSON after verification
-        incoming  = json.loads(raw_body)
-        logger.info("[📥 Verified webhook payload] %s", incoming)
+        incoming = json.loads(raw_body)
+    except ValueError as e:
+        logger.error("❌ Invalid webhook JSON: %s", e)
+        raise HTTPException(status_code=400, detail="Invalid JSON payload")
 
-        # Save and process
-        save_webhook_event(incoming)
+    event_count = len(incoming) if isinstance(incoming, list) else 1
+    logger.info("[📥 Verified webhook payload] %d event(s)", event_count)
 
-        handled = 0
+    if not webhook_ingestor.submit(incoming):
+        # Enode retries on non-2xx responses
+        raise HTTPException(status_code=503, detail="Webhook queue is full, retry later")
 
-        if isinstance(incoming, list):
-            for idx, event in enumerate(incoming):
-                logger.info("[📥 #%d/%d] Processing webhook event: %s", idx+1, len(incoming), event.get("event"))
-                handled += await process_event(event)
-                user_id = event.get('user', {}).get('id')
-                await push_to_homeassistant(event, user_id)
-        else:
-            logger.info("[📥 Single] Processing webhook event: %s", incoming.get("event"))
-            handled += await process_event(incoming)
-            user_id = incoming.get('user', {}).get('id')
-            await push_to_homeassistant(incoming, user_id)
-
-        logger.info("Handled total %d events", handled)
-        return {"status": "ok", "handled": handled}
-
-    except Exception as e:
-        logging.exception("❌ Failed to handle webhook")
-        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "ok", "queued": event_count}
 
 @router.post("/webhook/stripe", response_model=dict)
 async def stripe_webhook(
@@ -21,8 +21,54 @@ REDIRECT_URI = os.getenv("REDIRECT_URI")
 USE_MOCK = os.getenv("MOCK_LINK_RESULT", "false").lower() == "true"
 IS_PROD = os.getenv("ENV", "prod") == "prod"
 
+# Enode API client (app/enode/client.py)
+ENODE_TIMEOUT_SECONDS = float(os.getenv("ENODE_TIMEOUT_SECONDS", 10))
+ENODE_CONNECT_TIMEOUT_SECONDS = float(os.getenv("ENODE_CONNECT_TIMEOUT_SECONDS", 3))
+ENODE_MAX_CONNECTIONS = int(os.getenv("ENODE_MAX_CONNECTIONS", 20))
+ENODE_MAX_ATTEMPTS = int(os.getenv("ENODE_MAX_ATTEMPTS", 3))
+ENODE_RETRY_BACKOFF_SECONDS = float(os.getenv("ENODE_RETRY_BACKOFF_SECONDS", 0.5))
+# 429 responses asking us to wait longer than this are returned to the caller
+ENODE_MAX_RETRY_AFTER_SECONDS = float(os.getenv("ENODE_MAX_RETRY_AFTER_SECONDS", 30))
+
 CACHE_EXPIRATION_MINUTES = int(os.getenv("CACHE_EXPIRATION_MINUTES", 5))
 
+# Background Enode refresh of stale vehicle caches (services/vehicle_refresher.py)
+VEHICLE_REFRESH_CONCURRENCY = int(os.getenv("VEHICLE_REFRESH_CONCURRENCY", 4))
+# A user's vehicles are fetched from Enode at most this often
+VEHICLE_REFRESH_MIN_INTERVAL_SECONDS = float(os.getenv("VEHICLE_REFRESH_MIN_INTERVAL_SECONDS", 60))
+# Proactive sweep over users active in poll_logs; 0 disables it
+VEHICLE_REFRESH_SWEEP_SECONDS = float(os.getenv("VEHICLE_REFRESH_SWEEP_SECONDS", 300))
+VEHICLE_REFRESH_ACTIVE_WINDOW_MINUTES = int(os.getenv("VEHICLE_REFRESH_ACTIVE_WINDOW_MINUTES", 60))
+VEHICLE_REFRESH_SWEEP_LIMIT = int(os.getenv("VEHICLE_REFRESH_SWEEP_LIMIT", 50))
+
+# Enode fleet reconciliation (services/enode_reconcile.py); 0 disables the periodic run
+ENODE_RECONCILE_INTERVAL_SECONDS = float(os.getenv("ENODE_RECONCILE_INTERVAL_SECONDS", 900))
+ENODE_RECONCILE_PAGE_SIZE = int(os.getenv("ENODE_RECONCILE_PAGE_SIZE", 50))
+# Pages handled per run; a pass over the fleet continues from its cursor on the next run
+ENODE_RECONCILE_MAX_PAGES_PER_RUN = int(os.getenv("ENODE_RECONCILE_MAX_PAGES_PER_RUN", 20))
+ENODE_RECONCILE_PAGE_DELAY_SECONDS = float(os.getenv("ENODE_RECONCILE_PAGE_DELAY_SECONDS", 0.5))
+
+# Log retention and compaction (services/log_retention.py); 0 disables the periodic run
+LOG_RETENTION_INTERVAL_SECONDS = float(os.getenv("LOG_RETENTION_INTERVAL_SECONDS", 3600))
+# Rows deleted or payloads cleared per statement, and statements per source and run
+LOG_RETENTION_BATCH_SIZE = int(os.getenv("LOG_RETENTION_BATCH_SIZE", 5000))
+LOG_RETENTION_MAX_BATCHES_PER_RUN = int(os.getenv("LOG_RETENTION_MAX_BATCHES_PER_RUN", 50))
+LOG_RETENTION_BATCH_DELAY_SECONDS = float(os.getenv("LOG_RETENTION_BATCH_DELAY_SECONDS", 0.2))
+# Days rolled up per source and run (catching up on old history takes several runs)
+LOG_COMPACTION_MAX_DAYS_PER_RUN = int(os.getenv("LOG_COMPACTION_MAX_DAYS_PER_RUN", 7))
+# Days raw rows are kept once rolled up; 0 keeps them. poll_logs backs the
+# monthly allowance and the 30-day rate-limit windows, so it keeps at least 35.
+POLL_LOGS_RETENTION_DAYS = int(os.getenv("POLL_LOGS_RETENTION_DAYS", 90))
+if POLL_LOGS_RETENTION_DAYS:
+    POLL_LOGS_RETENTION_DAYS = max(POLL_LOGS_RETENTION_DAYS, 35)
+API_TELEMETRY_RETENTION_DAYS = int(os.getenv("API_TELEMETRY_RETENTION_DAYS", 30))
+WEBHOOK_LOGS_RETENTION_DAYS = int(os.getenv("WEBHOOK_LOGS_RETENTION_DAYS", 30))
+STRIPE_WEBHOOK_LOGS_RETENTION_DAYS = int(os.getenv("STRIPE_WEBHOOK_LOGS_RETENTION_DAYS", 365))
+STATUS_LOGS_RETENTION_DAYS = int(os.getenv("STATUS_LOGS_RETENTION_DAYS", 30))
+# Days request/response payloads are kept; 0 keeps them as long as the row
+API_TELEMETRY_PAYLOAD_RETENTION_DAYS = int(os.getenv("API_TELEMETRY_PAYLOAD_RETENTION_DAYS", 7))
+STRIPE_WEBHOOK_PAYLOAD_RETENTION_DAYS = int(os.getenv("STRIPE_WEBHOOK_PAYLOAD_RETENTION_DAYS", 90))
+
 RESEND_API_KEY = os.getenv("RESEND_API_KEY")
 FROM_EMAIL = os.getenv("FROM_EMAIL", "noreply@evlinkha.se")
 FROM_NAME = os.getenv("FROM_NAME", "EVLinkHA")
@@ -48,7 +94,115 @@ TWILIO_FROM_NUMBER = os.getenv("TWILIO_FROM_NUMBER")
 # Redis Configuration
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
+# Telemetry batching (api_telemetry rows are queued in-process and bulk-inserted)
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", 500))
+TELEMETRY_FLUSH_INTERVAL_SECONDS = float(os.getenv("TELEMETRY_FLUSH_INTERVAL_SECONDS", 1.0))
+TELEMETRY_QUEUE_MAXSIZE = int(os.getenv("TELEMETRY_QUEUE_MAXSIZE", 10000))
+# Payload capture: "prefix" (first N bytes), "hash" (sha256 + size) or "none" (size only)
+TELEMETRY_CAPTURE_MODE = os.getenv("TELEMETRY_CAPTURE_MODE", "prefix")
+TELEMETRY_CAPTURE_BYTES = int(os.getenv("TELEMETRY_CAPTURE_BYTES", 4096))
+# Comma-separated path prefixes that are logged without payloads
+TELEMETRY_CAPTURE_EXCLUDED_PATHS = [
+    p.strip() for p in os.getenv("TELEMETRY_CAPTURE_EXCLUDED_PATHS", "/api/admin/").split(",") if p.strip()
+]
+
+# Connection pool for the shared Supabase (PostgREST) admin clients
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "true").lower() == "true"
+SUPABASE_POOL_MAX_CONNECTIONS = int(os.getenv("SUPABASE_POOL_MAX_CONNECTIONS", 20))
+SUPABASE_POOL_MAX_KEEPALIVE = int(os.getenv("SUPABASE_POOL_MAX_KEEPALIVE", 20))
+SUPABASE_POOL_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("SUPABASE_POOL_KEEPALIVE_EXPIRY_SECONDS", 30))
+
+# Enode webhook ingestion: queued payloads, events per processing batch, parallel HA pushes
+WEBHOOK_INGEST_QUEUE_MAXSIZE = int(os.getenv("WEBHOOK_INGEST_QUEUE_MAXSIZE", 1000))
+WEBHOOK_INGEST_MAX_BATCH_EVENTS = int(os.getenv("WEBHOOK_INGEST_MAX_BATCH_EVENTS", 500))
+HA_PUSH_CONCURRENCY = int(os.getenv("HA_PUSH_CONCURRENCY", 20))
+
+# Charging history: vehicle webhooks are projected into charging_samples rows
+CHARGING_SAMPLE_BATCH_SIZE = int(os.getenv("CHARGING_SAMPLE_BATCH_SIZE", 500))
+CHARGING_SAMPLE_FLUSH_INTERVAL_SECONDS = float(os.getenv("CHARGING_SAMPLE_FLUSH_INTERVAL_SECONDS", 5))
+# Buffered samples; new samples are dropped beyond this while the database is unavailable
+CHARGING_SAMPLE_MAX_PENDING = int(os.getenv("CHARGING_SAMPLE_MAX_PENDING", 20000))
+# A vehicle whose sample fields did not change gets a new sample at most this often
+CHARGING_SAMPLE_KEEPALIVE_SECONDS = float(os.getenv("CHARGING_SAMPLE_KEEPALIVE_SECONDS", 900))
+
+# Charging sessions built from the samples: a session ends on unplug or after
+# this long without a charging sample; open sessions are checkpointed this often
+CHARGING_SESSION_IDLE_TIMEOUT_MINUTES = int(os.getenv("CHARGING_SESSION_IDLE_TIMEOUT_MINUTES", 60))
+CHARGING_SESSION_CHECKPOINT_SECONDS = float(os.getenv("CHARGING_SESSION_CHECKPOINT_SECONDS", 30))
+
+# /api/stats responses are served from memory and reloaded in the background
+# once older than the TTL; entries are dropped after the max staleness
+CHARGING_STATS_CACHE_TTL_SECONDS = float(os.getenv("CHARGING_STATS_CACHE_TTL_SECONDS", 30))
+CHARGING_STATS_CACHE_MAX_STALE_SECONDS = float(os.getenv("CHARGING_STATS_CACHE_MAX_STALE_SECONDS", 3600))
+
+# Public status panel: per-day check counts of finished days are cached until
+# evicted, the current day's for this long
+STATUS_PANEL_RECENT_TTL_SECONDS = float(os.getenv("STATUS_PANEL_RECENT_TTL_SECONDS", 60))
+STATUS_PANEL_CACHE_MAXSIZE = int(os.getenv("STATUS_PANEL_CACHE_MAXSIZE", 5000))
+
+# Home Assistant push dispatcher
+HA_PUSH_PER_HOST_CONCURRENCY = int(os.getenv("HA_PUSH_PER_HOST_CONCURRENCY", 2))
+HA_PUSH_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HA_PUSH_CONNECT_TIMEOUT_SECONDS", 2))
+HA_PUSH_TIMEOUT_SECONDS = float(os.getenv("HA_PUSH_TIMEOUT_SECONDS", 5))
+HA_PUSH_MAX_ATTEMPTS = int(os.getenv("HA_PUSH_MAX_ATTEMPTS", 3))
+HA_PUSH_RETRY_BACKOFF_SECONDS = float(os.getenv("HA_PUSH_RETRY_BACKOFF_SECONDS", 2))
+# Pushes in flight or waiting for a retry, per user and in total; new pushes
+# are dropped beyond these. The total is only a backstop.
+HA_PUSH_MAX_PENDING_PER_USER = int(os.getenv("HA_PUSH_MAX_PENDING_PER_USER", 20))
+HA_PUSH_MAX_PENDING = int(os.getenv("HA_PUSH_MAX_PENDING", 2000))
+HA_PUSH_TARGET_CACHE_TTL_SECONDS = float(os.getenv("HA_PUSH_TARGET_CACHE_TTL_SECONDS", 300))
+
+# Vehicle cache writes are skipped while the content hash is unchanged, but
+# updated_at is still refreshed this often so the cache stays "fresh" for readers
+VEHICLE_CACHE_REFRESH_SECONDS = int(os.getenv("VEHICLE_CACHE_REFRESH_SECONDS", 120))
+# Last written hash/fields per vehicle, used for change detection and diffs
+VEHICLE_STATE_CACHE_MAXSIZE = int(os.getenv("VEHICLE_STATE_CACHE_MAXSIZE", 20000))
+# Pre-encoded /status responses kept per vehicle and endpoint
+STATUS_SNAPSHOT_MAXSIZE = int(os.getenv("STATUS_SNAPSHOT_MAXSIZE", 20000))
+# Vehicle IDs accepted by one /api/ha/status?ids= request
+HA_STATUS_BATCH_MAX_IDS = int(os.getenv("HA_STATUS_BATCH_MAX_IDS", 10))
+
+# Home Assistant event stream (/api/ha/stream)
+HA_STREAM_HEARTBEAT_SECONDS = float(os.getenv("HA_STREAM_HEARTBEAT_SECONDS", 15))
+# Recent events kept for clients resuming with Last-Event-ID
+HA_STREAM_BUFFER_SIZE = int(os.getenv("HA_STREAM_BUFFER_SIZE", 5000))
+# Events queued per stream; slower clients are disconnected and resume from the buffer
+HA_STREAM_QUEUE_SIZE = int(os.getenv("HA_STREAM_QUEUE_SIZE", 100))
+HA_STREAM_MAX_PER_USER = int(os.getenv("HA_STREAM_MAX_PER_USER", 5))
+
+# Poll counters for API-key rate limiting: "memory" (single node) or "redis"
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+# How often counters are re-seeded from poll_logs
+RATE_LIMIT_RECONCILE_SECONDS = float(os.getenv("RATE_LIMIT_RECONCILE_SECONDS", 300))
+
+# In-memory settings snapshot; other workers pick up admin changes within this TTL
+SETTINGS_CACHE_TTL_SECONDS = float(os.getenv("SETTINGS_CACHE_TTL_SECONDS", 30))
+
+# API-key -> user lookup cache
+API_KEY_CACHE_TTL_SECONDS = float(os.getenv("API_KEY_CACHE_TTL_SECONDS", 60))
+API_KEY_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("API_KEY_CACHE_NEGATIVE_TTL_SECONDS", 10))
+API_KEY_CACHE_MAXSIZE = int(os.getenv("API_KEY_CACHE_MAXSIZE", 10000))
+
+# Adds an X-Storage-Calls debug header to HA API responses (on by default outside prod)
+EXPOSE_STORAGE_CALLS_HEADER = os.getenv(
+    "EXPOSE_STORAGE_CALLS_HEADER", "false" if IS_PROD else "true"
+).lower() == "true"
+
+# Token cost per request, by path prefix. /api/ha/status (the batch status
+# endpoint) costs this per vehicle it bills.
 ENDPOINT_COST = {
     "/api/ha/status/": 1,
+    "/api/ha/status": 1,
     "/api/ha/charging/":1,
 }
+
+# Cost of a 304 Not Modified answer to a conditional poll; prefixes missing
+# here cost the same as in ENDPOINT_COST.
+ENDPOINT_COST_NOT_MODIFIED = {
+    "/api/ha/status/": 0,
+    "/api/ha/status": 0,
+    "/api/status/": 0,
+}
+# Whether 304 answers count against the monthly poll allowance. They are
+# always written to poll_logs, flagged with not_modified.
+NOT_MODIFIED_POLLS_COUNT = os.getenv("NOT_MODIFIED_POLLS_COUNT", "false").lower() == "true"
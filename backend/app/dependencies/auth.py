@@ -4,8 +4,7 @@ from fastapi import Depends, HTTPException, Security
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer, APIKeyHeader
 from app.storage.api_key import get_user_by_api_key
 from app.models.user import User
-from app.lib.supabase import get_supabase_admin_client
-from supabase import SupabaseAuthClient
+from app.lib.supabase import get_supabase_admin_async_client
 from app.config import INTERNAL_API_KEY
 
 # 1) Setup for Bearer token (auto_error=False so we can raise our own exceptions)
@@ -13,9 +12,6 @@ bearer_scheme = HTTPBearer(auto_error=False)
 
 internal_api_key_header = APIKeyHeader(name="X-Internal-API-Key", auto_error=False)
 
-# 2) Get the Supabase admin client
-supabase_admin: SupabaseAuthClient = get_supabase_admin_client()
-
 async def get_internal_api_key(api_key: str = Security(internal_api_key_header)) -> str:
     if not INTERNAL_API_KEY or not api_key or not secrets.compare_digest(api_key, INTERNAL_API_KEY):
         raise HTTPException(status_code=401, detail="Invalid internal API key")
@@ -30,15 +26,17 @@ async def get_current_user(
 
     token = creds.credentials
 
-    # 3a) Attempt to validate as JWT via Supabase
-    try:
-        user_resp = supabase_admin.auth.get_user(token)
-        if user_resp and user_resp.user:
-            # Map to your app.models.user.User if necessary
-            return user_resp.user  # or: return User(**user_resp.user.dict())
-    except Exception:
-        # JWT invalid or expired
-        pass
+    # 3a) Attempt to validate as JWT via Supabase (API keys are hex strings, never JWTs)
+    if token.count(".") == 2:
+        try:
+            supabase_admin = await get_supabase_admin_async_client()
+            user_resp = await supabase_admin.auth.get_user(token)
+            if user_resp and user_resp.user:
+                # Map to your app.models.user.User if necessary
+                return user_resp.user  # or: return User(**user_resp.user.dict())
+        except Exception:
+            # JWT invalid or expired
+            pass
 
     # 3b) Attempt to validate as Home Assistant API-key
     user = await get_user_by_api_key(token)
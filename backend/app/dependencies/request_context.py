@@ -0,0 +1,73 @@
+# app/dependencies/request_context.py
+"""
+Request-scoped memo shared by the dependencies in `app.api.dependencies`
+and the handlers in `app.api.ha`.
+
+Rate-limit checks, tier checks and handlers often need the same user record
+and vehicle row. `RequestContext` loads each of them at most once per request
+and counts the storage calls that were actually made.
+"""
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import Request, Response
+
+from app.config import EXPOSE_STORAGE_CALLS_HEADER
+from app.models.user import User
+from app.storage.user import get_user_rate_limit_data
+from app.storage.vehicle import get_vehicle_head_by_id
+
+STORAGE_CALLS_HEADER = "X-Storage-Calls"
+
+
+class RequestContext:
+    """Per-request cache of the resolved user, rate-limit record and vehicle rows."""
+
+    def __init__(self, response: Optional[Response] = None):
+        # When set, every storage call updates the debug header on this response.
+        self._response = response
+        self.storage_calls = 0
+        self.user: Optional[User] = None
+        self._rate_limit_data: dict[str, Optional[dict]] = {}
+        self._vehicles: dict[str, Optional[dict]] = {}
+        # Set by handlers that answered a conditional request with 304
+        self.not_modified = False
+
+    async def call(self, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Awaits a storage function and counts it against this request."""
+        self.storage_calls += 1
+        if self._response is not None:
+            self._response.headers[STORAGE_CALLS_HEADER] = str(self.storage_calls)
+        return await fn(*args, **kwargs)
+
+    def apply_headers(self, response: Response) -> Response:
+        """
+        Copies the headers set on the injected response (the debug header)
+        onto a response the handler built itself, which FastAPI would
+        otherwise send without them. Returns `response`.
+        """
+        if self._response is not None:
+            for name, value in self._response.headers.items():
+                if name not in ("content-length", "content-type") and name not in response.headers:
+                    response.headers[name] = value
+        return response
+
+    async def get_rate_limit_data(self, user_id: str) -> Optional[dict]:
+        """Memoized `get_user_rate_limit_data`."""
+        if user_id not in self._rate_limit_data:
+            self._rate_limit_data[user_id] = await self.call(get_user_rate_limit_data, user_id)
+        return self._rate_limit_data[user_id]
+
+    async def get_vehicle(self, vehicle_id: str) -> Optional[dict]:
+        """Memoized `get_vehicle_head_by_id` (ownership is checked by the caller)."""
+        if vehicle_id not in self._vehicles:
+            self._vehicles[vehicle_id] = await self.call(get_vehicle_head_by_id, vehicle_id)
+        return self._vehicles[vehicle_id]
+
+
+def get_request_context(request: Request, response: Response) -> RequestContext:
+    """FastAPI dependency returning the context for the current request."""
+    ctx = getattr(request.state, "ctx", None)
+    if ctx is None:
+        ctx = RequestContext(response if EXPOSE_STORAGE_CALLS_HEADER else None)
+        request.state.ctx = ctx
+    return ctx
@@ -0,0 +1,300 @@
+"""
+backend/app/enode/client.py
+
+Shared HTTP client for the Enode API.
+
+All calls in `app.enode` go through one `EnodeClient`: a pooled keep-alive
+connection, one access token per process (concurrent callers wait for a
+single refresh instead of each fetching their own), short timeouts and
+retries with jittered exponential backoff. 429 responses are retried after
+their Retry-After delay; 5xx responses and timeouts only for idempotent
+methods, so a charging command is never sent twice. Retries draw from a
+budget that refills with successful traffic, which keeps an Enode outage from
+multiplying our request rate. Latency is tracked per endpoint.
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Optional
+
+import httpx
+
+from app.config import (
+    CLIENT_ID,
+    CLIENT_SECRET,
+    ENODE_AUTH_URL,
+    ENODE_BASE_URL,
+    ENODE_CONNECT_TIMEOUT_SECONDS,
+    ENODE_MAX_ATTEMPTS,
+    ENODE_MAX_CONNECTIONS,
+    ENODE_MAX_RETRY_AFTER_SECONDS,
+    ENODE_RETRY_BACKOFF_SECONDS,
+    ENODE_TIMEOUT_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"})
+
+# Retry budget: every first attempt adds RETRY_BUDGET_RATIO tokens, every
+# retry takes one, and the balance never exceeds RETRY_BUDGET_MAX.
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_MAX = 10.0
+
+# Latencies kept per endpoint for the percentiles in stats()
+LATENCY_SAMPLES = 500
+
+
+def _retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    """Parses a Retry-After header given in seconds or as an HTTP date."""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class _EndpointStats:
+    __slots__ = ("requests", "errors", "retries", "latencies_ms")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.latencies_ms: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+
+    def as_dict(self) -> dict:
+        latencies = sorted(self.latencies_ms)
+
+        def pct(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))], 1)
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "p50_ms": pct(50),
+            "p95_ms": pct(95),
+            "max_ms": round(latencies[-1], 1) if latencies else None,
+        }
+
+
+class EnodeClient:
+    """Pooled, authenticated Enode API client with retries and per-endpoint metrics."""
+
+    def __init__(
+        self,
+        base_url: Optional[str],
+        auth_url: Optional[str],
+        client_id: Optional[str],
+        client_secret: Optional[str],
+        timeout: float,
+        connect_timeout: float,
+        max_connections: int,
+        max_attempts: int,
+        retry_backoff: float,
+        max_retry_after: float,
+    ):
+        self.base_url = (base_url or "").rstrip("/")
+        self.auth_url = auth_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.max_attempts = max(1, max_attempts)
+        self.retry_backoff = retry_backoff
+        self.max_retry_after = max_retry_after
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_lock = asyncio.Lock()
+        self._retry_tokens = RETRY_BUDGET_MAX
+        self._endpoints: dict[str, _EndpointStats] = {}
+
+        self.token_refreshes = 0
+        self.retry_budget_exhausted = 0
+
+    def _http(self) -> httpx.AsyncClient:
+        # Created on first use, so scripts and cron jobs need no setup
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        """Closes the pooled connections. Called from the application lifespan."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_access_token(self) -> str:
+        """Returns a valid access token; concurrent callers share one refresh."""
+        if self._token and self._token_expires_at > time.time():
+            return self._token
+        async with self._token_lock:
+            # Another caller may have refreshed it while we waited
+            if self._token and self._token_expires_at > time.time():
+                return self._token
+            # Fetching a token has no side effects, so it is retried like a GET
+            response = await self._send(
+                "POST",
+                self.auth_url,
+                "POST /oauth2/token",
+                idempotent=True,
+                data={"grant_type": "client_credentials"},
+                auth=(self.client_id, self.client_secret),
+            )
+            response.raise_for_status()
+            token_data = response.json()
+            self._token = token_data["access_token"]
+            self._token_expires_at = time.time() + token_data.get("expires_in", 3600) - 60
+            self.token_refreshes += 1
+            return self._token
+
+    def invalidate_token(self, token: str) -> None:
+        """Drops the cached token if it is still `token` (e.g. after a 401)."""
+        if self._token == token:
+            self._token = None
+            self._token_expires_at = 0.0
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        endpoint: Optional[str] = None,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        """
+        Sends an authenticated request to `ENODE_BASE_URL + path` and returns
+        the final response (callers decide how to treat error statuses).
+        `endpoint` labels the metrics, e.g. "GET /vehicles/{id}"; it defaults
+        to the method and path. Raises httpx.TransportError when all attempts
+        failed without a response.
+        """
+        endpoint = endpoint or f"{method} {path}"
+        extra_headers = kwargs.pop("headers", {})
+        for auth_attempt in range(2):
+            token = await self.get_access_token()
+            response = await self._send(
+                method,
+                f"{self.base_url}{path}",
+                endpoint,
+                idempotent=method in IDEMPOTENT_METHODS,
+                headers={**extra_headers, "Authorization": f"Bearer {token}"},
+                **kwargs,
+            )
+            if response.status_code != 401 or auth_attempt:
+                break
+            # The token was revoked or expired early: fetch a new one once
+            logger.warning("[🔑 enode] 401 from %s, refreshing access token", endpoint)
+            self.invalidate_token(token)
+        return response
+
+    async def get(self, path: str, endpoint: Optional[str] = None, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", path, endpoint, **kwargs)
+
+    async def post(self, path: str, endpoint: Optional[str] = None, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", path, endpoint, **kwargs)
+
+    async def delete(self, path: str, endpoint: Optional[str] = None, **kwargs: Any) -> httpx.Response:
+        return await self.request("DELETE", path, endpoint, **kwargs)
+
+    def stats(self) -> dict:
+        """Returns per-endpoint request counts and latency percentiles."""
+        return {
+            "token_valid": bool(self._token and self._token_expires_at > time.time()),
+            "token_refreshes": self.token_refreshes,
+            "retry_budget": round(self._retry_tokens, 2),
+            "retry_budget_exhausted": self.retry_budget_exhausted,
+            "endpoints": {name: s.as_dict() for name, s in sorted(self._endpoints.items())},
+        }
+
+    def _take_retry_token(self) -> bool:
+        if self._retry_tokens < 1:
+            self.retry_budget_exhausted += 1
+            return False
+        self._retry_tokens -= 1
+        return True
+
+    def _retry_delay(self, idempotent: bool, attempt: int, response: Optional[httpx.Response]) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None if the request must not be retried."""
+        backoff = self.retry_backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+        if response is None:
+            return backoff
+        if response.status_code == 429:
+            retry_after = _retry_after_seconds(response)
+            if retry_after is None:
+                return backoff
+            # Waiting longer than that would hold up the caller too long
+            return retry_after if retry_after <= self.max_retry_after else None
+        if response.status_code >= 500 and idempotent:
+            return backoff
+        return None
+
+    async def _send(self, method: str, url: str, endpoint: str, idempotent: bool, **kwargs: Any) -> httpx.Response:
+        stats = self._endpoints.setdefault(endpoint, _EndpointStats())
+        self._retry_tokens = min(self._retry_tokens + RETRY_BUDGET_RATIO, RETRY_BUDGET_MAX)
+
+        for attempt in range(1, self.max_attempts + 1):
+            stats.requests += 1
+            response: Optional[httpx.Response] = None
+            start = time.perf_counter()
+            try:
+                response = await self._http().request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                stats.errors += 1
+                # Only connection failures are known not to have reached Enode
+                retryable = idempotent or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if not retryable or attempt == self.max_attempts or not self._take_retry_token():
+                    raise
+                delay = self._retry_delay(idempotent, attempt, None)
+                logger.warning("[⚠️ enode] %s failed (%s), retrying in %.1fs", endpoint, type(e).__name__, delay)
+            finally:
+                stats.latencies_ms.append((time.perf_counter() - start) * 1000)
+
+            if response is not None:
+                if response.status_code < 500 and response.status_code != 429:
+                    return response
+                stats.errors += 1
+                delay = self._retry_delay(idempotent, attempt, response)
+                if delay is None or attempt == self.max_attempts or not self._take_retry_token():
+                    return response
+                logger.warning("[⚠️ enode] %s returned %d, retrying in %.1fs", endpoint, response.status_code, delay)
+
+            stats.retries += 1
+            await asyncio.sleep(delay)
+
+        raise AssertionError("unreachable")
+
+
+enode_client = EnodeClient(
+    base_url=ENODE_BASE_URL,
+    auth_url=ENODE_AUTH_URL,
+    client_id=CLIENT_ID,
+    client_secret=CLIENT_SECRET,
+    timeout=ENODE_TIMEOUT_SECONDS,
+    connect_timeout=ENODE_CONNECT_TIMEOUT_SECONDS,
+    max_connections=ENODE_MAX_CONNECTIONS,
+    max_attempts=ENODE_MAX_ATTEMPTS,
+    retry_backoff=ENODE_RETRY_BACKOFF_SECONDS,
+    max_retry_after=ENODE_MAX_RETRY_AFTER_SECONDS,
+)
@@ -1,7 +1,6 @@
-import httpx
 import logging
-from app.config import ENODE_BASE_URL, REDIRECT_URI, USE_MOCK
-from app.enode.auth import get_access_token
+from app.config import REDIRECT_URI, USE_MOCK
+from app.enode.client import enode_client
 
 logger = logging.getLogger(__name__)
 
@@ -14,25 +13,13 @@ async def get_link_result(link_token: str) -> dict:
             "vendor": "XPENG"
         }
 
-    token = await get_access_token()
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
     payload = {"linkToken": link_token}
-    url = f"{ENODE_BASE_URL}/links/token"
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        return response.json()
+    response = await enode_client.post("/links/token", json=payload)
+    response.raise_for_status()
+    return response.json()
 
 async def create_link_session(user_id: str, vendor: str = ""):
     """Creates a new Enode linking session for a given user and optional vendor."""
-    token = await get_access_token()
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
     payload = {
         "vendorType": "vehicle",
         "language": "en-US",
@@ -47,8 +34,6 @@ async def create_link_session(user_id: str, vendor: str = ""):
     if vendor:
         payload["vendor"] = vendor
 
-    url = f"{ENODE_BASE_URL}/users/{user_id}/link"
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        return response.json()
+    response = await enode_client.post(f"/users/{user_id}/link", "POST /users/{id}/link", json=payload)
+    response.raise_for_status()
+    return response.json()
@@ -1,6 +1,23 @@
 import hashlib
 import secrets
 
+from app.config import API_KEY_CACHE_MAXSIZE, API_KEY_CACHE_NEGATIVE_TTL_SECONDS, API_KEY_CACHE_TTL_SECONDS
+from app.lib.ttl_cache import TTLCache
+
+# Resolved API keys, keyed by key hash. Unknown or inactive keys are cached as None.
+api_key_user_cache = TTLCache(
+    maxsize=API_KEY_CACHE_MAXSIZE,
+    ttl=API_KEY_CACHE_TTL_SECONDS,
+    negative_ttl=API_KEY_CACHE_NEGATIVE_TTL_SECONDS,
+)
+# user_id -> key hashes resolved to that user, so a user's entries can be
+# dropped without scanning the cache. Users whose hashes have all left the
+# cache are pruned once the index grows past twice the cache size.
+_key_hashes_by_user: dict[str, set[str]] = {}
+# Bumped by every invalidate_api_key_user(); a lookup that started before an
+# invalidation may have read the old key state and is not cached.
+_invalidation_generation = 0
+
 def generate_api_key(length: int = 32) -> str:
     """
     Generates a secure random API key as a hex string.
@@ -12,3 +29,42 @@ def hash_api_key(api_key: str) -> str:
     Hashes the API key using SHA-256 for secure storage.
     """
     return hashlib.sha256(api_key.encode()).hexdigest()
+
+def api_key_invalidation_generation() -> int:
+    """Current invalidation generation; take it before loading a key hash."""
+    return _invalidation_generation
+
+def remember_api_key_user(key_hash: str, user, generation: int) -> None:
+    """
+    Records which user a key hash resolved to; see `invalidate_api_key_user`.
+    Must be called from the cache loader: if a user was invalidated since
+    `generation` was taken, the in-flight load is dropped so its result is
+    returned but not cached.
+    """
+    if generation != _invalidation_generation:
+        api_key_user_cache.invalidate(key_hash)
+        return
+    if user is None:
+        return
+    if len(_key_hashes_by_user) > 2 * api_key_user_cache.maxsize:
+        _prune_key_hash_index()
+    _key_hashes_by_user.setdefault(user.id, set()).add(key_hash)
+
+def invalidate_api_key_user(user_id: str) -> None:
+    """
+    Drops every cached API-key lookup that resolved to the given user.
+    Call this whenever a user's keys or user record change.
+    """
+    global _invalidation_generation
+    _invalidation_generation += 1
+    for key_hash in _key_hashes_by_user.pop(user_id, ()):
+        api_key_user_cache.invalidate(key_hash)
+
+def _prune_key_hash_index() -> None:
+    """Forgets hashes that are no longer cached, and users left without any."""
+    for user_id in list(_key_hashes_by_user):
+        hashes = {h for h in _key_hashes_by_user[user_id] if h in api_key_user_cache}
+        if hashes:
+            _key_hashes_by_user[user_id] = hashes
+        else:
+            del _key_hashes_by_user[user_id]
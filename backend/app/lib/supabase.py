@@ -1,26 +1,202 @@
 # 📄 app/lib/supabase.py
 
-from supabase import create_client, create_async_client
-from app.config import SUPABASE_URL, SUPABASE_ANON_KEY, SUPABASE_SERVICE_ROLE_KEY
+import logging
+from typing import Optional
+
+import httpx
+from supabase import AsyncClient, Client, create_client
+from app.config import (
+    SUPABASE_URL,
+    SUPABASE_ANON_KEY,
+    SUPABASE_SERVICE_ROLE_KEY,
+    SUPABASE_HTTP2,
+    SUPABASE_POOL_KEEPALIVE_EXPIRY_SECONDS,
+    SUPABASE_POOL_MAX_CONNECTIONS,
+    SUPABASE_POOL_MAX_KEEPALIVE,
+)
+
+logger = logging.getLogger(__name__)
 
 if not SUPABASE_URL or not SUPABASE_ANON_KEY:
     raise RuntimeError("Missing Supabase URL or anon key.")
 
+# Process-wide admin clients. Both talk to PostgREST through a pooled HTTP
+# client with keep-alive, so connections and TLS sessions are reused.
+_admin_client: Optional[Client] = None
+_admin_async_client: Optional[AsyncClient] = None
+
+_pool_counters = {
+    "sync": {"requests": 0, "responses": 0},
+    "async": {"requests": 0, "responses": 0},
+}
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=SUPABASE_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=SUPABASE_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=SUPABASE_POOL_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+def _pooled_session_kwargs(session: httpx.Client | httpx.AsyncClient) -> dict:
+    """Keeps the settings postgrest chose for its own session (base URL, auth headers, timeout)."""
+    return {
+        "base_url": session.base_url,
+        "headers": session.headers,
+        "timeout": session.timeout,
+        "follow_redirects": True,
+        "http2": SUPABASE_HTTP2,
+        "limits": _pool_limits(),
+    }
+
+
 def create_supabase_client_with_token(token: str):
     """Creates a Supabase client with a user's JWT, respecting Row Level Security (RLS)."""
     return create_client(SUPABASE_URL, token)
 
-async def get_supabase_admin_async_client():
+
+def _build_admin_async_client() -> AsyncClient:
+    if not SUPABASE_SERVICE_ROLE_KEY:
+        raise RuntimeError("Missing Supabase service role key.")
+    # The constructor is synchronous; create_async_client() only adds a session
+    # lookup that never applies to the service role key.
+    client = AsyncClient(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    counters = _pool_counters["async"]
+
+    async def on_request(request: httpx.Request) -> None:
+        counters["requests"] += 1
+
+    async def on_response(response: httpx.Response) -> None:
+        counters["responses"] += 1
+
+    # The default session has not opened any connection yet, so it can simply be dropped.
+    default_session = client.postgrest.session
+    client.postgrest.session = httpx.AsyncClient(
+        **_pooled_session_kwargs(default_session),
+        event_hooks={"request": [on_request], "response": [on_response]},
+    )
+    logger.info(
+        "[🔌 supabase] Async admin client created (http2=%s, max_connections=%d, max_keepalive=%d)",
+        SUPABASE_HTTP2,
+        SUPABASE_POOL_MAX_CONNECTIONS,
+        SUPABASE_POOL_MAX_KEEPALIVE,
+    )
+    return client
+
+
+def _admin_async() -> AsyncClient:
+    global _admin_async_client
+    if _admin_async_client is None:
+        _admin_async_client = _build_admin_async_client()
+    return _admin_async_client
+
+
+async def get_supabase_admin_async_client() -> AsyncClient:
     """
-    Creates an ASYNCHRONOUS Supabase client with the service role key, bypassing Row Level Security (RLS).
+    Returns the shared ASYNCHRONOUS Supabase client with the service role key, bypassing Row Level Security (RLS).
     This client should be used for async operations (e.g., RPC calls).
+    Created on first use (normally in the application lifespan) and reused afterwards.
     """
-    if not SUPABASE_SERVICE_ROLE_KEY:
-        raise RuntimeError("Missing Supabase service role key.")
-    return await create_async_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    return _admin_async()
+
+
+class AdminDB:
+    """
+    Data access entry point for the storage layer.
 
-def get_supabase_admin_client():
-    """Creates a Supabase client with the service role key, bypassing Row Level Security (RLS)."""
+    Builds queries on the shared async admin client, so every query is awaited
+    instead of blocking the event loop::
+
+        supabase = get_admin_db()
+        res = await supabase.table("vehicles").select("*").eq("id", vehicle_id).execute()
+    """
+
+    def table(self, table_name: str):
+        return _admin_async().table(table_name)
+
+    def rpc(self, fn: str, params: Optional[dict] = None, count=None, head: bool = False, get: bool = False):
+        return _admin_async().rpc(fn, params or {}, count, head, get)
+
+
+_admin_db = AdminDB()
+
+
+def get_admin_db() -> AdminDB:
+    """Returns the async data access object used by `app.storage` modules."""
+    return _admin_db
+
+
+def get_supabase_admin_client() -> Client:
+    """Returns the shared Supabase client with the service role key, bypassing Row Level Security (RLS)."""
+    global _admin_client
+    if _admin_client is not None:
+        return _admin_client
     if not SUPABASE_SERVICE_ROLE_KEY:
         raise RuntimeError("Missing Supabase service role key.")
-    return create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+
+    client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+    counters = _pool_counters["sync"]
+
+    def on_request(request: httpx.Request) -> None:
+        counters["requests"] += 1
+
+    def on_response(response: httpx.Response) -> None:
+        counters["responses"] += 1
+
+    default_session = client.postgrest.session
+    client.postgrest.session = httpx.Client(
+        **_pooled_session_kwargs(default_session),
+        event_hooks={"request": [on_request], "response": [on_response]},
+    )
+    default_session.close()
+    _admin_client = client
+    return _admin_client
+
+
+async def init_supabase_clients() -> None:
+    """Creates the shared admin clients. Called from the application lifespan."""
+    get_supabase_admin_client()
+    await get_supabase_admin_async_client()
+
+
+async def close_supabase_clients() -> None:
+    """
+    Closes the pooled connections of the shared async admin client.
+    The sync client is left open because storage modules hold on to it.
+    """
+    global _admin_async_client
+    if _admin_async_client is not None:
+        await _admin_async_client.postgrest.aclose()
+        _admin_async_client = None
+
+
+def _connection_stats(session) -> dict:
+    pool = getattr(getattr(session, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []) or [])
+    return {
+        "connections": len(connections),
+        "idle_connections": sum(1 for c in connections if c.is_idle()),
+        "http2_connections": sum(1 for c in connections if "HTTP/2" in c.info()),
+    }
+
+
+def get_supabase_pool_stats() -> dict:
+    """Returns connection pool and request counters for the shared admin clients."""
+    stats = {
+        "http2": SUPABASE_HTTP2,
+        "max_connections": SUPABASE_POOL_MAX_CONNECTIONS,
+        "max_keepalive_connections": SUPABASE_POOL_MAX_KEEPALIVE,
+        "keepalive_expiry_seconds": SUPABASE_POOL_KEEPALIVE_EXPIRY_SECONDS,
+    }
+    for name, client in (("sync", _admin_client), ("async", _admin_async_client)):
+        counters = _pool_counters[name]
+        entry = {
+            "initialized": client is not None,
+            "requests": counters["requests"],
+            "responses": counters["responses"],
+        }
+        if client is not None:
+            entry.update(_connection_stats(client.postgrest.session))
+        stats[name] = entry
+    return stats
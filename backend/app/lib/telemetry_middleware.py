@@ -0,0 +1,212 @@
+"""
+backend/app/lib/telemetry_middleware.py
+
+Pure ASGI telemetry middleware for requests to /api/ and /webhook.
+
+Request and response bodies are teed as they pass through: every chunk is
+forwarded immediately, and only a bounded prefix (or a running hash) plus the
+total size is kept for the api_telemetry row. Streaming responses are never
+buffered.
+"""
+import hashlib
+import json
+import time
+from typing import Callable, Iterable, Optional
+
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.dependencies.auth import get_current_user
+from app.services.rate_limiter import endpoint_cost
+from app.services.telemetry_writer import telemetry_writer
+
+CAPTURE_PREFIX = "prefix"
+CAPTURE_HASH = "hash"
+CAPTURE_NONE = "none"
+
+
+def no_payload_capture(endpoint: Callable) -> Callable:
+    """
+    Route decorator that opts an endpoint out of payload capture.
+    Status, sizes and timings are still recorded.
+    """
+    endpoint.__telemetry_capture__ = False
+    return endpoint
+
+
+class _BodyTee:
+    """Keeps a bounded view of a body stream: its size plus a prefix or a hash."""
+
+    def __init__(self, mode: str, limit: int):
+        self.mode = mode
+        self.limit = limit
+        self.size = 0
+        self.prefix = bytearray()
+        self._hash = hashlib.sha256() if mode == CAPTURE_HASH else None
+
+    def feed(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        self.size += len(chunk)
+        if self.mode == CAPTURE_PREFIX and len(self.prefix) < self.limit:
+            self.prefix += chunk[: self.limit - len(self.prefix)]
+        elif self._hash is not None:
+            self._hash.update(chunk)
+
+    @property
+    def complete(self) -> bool:
+        """True if the whole body fits in the captured prefix."""
+        return self.mode == CAPTURE_PREFIX and len(self.prefix) == self.size
+
+    def as_text(self) -> Optional[str]:
+        if self.size == 0:
+            return None
+        if self.mode == CAPTURE_PREFIX:
+            return bytes(self.prefix).decode("utf-8", errors="ignore")
+        if self.mode == CAPTURE_HASH:
+            return f"sha256:{self._hash.hexdigest()}"
+        return None
+
+    def as_payload(self) -> Optional[dict | str]:
+        """Parsed JSON when the full body was captured, otherwise the text view."""
+        if self.complete:
+            try:
+                return json.loads(self.prefix)
+            except ValueError:
+                return None
+        return self.as_text()
+
+
+class TelemetryMiddleware:
+    """
+    Logs API telemetry for requests to /api/ and /webhook.
+
+    Captures status code, duration, request/response sizes, the user and
+    vehicle ID, and the token cost for the endpoint. Payloads are captured
+    according to ``capture_mode``:
+
+    - ``prefix``: the first ``capture_bytes`` bytes of each body
+    - ``hash``: a SHA-256 digest of each body
+    - ``none``: no payloads, sizes only
+
+    Paths starting with one of ``excluded_paths``, and endpoints decorated with
+    :func:`no_payload_capture`, are logged without payloads.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        capture_mode: str = CAPTURE_PREFIX,
+        capture_bytes: int = 4096,
+        excluded_paths: Iterable[str] = (),
+    ):
+        self.app = app
+        self.capture_mode = capture_mode
+        self.capture_bytes = capture_bytes
+        self.excluded_paths = tuple(excluded_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        if not (path.startswith("/api/") or path.startswith("/webhook")):
+            await self.app(scope, receive, send)
+            return
+
+        # Payload capture is decided lazily: the routed endpoint is only known
+        # once the router has run, which is before any body is read or sent.
+        mode: Optional[str] = None
+
+        def capture_mode() -> str:
+            nonlocal mode
+            if mode is None:
+                endpoint = scope.get("endpoint")
+                if path.startswith(self.excluded_paths) or getattr(endpoint, "__telemetry_capture__", True) is False:
+                    mode = CAPTURE_NONE
+                else:
+                    mode = self.capture_mode
+            return mode
+
+        start_ts = time.time()
+        request_tee: Optional[_BodyTee] = None
+        response_tee: Optional[_BodyTee] = None
+        status = 500
+
+        async def receive_wrapper() -> Message:
+            nonlocal request_tee
+            message = await receive()
+            if message["type"] == "http.request":
+                if request_tee is None:
+                    request_tee = _BodyTee(capture_mode(), self.capture_bytes)
+                request_tee.feed(message.get("body", b""))
+            return message
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal response_tee, status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                if response_tee is None:
+                    response_tee = _BodyTee(capture_mode(), self.capture_bytes)
+                response_tee.feed(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            duration_ms = int((time.time() - start_ts) * 1000)
+            await self._record(scope, path, status, duration_ms, request_tee, response_tee)
+
+    async def _record(
+        self,
+        scope: Scope,
+        path: str,
+        status: int,
+        duration_ms: int,
+        request_tee: Optional[_BodyTee],
+        response_tee: Optional[_BodyTee],
+    ) -> None:
+        # Resolved after the response has been sent so it never delays it.
+        user_id = await self._resolve_user_id(scope)
+        vehicle_id = scope.get("path_params", {}).get("vehicle_id")
+
+        # Handlers that bill several polls per request (the batch status
+        # endpoint) put the number in request.state.billed_polls
+        billed_polls = scope.get("state", {}).get("billed_polls", 1)
+        cost_tokens = endpoint_cost(path, not_modified=status == 304) * billed_polls if user_id else 0
+
+        telemetry_writer.log(
+            endpoint         = path,
+            user_id          = user_id,
+            vehicle_id       = vehicle_id,
+            status           = status,
+            error_message    = None,
+            duration_ms      = duration_ms,
+            timestamp        = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            request_size     = request_tee.size if request_tee else 0,
+            response_size    = response_tee.size if response_tee and response_tee.size else None,
+            request_payload  = request_tee.as_payload() if request_tee else None,
+            response_payload = response_tee.as_text() if response_tee else None,
+            cost_tokens      = cost_tokens,
+        )
+
+    @staticmethod
+    async def _resolve_user_id(scope: Scope) -> Optional[str]:
+        auth_header = ""
+        for name, value in scope.get("headers", []):
+            if name == b"authorization":
+                auth_header = value.decode("latin-1")
+                break
+        if not auth_header.startswith("Bearer "):
+            return None
+        try:
+            user = await get_current_user(
+                creds=HTTPAuthorizationCredentials(scheme="Bearer", credentials=auth_header.split(" ", 1)[1])
+            )
+            return user.id
+        except HTTPException:
+            # Invalid JWT or API key
+            return None
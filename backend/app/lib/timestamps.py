@@ -0,0 +1,21 @@
+"""
+backend/app/lib/timestamps.py
+
+Parsing of timestamps read back from the database.
+"""
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+
+def parse_updated_at(value: Any) -> Optional[datetime]:
+    """Parses an `updated_at` value from PostgREST or from our own writes (naive UTC)."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        try:
+            dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
@@ -0,0 +1,49 @@
+"""
+backend/app/lib/vehicle_diff.py
+
+Change detection for Enode vehicle objects: a stable content digest and a
+field-level diff, both computed on a normalized copy of the vehicle.
+"""
+import hashlib
+import json
+from typing import Any
+
+# Observation timestamps and keys we add ourselves. They change on every
+# webhook even when the vehicle state does not, so they are left out of the
+# digest and the diff.
+IGNORED_KEYS = frozenset({"lastSeen", "lastUpdated", "userId", "db_id"})
+
+
+def flatten_vehicle(vehicle: dict) -> dict[str, Any]:
+    """
+    Flattens a vehicle into {"chargeState.batteryLevel": 80, ...}, skipping
+    IGNORED_KEYS at any depth. Lists are kept as leaf values.
+    """
+    flat: dict[str, Any] = {}
+
+    def walk(value: Any, path: str) -> None:
+        if isinstance(value, dict):
+            for key, child in value.items():
+                if key in IGNORED_KEYS:
+                    continue
+                walk(child, f"{path}.{key}" if path else key)
+        else:
+            flat[path] = value
+
+    walk(vehicle, "")
+    return flat
+
+
+def vehicle_digest(flat: dict[str, Any]) -> str:
+    """Returns a stable hex digest of a flattened vehicle."""
+    encoded = json.dumps(flat, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(encoded.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def diff_vehicle(old: dict[str, Any], new: dict[str, Any]) -> dict[str, tuple[Any, Any]]:
+    """Returns {path: (old, new)} for every field that was added, removed or changed."""
+    return {
+        path: (old.get(path), new.get(path))
+        for path in old.keys() | new.keys()
+        if old.get(path) != new.get(path)
+    }
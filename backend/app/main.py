@@ -3,25 +3,36 @@ backend/app/main.py
 
 FastAPI application entrypoint with extensive telemetry middleware for EVLink backend.
 """
-import asyncio
-import json
-import logging
-import time
-from typing import AsyncIterator
+from contextlib import asynccontextmanager
 
 import sentry_sdk
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
-from fastapi.security import HTTPAuthorizationCredentials
 
 from app.api import ha, me, newsletter, payments, private, public, webhook
 from app.api.phone_verification import router as phone_router
 from app.api.admin import routers as admin_routers
-from app.config import ENDPOINT_COST, IS_PROD, SENTRY_DSN
-from app.dependencies.auth import get_current_user
+from app.config import (
+    IS_PROD,
+    SENTRY_DSN,
+    TELEMETRY_CAPTURE_BYTES,
+    TELEMETRY_CAPTURE_EXCLUDED_PATHS,
+    TELEMETRY_CAPTURE_MODE,
+)
+from app.enode.client import enode_client
+from app.lib.supabase import close_supabase_clients, init_supabase_clients
+from app.lib.telemetry_middleware import TelemetryMiddleware
 from app.logger import logger
-from app.storage.telemetry import log_api_telemetry
+from app.services.charging_samples import charging_sample_writer
+from app.services.charging_sessions import charging_session_detector
+from app.services.enode_reconcile import enode_reconciler
+from app.services.ha_push import ha_push_dispatcher
+from app.services.log_retention import log_retention_job
+from app.services.telemetry_writer import telemetry_writer
+from app.services.vehicle_refresher import vehicle_refresher
+from app.services.webhook_ingest import webhook_ingestor
+from app.storage.settings import settings_snapshot
 
 # Initialize Sentry
 sentry_sdk.init(
@@ -33,6 +44,33 @@ sentry_sdk.init(
 
 logger.info("🚀 Starting EVLink Backend...")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Starts and stops background workers that live for the whole process."""
+    await init_supabase_clients()
+    await telemetry_writer.start()
+    await settings_snapshot.refresh()
+    await ha_push_dispatcher.start()
+    await charging_sample_writer.start()
+    await charging_session_detector.start()
+    await webhook_ingestor.start()
+    await vehicle_refresher.start()
+    await enode_reconciler.start()
+    await log_retention_job.start()
+    try:
+        yield
+    finally:
+        await log_retention_job.stop()
+        await enode_reconciler.stop()
+        await vehicle_refresher.stop()
+        await webhook_ingestor.stop()
+        await charging_session_detector.stop()
+        await charging_sample_writer.stop()
+        await ha_push_dispatcher.stop()
+        await telemetry_writer.stop()
+        await enode_client.aclose()
+        await close_supabase_clients()
+
 app = FastAPI(
     title="EVLink Backend",
     version="0.2.0",
@@ -40,123 +78,22 @@ app = FastAPI(
     docs_url=None if IS_PROD else "/docs",
     redoc_url=None if IS_PROD else "/redoc",
     openapi_url=None if IS_PROD else "/openapi.json",
+    lifespan=lifespan,
 )
 
 # -------------------------
 # Telemetry middleware
 # -------------------------
-@app.middleware("http")
-async def telemetry_middleware(request: Request, call_next):
-    """
-    Middleware to log API telemetry data for requests to /api/ and /webhook.
-
-    This middleware captures:
-    - Request and response bodies.
-    - User ID and Vehicle ID from the request.
-    - Request processing time.
-    - Status code, request/response sizes.
-    - Calculated token cost for the endpoint.
-
-    All telemetry data is logged asynchronously to the `api_telemetry` table.
-    It also handles replaying the response body so that it can be read
-    without being consumed.
-    """
-    # TODO: Add a server identifier to telemetry logs. This would involve:
-    # 1. Reading an environment variable (e.g., SERVER_IDENTIFIER).
-    # 2. Adding a `server_id` parameter to the `log_api_telemetry` function.
-    # 3. Adding a `server_id` column to the `api_telemetry` table in Supabase.
-    path = request.url.path
-    should_log = path.startswith("/api/") or path.startswith("/webhook")
-    start_ts = None
-    user_id = None
-    raw_body = b""
-
-    if should_log:
-        start_ts = time.time()
-        raw_body = await request.body()
-        # Parse request_payload if possible, otherwise it remains None.
-        request_payload = None
-        try:
-            if raw_body:
-                request_payload = json.loads(raw_body)
-        except json.JSONDecodeError:
-            # This ensures that if the body is not valid JSON, request_payload remains None,
-            # thus satisfying the type hint of the log_api_telemetry function.
-            pass
-
-        auth_header = request.headers.get("Authorization", "")
-        if auth_header.startswith("Bearer "):
-            try:
-                # Pass the entire auth_header to our dependency
-                user = await get_current_user(creds=HTTPAuthorizationCredentials(scheme="Bearer", credentials=auth_header.split(" ",1)[1]))
-                user_id = user.id
-            except HTTPException:
-                # Invalid JWT or API key
-                pass
-
-    # Get response
-    response = await call_next(request)
-
-    if should_log and start_ts is not None:
-        duration_ms = int((time.time() - start_ts) * 1000)
-        vehicle_id = request.path_params.get("vehicle_id")
-        status = response.status_code
-
-        # Start by collecting all parts from response.body_iterator
-        body_chunks: list[bytes] = []
-        try:
-            # NOTE: body_iterator can be an async iterator
-            async for chunk in response.body_iterator:
-                body_chunks.append(chunk)
-        except Exception:
-            # If it fails, ignore the response payload
-            body_chunks = []
-
-        # Set the iterator back as an async generator
-        async def _replay_body() -> AsyncIterator[bytes]:
-            for chunk in body_chunks:
-                yield chunk
-
-        response.body_iterator = _replay_body()
-
-        # Calculate size + payload
-        response_payload = None
-        response_size = None
-        if body_chunks:
-            full = b"".join(body_chunks)
-            response_size = len(full)
-            try:
-                response_payload = full.decode("utf-8", errors="ignore")
-            except:
-                response_payload = None
-
-        # Cost
-        cost_tokens = 0
-        if user_id:
-            for prefix, cost in ENDPOINT_COST.items():
-                if path.startswith(prefix):
-                    cost_tokens = cost
-                    break
-
-        # Async log
-        asyncio.create_task(
-            log_api_telemetry(
-                endpoint         = path,
-                user_id          = user_id,
-                vehicle_id       = vehicle_id,
-                status           = status,
-                error_message    = None if status < 400 else None,
-                duration_ms      = duration_ms,
-                timestamp        = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-                request_size     = len(raw_body),
-                response_size    = response_size,
-                request_payload  = request_payload,
-                response_payload = response_payload,
-                cost_tokens      = cost_tokens,
-            )
-        )
-
-    return response
+# TODO: Add a server identifier to telemetry logs. This would involve:
+# 1. Reading an environment variable (e.g., SERVER_IDENTIFIER).
+# 2. Adding a `server_id` parameter to `TelemetryWriter.log`.
+# 3. Adding a `server_id` column to the `api_telemetry` table in Supabase.
+app.add_middleware(
+    TelemetryMiddleware,
+    capture_mode=TELEMETRY_CAPTURE_MODE,
+    capture_bytes=TELEMETRY_CAPTURE_BYTES,
+    excluded_paths=TELEMETRY_CAPTURE_EXCLUDED_PATHS,
+)
 
 # -------------------------
 # CORS configuration
@@ -0,0 +1,303 @@
+"""
+backend/app/services/charging_samples.py
+
+Charging history extracted from Enode vehicle webhooks.
+
+The webhook ingestor keeps only the latest state of a vehicle in
+vehicles.vehicle_cache. After each ingest batch, every vehicle event is also
+projected into a typed charging_samples row (`project_sample`), fed to the
+charging session detector and handed to this writer, which buffers it per
+vehicle and bulk-inserts the buffers in batches. Each sample has a
+deterministic source_event_id derived from the vehicle, the sample time and
+the sampled values, so redelivered webhooks and retried batches never
+produce a second row. Samples whose values match the vehicle's previous
+sample are only kept every `keepalive` seconds, which leaves idle vehicles
+at a few rows per hour.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from app.config import (
+    CHARGING_SAMPLE_BATCH_SIZE,
+    CHARGING_SAMPLE_FLUSH_INTERVAL_SECONDS,
+    CHARGING_SAMPLE_KEEPALIVE_SECONDS,
+    CHARGING_SAMPLE_MAX_PENDING,
+)
+from app.lib.ttl_cache import TTLCache
+from app.storage.charging_samples import insert_charging_samples_batch
+
+logger = logging.getLogger(__name__)
+
+# Namespace of the uuid5 source_event_id of charging samples
+SAMPLE_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "https://evlinkha.se/charging_samples")
+
+# Columns compared to decide whether a sample repeats the previous one
+SAMPLE_VALUE_FIELDS = (
+    "is_charging",
+    "is_plugged_in",
+    "is_fully_charged",
+    "is_reachable",
+    "battery_level",
+    "battery_capacity_kwh",
+    "charge_limit_percent",
+    "charge_rate_kw",
+    "charge_time_remaining_min",
+    "range_km",
+    "odometer_km",
+    "power_delivery_state",
+    "location",
+)
+
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return value
+
+
+def _integer(value: Any) -> Optional[int]:
+    number = _number(value)
+    return None if number is None else int(round(number))
+
+
+def _boolean(value: Any) -> Optional[bool]:
+    return value if isinstance(value, bool) else None
+
+
+def _timestamp(*values: Any) -> Optional[str]:
+    """The first value that parses as a timestamp, as UTC ISO 8601."""
+    for value in values:
+        if not isinstance(value, str) or not value:
+            continue
+        try:
+            dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            continue
+        dt = dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+        return dt.astimezone(timezone.utc).isoformat()
+    return None
+
+
+def _point(location: Any) -> Optional[str]:
+    """EWKT of a vehicle location for the geography column."""
+    if not isinstance(location, dict):
+        return None
+    lat, lon = _number(location.get("latitude")), _number(location.get("longitude"))
+    if lat is None or lon is None:
+        return None
+    return f"SRID=4326;POINT({lon} {lat})"
+
+
+def values_digest(sample: dict) -> str:
+    """Digest of the sampled values of a row, ignoring time and identity."""
+    values = [sample.get(field) for field in SAMPLE_VALUE_FIELDS]
+    return hashlib.blake2b(json.dumps(values, default=str).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def project_sample(user_id: str, vehicle: dict, event_time: Optional[str] = None) -> Optional[dict]:
+    """
+    Projects an Enode vehicle object into a charging_samples row, or returns
+    None if the vehicle has no ID. `vehicle_id` is the Enode vehicle ID, as in
+    vehicles.vehicle_id. The sample time is when Enode last updated the charge
+    state, falling back to lastSeen, the event time and now.
+    """
+    vehicle_id = vehicle.get("id")
+    if not vehicle_id:
+        return None
+    charge = vehicle.get("chargeState") or {}
+    info = vehicle.get("information") or {}
+    odometer = vehicle.get("odometer") or {}
+    event_time = _timestamp(event_time)
+
+    sample = {
+        "vehicle_id": vehicle_id,
+        "user_id": user_id,
+        "sample_time": _timestamp(charge.get("lastUpdated"), vehicle.get("lastSeen"), event_time)
+        or datetime.now(timezone.utc).isoformat(),
+        "created_at": event_time,
+        "is_charging": _boolean(charge.get("isCharging")),
+        "is_plugged_in": _boolean(charge.get("isPluggedIn")),
+        "is_fully_charged": _boolean(charge.get("isFullyCharged")),
+        "is_reachable": _boolean(vehicle.get("isReachable")),
+        "battery_level": _number(charge.get("batteryLevel")),
+        "battery_capacity_kwh": _number(charge.get("batteryCapacity")),
+        "charge_limit_percent": _integer(charge.get("chargeLimit")),
+        "charge_rate_kw": _number(charge.get("chargeRate")),
+        "charge_time_remaining_min": _integer(charge.get("chargeTimeRemaining")),
+        "range_km": _number(charge.get("range")),
+        "odometer_km": _number(odometer.get("distance")),
+        "power_delivery_state": charge.get("powerDeliveryState"),
+        "vin": info.get("vin"),
+        "location": _point(vehicle.get("location")),
+        "brand": info.get("brand"),
+        "model": info.get("model"),
+        "year": _integer(info.get("year")),
+    }
+    sample["source_event_id"] = str(
+        uuid.uuid5(SAMPLE_NAMESPACE, f"{vehicle_id}|{sample['sample_time']}|{values_digest(sample)}")
+    )
+    return sample
+
+
+class ChargingSampleWriter:
+    """Per-vehicle sample buffers plus the background task that bulk-inserts them."""
+
+    def __init__(self, batch_size: int, flush_interval: float, max_pending: int, keepalive: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.keepalive = keepalive
+
+        # vehicle_id -> {source_event_id: row}, in arrival order
+        self._buffers: dict[str, dict[str, dict]] = {}
+        self._pending = 0
+        # vehicle_id -> (values digest, monotonic time) of the last buffered sample
+        self._last = TTLCache(maxsize=50000, ttl=max(keepalive, 1))
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+        self.submitted = 0
+        self.compacted = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.flushed_rows = 0
+        self.flushed_batches = 0
+        self.failed_batches = 0
+
+    async def start(self) -> None:
+        """Starts the background flusher. Called from the application lifespan."""
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run(), name="charging-sample-writer")
+        logger.info(
+            "[🔋 charging samples] Writer started (batch_size=%d, flush_interval=%.1fs, keepalive=%.0fs)",
+            self.batch_size,
+            self.flush_interval,
+            self.keepalive,
+        )
+
+    async def stop(self) -> None:
+        """Stops the flusher and writes out all buffered samples."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        logger.info("[🔋 charging samples] Writer stopped")
+
+    def submit(self, sample: dict) -> bool:
+        """
+        Buffers a sample from `project_sample` for the next batch insert.
+        Never blocks; returns False if the sample was compacted away or dropped.
+        """
+        if self._task is None:
+            self.dropped += 1
+            return False
+        self.submitted += 1
+
+        vehicle_id = sample["vehicle_id"]
+        digest = values_digest(sample)
+        last = self._last.get(vehicle_id)
+        if last and last[0] == digest and time.monotonic() - last[1] < self.keepalive:
+            self.compacted += 1
+            return False
+
+        buffer = self._buffers.setdefault(vehicle_id, {})
+        if sample["source_event_id"] in buffer:
+            self.duplicates += 1
+            return False
+        if self._pending >= self.max_pending:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning("[⚠️ charging samples] Buffer full, %d sample(s) dropped so far", self.dropped)
+            return False
+
+        buffer[sample["source_event_id"]] = sample
+        self._pending += 1
+        self._last.set(vehicle_id, (digest, time.monotonic()))
+        if self._pending >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def stats(self) -> dict:
+        """Returns buffer depth and flush counters."""
+        return {
+            "pending": self._pending,
+            "vehicles_buffered": len(self._buffers),
+            "max_pending": self.max_pending,
+            "submitted": self.submitted,
+            "compacted": self.compacted,
+            "duplicates": self.duplicates,
+            "dropped": self.dropped,
+            "flushed_rows": self.flushed_rows,
+            "flushed_batches": self.flushed_batches,
+            "failed_batches": self.failed_batches,
+            "running": self._task is not None and not self._task.done(),
+        }
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            # Read before flushing, so a stop requested meanwhile still gets a last flush
+            stopping = self._stopping
+            await self._flush()
+
+    def _take(self) -> list[dict]:
+        """Empties the buffers; rows are grouped by vehicle and ordered by sample time."""
+        buffers, self._buffers, self._pending = self._buffers, {}, 0
+        rows = []
+        for samples in buffers.values():
+            rows.extend(sorted(samples.values(), key=lambda s: s["sample_time"]))
+        return rows
+
+    def _requeue(self, rows: list[dict]) -> None:
+        """Puts rows of a failed batch back, as far as the buffer has room."""
+        for row in rows:
+            if self._pending >= self.max_pending:
+                self.dropped += 1
+                continue
+            buffer = self._buffers.setdefault(row["vehicle_id"], {})
+            if row["source_event_id"] not in buffer:
+                buffer[row["source_event_id"]] = row
+                self._pending += 1
+
+    async def _flush(self) -> None:
+        rows = self._take()
+        for i in range(0, len(rows), self.batch_size):
+            batch = rows[i:i + self.batch_size]
+            try:
+                await insert_charging_samples_batch(batch)
+            except Exception as e:
+                self.failed_batches += 1
+                logger.error("[❌ charging samples] Failed to insert batch of %d sample(s): %s", len(batch), e)
+                # Retried on the next flush; on shutdown they are lost
+                if not self._stopping:
+                    self._requeue(rows[i:])
+                return
+            self.flushed_rows += len(batch)
+            self.flushed_batches += 1
+        if rows:
+            logger.debug("[🔋 charging samples] Flushed %d sample(s)", len(rows))
+
+
+charging_sample_writer = ChargingSampleWriter(
+    batch_size=CHARGING_SAMPLE_BATCH_SIZE,
+    flush_interval=CHARGING_SAMPLE_FLUSH_INTERVAL_SECONDS,
+    max_pending=CHARGING_SAMPLE_MAX_PENDING,
+    keepalive=CHARGING_SAMPLE_KEEPALIVE_SECONDS,
+)
@@ -0,0 +1,321 @@
+"""
+backend/app/services/charging_sessions.py
+
+Online detection of charging sessions from charging samples.
+
+Every sample of a vehicle is fed to a small state machine, in time order. A
+session opens when the vehicle starts charging (isCharging, or a
+powerDeliveryState of PLUGGED_IN:CHARGING). It ends when the vehicle is
+unplugged, or when no charging sample arrived for `idle_timeout` seconds.
+While a session is open, the detector tracks:
+- energy added, integrating the charge rate over the intervals spent charging
+- the maximum charge rate
+- the time spent charging
+
+The state is a fixed set of fields per vehicle with an open session, so
+memory and work per sample do not depend on the length of the history.
+
+Ended sessions are stored with the `record_charging_sessions` RPC, which
+also updates the charging stats rollups. Open sessions are
+checkpointed to charging_sessions_open every `checkpoint_interval` seconds
+and loaded again on start, so a restart continues them instead of splitting
+them. Samples between the last checkpoint and a crash are lost to the
+session's totals.
+"""
+import asyncio
+import logging
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from app.config import CHARGING_SESSION_CHECKPOINT_SECONDS, CHARGING_SESSION_IDLE_TIMEOUT_MINUTES
+from app.lib.timestamps import parse_updated_at
+from app.services.charging_stats import charging_stats_cache
+from app.storage.charging_sessions import (
+    delete_open_charging_sessions,
+    get_open_charging_sessions,
+    record_charging_sessions,
+    upsert_open_charging_sessions,
+)
+
+logger = logging.getLogger(__name__)
+
+# Namespace of the uuid5 session_id, derived from the vehicle and the start time
+SESSION_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "https://evlinkha.se/charging_sessions")
+
+POWER_CHARGING = "PLUGGED_IN:CHARGING"
+POWER_UNPLUGGED = "UNPLUGGED"
+
+CLOSE_UNPLUGGED = "unplugged"
+CLOSE_TIMEOUT = "timeout"
+
+
+def is_charging(sample: dict) -> bool:
+    return sample.get("is_charging") is True or sample.get("power_delivery_state") == POWER_CHARGING
+
+
+def is_unplugged(sample: dict) -> bool:
+    return sample.get("is_plugged_in") is False or sample.get("power_delivery_state") == POWER_UNPLUGGED
+
+
+class _Session:
+    """Running totals of one open session."""
+
+    __slots__ = (
+        "session_id", "vehicle_id", "user_id", "start_time", "last_sample_time",
+        "last_charging_time", "last_is_charging", "start_battery_level", "last_battery_level",
+        "battery_capacity_kwh", "energy_added_kwh", "charging_seconds", "max_charge_rate_kw",
+        "last_charge_rate_kw", "brand", "model", "year", "start_location", "last_location",
+    )
+
+    FIELDS = __slots__
+    TIMES = ("start_time", "last_sample_time", "last_charging_time")
+
+    @classmethod
+    def open(cls, sample: dict, sample_time: datetime) -> "_Session":
+        s = cls()
+        s.session_id = str(uuid.uuid5(SESSION_NAMESPACE, f"{sample['vehicle_id']}|{sample_time.isoformat()}"))
+        s.vehicle_id = sample["vehicle_id"]
+        s.user_id = sample.get("user_id")
+        s.start_time = s.last_sample_time = s.last_charging_time = sample_time
+        s.last_is_charging = True
+        s.start_battery_level = s.last_battery_level = sample.get("battery_level")
+        s.battery_capacity_kwh = sample.get("battery_capacity_kwh")
+        s.energy_added_kwh = 0.0
+        s.charging_seconds = 0.0
+        s.max_charge_rate_kw = s.last_charge_rate_kw = sample.get("charge_rate_kw")
+        s.brand, s.model, s.year = sample.get("brand"), sample.get("model"), sample.get("year")
+        s.start_location = s.last_location = sample.get("location")
+        return s
+
+    @classmethod
+    def from_row(cls, row: dict) -> "_Session":
+        s = cls()
+        for field in cls.FIELDS:
+            setattr(s, field, row.get(field))
+        for field in cls.TIMES:
+            setattr(s, field, parse_updated_at(row[field]))
+        s.energy_added_kwh = float(s.energy_added_kwh or 0)
+        s.charging_seconds = float(s.charging_seconds or 0)
+        return s
+
+    def advance(self, sample: dict, sample_time: datetime, charging: bool, max_gap: float) -> None:
+        """Adds the interval since the previous sample and takes over the sample's values."""
+        rate = sample.get("charge_rate_kw")
+        seconds = (sample_time - self.last_sample_time).total_seconds()
+        # Only intervals between two charging samples count, so the totals end
+        # with end_time; long gaps are not guessed
+        if self.last_is_charging and charging and seconds <= max_gap:
+            rates = [r for r in (self.last_charge_rate_kw, rate) if r is not None]
+            if rates:
+                self.energy_added_kwh += sum(rates) / len(rates) * seconds / 3600
+            self.charging_seconds += seconds
+
+        self.last_sample_time = sample_time
+        self.last_is_charging = charging
+        self.last_charge_rate_kw = rate if charging else None
+        if charging:
+            self.last_charging_time = sample_time
+            if rate is not None:
+                self.max_charge_rate_kw = max(rate, self.max_charge_rate_kw or 0)
+        if sample.get("battery_level") is not None:
+            self.last_battery_level = sample["battery_level"]
+        if sample.get("battery_capacity_kwh") is not None:
+            self.battery_capacity_kwh = sample["battery_capacity_kwh"]
+        if sample.get("location") is not None:
+            self.last_location = sample["location"]
+
+    def energy_kwh(self) -> Optional[float]:
+        """Integrated energy, or the battery level increase when no charge rate was reported."""
+        if self.energy_added_kwh > 0:
+            return self.energy_added_kwh
+        if None not in (self.start_battery_level, self.last_battery_level, self.battery_capacity_kwh):
+            return max(float(self.last_battery_level) - float(self.start_battery_level), 0) / 100 * float(self.battery_capacity_kwh)
+        return None
+
+    def checkpoint_row(self) -> dict:
+        row = {field: getattr(self, field) for field in self.FIELDS}
+        for field in self.TIMES:
+            row[field] = row[field].isoformat()
+        row["updated_at"] = datetime.now(timezone.utc).isoformat()
+        return row
+
+    def session_row(self) -> dict:
+        energy = self.energy_kwh()
+        return {
+            "session_id": self.session_id,
+            "vehicle_id": self.vehicle_id,
+            "user_id": self.user_id,
+            "start_time": self.start_time.isoformat(),
+            "end_time": self.last_charging_time.isoformat(),
+            "start_battery_level": self.start_battery_level,
+            "end_battery_level": self.last_battery_level,
+            "energy_added_kwh": round(energy, 3) if energy is not None else None,
+            "duration_minutes": round((self.last_charging_time - self.start_time).total_seconds() / 60, 2),
+            "max_charge_rate_kw": self.max_charge_rate_kw,
+            "average_charge_rate_kw": round(energy / (self.charging_seconds / 3600), 2)
+            if energy is not None and self.charging_seconds > 0 else None,
+            "brand": self.brand,
+            "model": self.model,
+            "year": self.year,
+            "start_location": self.start_location,
+            "end_location": self.last_location,
+        }
+
+
+class ChargingSessionDetector:
+    """Per-vehicle charging state machines plus the task that checkpoints them."""
+
+    def __init__(self, idle_timeout: float, checkpoint_interval: float):
+        self.idle_timeout = idle_timeout
+        self.checkpoint_interval = checkpoint_interval
+
+        self._open: dict[str, _Session] = {}
+        # Open sessions changed since the last checkpoint, and ended sessions not yet stored
+        self._dirty: set[str] = set()
+        self._closed: list[_Session] = []
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+        self.samples = 0
+        self.out_of_order = 0
+        self.opened = 0
+        self.recovered = 0
+        self.closed: Counter = Counter()
+        self.stored = 0
+        self.checkpoints = 0
+        self.failed_checkpoints = 0
+
+    async def start(self) -> None:
+        """Loads open sessions and starts checkpointing. Called from the application lifespan."""
+        if self._task is not None:
+            return
+        try:
+            rows = await get_open_charging_sessions()
+        except Exception as e:
+            rows = []
+            logger.error(f"[❌ charging sessions] Could not load open sessions, starting without them: {e}")
+        for row in rows:
+            # Samples seen before loading finished take precedence
+            self._open.setdefault(row["vehicle_id"], _Session.from_row(row))
+        self.recovered = len(rows)
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="charging-session-detector")
+        logger.info(
+            "[🔌 charging sessions] Detector started with %d open session(s) (idle timeout %.0fs)",
+            len(rows),
+            self.idle_timeout,
+        )
+
+    async def stop(self) -> None:
+        """Stops checkpointing after a final checkpoint; open sessions stay open."""
+        if self._task is None:
+            return
+        self._stopping.set()
+        # The loop closes idle sessions and checkpoints once more before exiting
+        await self._task
+        self._task = None
+        logger.info("[🔌 charging sessions] Detector stopped with %d open session(s)", len(self._open))
+
+    def observe(self, sample: dict) -> None:
+        """Feeds one sample to the state machine of its vehicle. Samples must arrive in time order per vehicle."""
+        sample_time = parse_updated_at(sample.get("sample_time"))
+        vehicle_id = sample.get("vehicle_id")
+        if sample_time is None or not vehicle_id:
+            return
+        self.samples += 1
+        charging = is_charging(sample)
+        session = self._open.get(vehicle_id)
+
+        if session is not None:
+            if sample_time <= session.last_sample_time:
+                self.out_of_order += 1
+                return
+            if (sample_time - session.last_charging_time).total_seconds() > self.idle_timeout:
+                self._close(session, CLOSE_TIMEOUT)
+            else:
+                session.advance(sample, sample_time, charging, self.idle_timeout)
+                if is_unplugged(sample):
+                    self._close(session, CLOSE_UNPLUGGED)
+                else:
+                    self._dirty.add(vehicle_id)
+                return
+
+        if charging and not is_unplugged(sample):
+            self._open[vehicle_id] = _Session.open(sample, sample_time)
+            self._dirty.add(vehicle_id)
+            self.opened += 1
+
+    def close_idle(self, now: Optional[datetime] = None) -> int:
+        """Ends sessions of vehicles that sent no charging sample for `idle_timeout`. Returns how many."""
+        deadline = (now or datetime.now(timezone.utc)) - timedelta(seconds=self.idle_timeout)
+        idle = [s for s in self._open.values() if s.last_charging_time < deadline]
+        for session in idle:
+            self._close(session, CLOSE_TIMEOUT)
+        return len(idle)
+
+    async def checkpoint(self) -> None:
+        """Stores ended sessions and the state of changed open sessions."""
+        closed, self._closed = self._closed, []
+        dirty, self._dirty = self._dirty, set()
+        open_rows = [self._open[v].checkpoint_row() for v in dirty if v in self._open]
+        if not closed and not open_rows:
+            return
+        try:
+            # A session of a single charging sample has no duration and is not kept
+            stored = [s for s in closed if s.last_charging_time > s.start_time]
+            await record_charging_sessions([s.session_row() for s in stored])
+            await delete_open_charging_sessions([s.session_id for s in closed])
+            await upsert_open_charging_sessions(open_rows)
+        except Exception as e:
+            self.failed_checkpoints += 1
+            logger.error(f"[❌ charging sessions] Checkpoint failed, retrying next time: {e}")
+            self._closed = closed + self._closed
+            self._dirty |= {v for v in dirty if v in self._open}
+            return
+        self.stored += len(stored)
+        self.checkpoints += 1
+        if stored:
+            charging_stats_cache.on_sessions_recorded({s.user_id for s in stored if s.user_id})
+        if closed:
+            logger.info(f"[🔌 charging sessions] Stored {len(closed)} ended session(s), {len(self._open)} open")
+
+    def stats(self) -> dict:
+        """Returns session counters."""
+        return {
+            "open_sessions": len(self._open),
+            "samples": self.samples,
+            "out_of_order": self.out_of_order,
+            "opened": self.opened,
+            "recovered": self.recovered,
+            "closed": dict(self.closed),
+            "stored": self.stored,
+            "pending_closed": len(self._closed),
+            "checkpoints": self.checkpoints,
+            "failed_checkpoints": self.failed_checkpoints,
+            "running": self._task is not None and not self._task.done(),
+        }
+
+    def _close(self, session: _Session, reason: str) -> None:
+        del self._open[session.vehicle_id]
+        self._dirty.discard(session.vehicle_id)
+        self._closed.append(session)
+        self.closed[reason] += 1
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.checkpoint_interval)
+                stopping = True
+            except asyncio.TimeoutError:
+                pass
+            self.close_idle()
+            await self.checkpoint()
+
+
+charging_session_detector = ChargingSessionDetector(
+    idle_timeout=CHARGING_SESSION_IDLE_TIMEOUT_MINUTES * 60,
+    checkpoint_interval=CHARGING_SESSION_CHECKPOINT_SECONDS,
+)
@@ -0,0 +1,109 @@
+"""
+backend/app/services/charging_stats.py
+
+In-process cache for the /api/stats endpoints.
+
+The figures come from the charging stats rollups (one row read per request
+at most), and the public stats page is read far more often than sessions
+end. Entries older than `ttl` are still served while a background task
+reloads them, so requests only wait for the database on a cold start or
+after `max_stale`. When the session detector stores sessions, the users
+concerned are reloaded on their next request and the global figures are
+refreshed in the background.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Hashable, Iterable
+
+from app.config import CHARGING_STATS_CACHE_MAX_STALE_SECONDS, CHARGING_STATS_CACHE_TTL_SECONDS
+from app.lib.ttl_cache import TTLCache
+from app.storage.insights import get_global_stats_row, get_user_stats_row
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_KEY = "global"
+
+
+class ChargingStatsCache:
+    """Stale-while-revalidate cache of global and per-user charging stats."""
+
+    def __init__(self, ttl: float, max_stale: float, maxsize: int = 10000):
+        self.ttl = ttl
+        # key -> (value, monotonic load time)
+        self._entries = TTLCache(maxsize=maxsize, ttl=max(max_stale, ttl))
+        self._loading: dict[Hashable, asyncio.Task] = {}
+
+        self.loads = 0
+        self.background_refreshes = 0
+        self.failed_loads = 0
+
+    async def get_global(self) -> dict | None:
+        """Returns the global stats row."""
+        return await self._get(GLOBAL_KEY, get_global_stats_row)
+
+    async def get_user(self, user_id: str) -> dict:
+        """Returns the stats row of one user."""
+        return await self._get(("user", user_id), lambda: get_user_stats_row(user_id))
+
+    def on_sessions_recorded(self, user_ids: Iterable[str]) -> None:
+        """Called after sessions were stored: drops those users and refreshes the global row."""
+        for user_id in user_ids:
+            self._entries.invalidate(("user", user_id))
+        if self._entries.get(GLOBAL_KEY) is not None:
+            self._load_in_background(GLOBAL_KEY, get_global_stats_row)
+
+    def stats(self) -> dict:
+        """Returns load counters and the state of the underlying cache."""
+        return {
+            "ttl_seconds": self.ttl,
+            "loads": self.loads,
+            "background_refreshes": self.background_refreshes,
+            "failed_loads": self.failed_loads,
+            "loading": len(self._loading),
+            "entries": self._entries.stats(),
+        }
+
+    async def _get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            # Shielded so a client that goes away does not cancel the load for the others
+            return await asyncio.shield(self._load(key, loader))
+        value, loaded_at = entry
+        if time.monotonic() - loaded_at > self.ttl:
+            self._load_in_background(key, loader)
+        return value
+
+    def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """Starts a load of `key` unless one is running; returns the running one."""
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key, loader))
+            self._loading[key] = task
+        return task
+
+    def _load_in_background(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> None:
+        if key in self._loading:
+            return
+        self.background_refreshes += 1
+        # The failure is logged in _fetch; retrieved so asyncio does not warn about it
+        self._load(key, loader).add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _fetch(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await loader()
+        except Exception as e:
+            self.failed_loads += 1
+            logger.error(f"[❌ stats cache] Failed to load {key}: {e}")
+            raise
+        finally:
+            self._loading.pop(key, None)
+        self.loads += 1
+        self._entries.set(key, (value, time.monotonic()))
+        return value
+
+
+charging_stats_cache = ChargingStatsCache(
+    ttl=CHARGING_STATS_CACHE_TTL_SECONDS,
+    max_stale=CHARGING_STATS_CACHE_MAX_STALE_SECONDS,
+)
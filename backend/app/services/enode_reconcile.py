@@ -0,0 +1,306 @@
+"""
+backend/app/services/enode_reconcile.py
+
+Reconciliation of the `vehicles` table with the full Enode fleet.
+
+Webhooks can be missed, and the vehicle refresher only covers users who use
+the dashboard or the API. This job pages through GET /vehicles, compares each
+page with the stored rows by content hash and owner, and writes only the
+vehicles that are missing or differ, through `save_vehicles`.
+
+A pass over the fleet is split into runs of at most `max_pages` pages. The
+Enode cursor and the drift counters of the pass are stored in
+enode_reconcile_runs after every page, so the next run (or the next process
+after a deploy) continues where the last one stopped. One page is fetched
+from Enode while the previous one is compared and written, with a short
+delay between pages, so neither Enode nor the database sees more than one
+request of this job at a time.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Optional
+
+import httpx
+
+from app.config import (
+    ENODE_RECONCILE_INTERVAL_SECONDS,
+    ENODE_RECONCILE_MAX_PAGES_PER_RUN,
+    ENODE_RECONCILE_PAGE_DELAY_SECONDS,
+    ENODE_RECONCILE_PAGE_SIZE,
+)
+from app.enode.vehicle import get_all_vehicles
+from app.lib.timestamps import parse_updated_at
+from app.lib.vehicle_diff import flatten_vehicle, vehicle_digest
+from app.services.vehicle_updates import save_vehicles
+from app.storage.enode_reconcile import (
+    RUN_ABANDONED,
+    RUN_COMPLETED,
+    RUN_IN_PROGRESS,
+    create_reconcile_run,
+    get_open_reconcile_run,
+    update_reconcile_run,
+)
+from app.storage.user import get_existing_user_ids
+from app.storage.vehicle import get_vehicle_hashes_by_vehicle_ids
+
+logger = logging.getLogger(__name__)
+
+# Drift counters stored per pass in enode_reconcile_runs
+COUNTERS = (
+    "vehicles_seen",
+    "vehicles_unchanged",
+    "vehicles_missing",
+    "vehicles_changed",
+    "vehicles_owner_changed",
+    "vehicles_unknown_user",
+    "vehicles_written",
+)
+
+# Enode answers these when a stored cursor can no longer be used
+STALE_CURSOR_STATUSES = frozenset({400, 404, 410, 422})
+
+
+class ReconcileInProgress(Exception):
+    pass
+
+
+class EnodeReconciler:
+    """Resumable, paced comparison of the Enode fleet with the vehicles table."""
+
+    def __init__(self, interval: float, page_size: int, max_pages: int, page_delay: float):
+        self.interval = interval
+        self.page_size = page_size
+        self.max_pages = max(1, max_pages)
+        self.page_delay = page_delay
+
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+        self.runs = 0
+        self.failed = 0
+        self.passes_completed = 0
+        self.passes_abandoned = 0
+        self.totals: Counter = Counter()
+        self.last_run: Optional[dict] = None
+
+    async def start(self) -> None:
+        """Starts the periodic run. Called from the application lifespan."""
+        if self._task is not None or self.interval <= 0:
+            return
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._loop(), name="enode-reconcile")
+        logger.info(
+            "[🧮 reconcile] Started (every %.0fs, up to %d page(s) of %d)",
+            self.interval,
+            self.max_pages,
+            self.page_size,
+        )
+
+    async def stop(self) -> None:
+        """Stops the periodic run; a run in progress is cancelled and resumes after restart."""
+        if self._task is None:
+            return
+        self._stopping.set()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        logger.info("[🧮 reconcile] Stopped")
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def run_once(self) -> dict:
+        """
+        Reconciles up to `max_pages` pages of the open pass, or of a new pass
+        if the last one completed. Returns the counters of this run.
+        Raises ReconcileInProgress if a run is already going on.
+        """
+        if self._lock.locked():
+            raise ReconcileInProgress("A reconciliation run is already in progress")
+        async with self._lock:
+            self.runs += 1
+            try:
+                summary = await self._run()
+            except Exception:
+                self.failed += 1
+                raise
+            self.last_run = summary
+            return summary
+
+    def stats(self) -> dict:
+        """Returns run counters and the drift seen since the process started."""
+        drifted = self.totals["vehicles_missing"] + self.totals["vehicles_changed"] + self.totals["vehicles_owner_changed"]
+        seen = self.totals["vehicles_seen"]
+        return {
+            "running": self.running,
+            "runs": self.runs,
+            "failed": self.failed,
+            "passes_completed": self.passes_completed,
+            "passes_abandoned": self.passes_abandoned,
+            "totals": dict(self.totals),
+            "drift_ratio": round(drifted / seen, 4) if seen else None,
+            "last_run": self.last_run,
+        }
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.run_once()
+            except ReconcileInProgress:
+                pass
+            except Exception as e:
+                logger.error(f"[❌ reconcile] Run failed: {e}")
+
+    async def _fetch_page(self, cursor: Optional[str], delay: float = 0) -> dict:
+        if delay:
+            await asyncio.sleep(delay)
+        return await get_all_vehicles(page_size=self.page_size, after=cursor)
+
+    async def _run(self) -> dict:
+        run = await get_open_reconcile_run() or await create_reconcile_run()
+        run_id = run["id"]
+        cursor = run.get("cursor")
+        counters = Counter({name: run.get(name) or 0 for name in COUNTERS})
+        pages = run.get("pages") or 0
+        max_drift_seconds = run.get("max_drift_seconds") or 0
+        this_run: Counter = Counter()
+        start = time.perf_counter()
+        status = RUN_IN_PROGRESS
+
+        logger.info(f"[🧮 reconcile] {'Resuming' if cursor else 'Starting'} pass {run_id} at page {pages + 1}")
+        fetch: Optional[asyncio.Task] = asyncio.create_task(self._fetch_page(cursor))
+        try:
+            for page_number in range(1, self.max_pages + 1):
+                try:
+                    page = await fetch
+                except httpx.HTTPStatusError as e:
+                    if cursor and e.response.status_code in STALE_CURSOR_STATUSES:
+                        # The next run starts a new pass from the first page
+                        status = RUN_ABANDONED
+                        self.passes_abandoned += 1
+                        logger.warning(f"[⚠️ reconcile] Enode rejected the cursor of pass {run_id} ({e.response.status_code}), abandoning it")
+                        await update_reconcile_run(run_id, {"status": status, "last_error": f"Cursor rejected: {e.response.status_code}"})
+                        break
+                    raise
+                fetch = None
+
+                next_cursor = (page.get("pagination") or {}).get("after")
+                if next_cursor == cursor:
+                    next_cursor = None
+                if next_cursor and page_number < self.max_pages:
+                    # Fetched while this page is compared and written
+                    fetch = asyncio.create_task(self._fetch_page(next_cursor, self.page_delay))
+
+                page_counts, drift_seconds = await self._reconcile_page(page.get("data") or [])
+                counters.update(page_counts)
+                this_run.update(page_counts)
+                pages += 1
+                max_drift_seconds = max(max_drift_seconds, drift_seconds)
+                cursor = next_cursor
+                status = RUN_IN_PROGRESS if cursor else RUN_COMPLETED
+
+                await update_reconcile_run(run_id, {
+                    **counters,
+                    "cursor": cursor,
+                    "pages": pages,
+                    "max_drift_seconds": max_drift_seconds,
+                    "status": status,
+                    "last_error": None,
+                })
+                if fetch is None:
+                    break
+        except Exception as e:
+            logger.error(f"[❌ reconcile] Pass {run_id} stopped at page {pages + 1}: {e}")
+            try:
+                await update_reconcile_run(run_id, {"last_error": str(e)[:500]})
+            except Exception as update_error:
+                logger.error(f"[❌ reconcile] Could not record the error of pass {run_id}: {update_error}")
+            raise
+        finally:
+            if fetch is not None:
+                fetch.cancel()
+                await asyncio.gather(fetch, return_exceptions=True)
+
+        if status == RUN_COMPLETED:
+            self.passes_completed += 1
+        self.totals.update(this_run)
+        summary = {
+            "run_id": run_id,
+            "status": status,
+            "pages": pages,
+            "duration_ms": round((time.perf_counter() - start) * 1000),
+            **{name: this_run[name] for name in COUNTERS},
+        }
+        logger.info(
+            f"[🧮 reconcile] Pass {run_id} {status}: {this_run['vehicles_seen']} seen, "
+            f"{this_run['vehicles_missing']} missing, {this_run['vehicles_changed']} changed, "
+            f"{this_run['vehicles_owner_changed']} moved, {this_run['vehicles_written']} written "
+            f"in {summary['duration_ms']} ms"
+        )
+        return summary
+
+    async def _reconcile_page(self, vehicles: list[dict]) -> tuple[Counter, int]:
+        """
+        Compares one page of Enode vehicles with the stored rows and writes the
+        ones that differ. Returns the page's counters and the age in seconds of
+        the oldest drifted row.
+        """
+        counts: Counter = Counter()
+        by_id = {v["id"]: v for v in vehicles if v.get("id") and v.get("userId")}
+        counts["vehicles_seen"] = len(by_id)
+        if not by_id:
+            return counts, 0
+
+        stored = {row["vehicle_id"]: row for row in await get_vehicle_hashes_by_vehicle_ids(list(by_id))}
+        # Vehicles can only be stored for users we know (users.id is a foreign key)
+        new_owners = {
+            v["userId"] for vehicle_id, v in by_id.items()
+            if stored.get(vehicle_id, {}).get("user_id") != v["userId"]
+        }
+        known_users = await get_existing_user_ids(list(new_owners)) if new_owners else set()
+
+        now = datetime.now(timezone.utc)
+        max_drift_seconds = 0
+        to_write = []
+        for vehicle_id, vehicle in by_id.items():
+            row = stored.get(vehicle_id)
+            owner_changed = row is not None and row.get("user_id") != vehicle["userId"]
+            if row is not None and not owner_changed and row.get("cache_hash") == vehicle_digest(flatten_vehicle(vehicle)):
+                counts["vehicles_unchanged"] += 1
+                continue
+            if (row is None or owner_changed) and vehicle["userId"] not in known_users:
+                counts["vehicles_unknown_user"] += 1
+                continue
+
+            if row is None:
+                counts["vehicles_missing"] += 1
+            elif owner_changed:
+                counts["vehicles_owner_changed"] += 1
+            else:
+                counts["vehicles_changed"] += 1
+            updated_at = parse_updated_at(row.get("updated_at")) if row else None
+            if updated_at:
+                max_drift_seconds = max(max_drift_seconds, int((now - updated_at).total_seconds()))
+            to_write.append(vehicle)
+
+        if to_write:
+            counts["vehicles_written"] = await save_vehicles(to_write)
+        return counts, max_drift_seconds
+
+
+enode_reconciler = EnodeReconciler(
+    interval=ENODE_RECONCILE_INTERVAL_SECONDS,
+    page_size=ENODE_RECONCILE_PAGE_SIZE,
+    max_pages=ENODE_RECONCILE_MAX_PAGES_PER_RUN,
+    page_delay=ENODE_RECONCILE_PAGE_DELAY_SECONDS,
+)
@@ -0,0 +1,244 @@
+"""
+backend/app/services/ha_push.py
+
+Pushes Enode events to the Home Assistant webhook configured by each user.
+
+Pushes are fire-and-forget for the caller: `HAPushDispatcher.submit` only
+schedules a delivery task. Deliveries share one keep-alive HTTP client, are
+capped per Home Assistant host and globally, use short timeouts and are
+retried with exponential backoff. The number of pending deliveries
+(in flight or waiting for a retry) is bounded per user, so a slow or
+unreachable Home Assistant instance can only ever hold up and drop its own
+pushes; a global bound is kept as a backstop.
+"""
+import asyncio
+import logging
+import random
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.config import (
+    HA_PUSH_CONCURRENCY,
+    HA_PUSH_CONNECT_TIMEOUT_SECONDS,
+    HA_PUSH_MAX_ATTEMPTS,
+    HA_PUSH_MAX_PENDING,
+    HA_PUSH_MAX_PENDING_PER_USER,
+    HA_PUSH_PER_HOST_CONCURRENCY,
+    HA_PUSH_RETRY_BACKOFF_SECONDS,
+    HA_PUSH_TIMEOUT_SECONDS,
+)
+from app.storage.user import get_ha_push_target, ha_push_target_cache
+
+logger = logging.getLogger(__name__)
+
+
+class _RetryableError(Exception):
+    pass
+
+
+class HAPushDispatcher:
+    """Bounded, concurrency-limited delivery of events to Home Assistant webhooks."""
+
+    def __init__(
+        self,
+        concurrency: int,
+        per_host_concurrency: int,
+        connect_timeout: float,
+        timeout: float,
+        max_attempts: int,
+        retry_backoff: float,
+        max_pending: int,
+        max_pending_per_user: int,
+    ):
+        self.concurrency = concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.max_pending = max_pending
+        self.max_pending_per_user = max_pending_per_user
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # host -> (semaphore, deliveries using it); dropped when unused
+        self._host_semaphores: dict[str, tuple[asyncio.Semaphore, int]] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._pending_by_user: dict[str, int] = {}
+
+        self.submitted = 0
+        self.delivered = 0
+        self.failed = 0
+        self.retries = 0
+        self.dropped = 0
+        self.skipped = 0
+
+    async def start(self) -> None:
+        """Creates the shared HTTP client. Called from the application lifespan."""
+        if self._client is not None:
+            return
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+        )
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        logger.info(
+            "[🏠 ha push] Dispatcher started (concurrency=%d, per_host=%d, max_pending=%d, per_user=%d)",
+            self.concurrency,
+            self.per_host_concurrency,
+            self.max_pending,
+            self.max_pending_per_user,
+        )
+
+    async def stop(self, grace_seconds: float = 5.0) -> None:
+        """Gives pending deliveries a short grace period, then cancels them and closes the client."""
+        if self._client is None:
+            return
+        if self._tasks:
+            _, still_pending = await asyncio.wait(set(self._tasks), timeout=grace_seconds)
+            for task in still_pending:
+                task.cancel()
+            if still_pending:
+                await asyncio.gather(*still_pending, return_exceptions=True)
+                logger.warning("[⚠️ ha push] Cancelled %d pending push(es) on shutdown", len(still_pending))
+        await self._client.aclose()
+        self._client = None
+        self._host_semaphores.clear()
+        logger.info("[🏠 ha push] Dispatcher stopped")
+
+    def submit(self, event: dict, user_id: Optional[str]) -> bool:
+        """
+        Schedules an event for delivery to the user's Home Assistant.
+        Never blocks; returns False if the push was dropped.
+        """
+        if not user_id:
+            # System events (e.g. heartbeats) have no user to push to
+            return False
+        user_pending = self._pending_by_user.get(user_id, 0)
+        if (
+            self._client is None
+            or user_pending >= self.max_pending_per_user
+            or len(self._tasks) >= self.max_pending
+        ):
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 100 == 0:
+                logger.warning("[⚠️ ha push] Dropping push for user %s, %d dropped so far", user_id, self.dropped)
+            return False
+
+        self.submitted += 1
+        self._pending_by_user[user_id] = user_pending + 1
+        task = asyncio.create_task(self._deliver(event, user_id))
+        self._tasks.add(task)
+        task.add_done_callback(lambda t: self._finished(t, user_id))
+        return True
+
+    def stats(self) -> dict:
+        """Returns delivery counters and the target cache statistics."""
+        return {
+            "pending": len(self._tasks),
+            "max_pending": self.max_pending,
+            "max_pending_per_user": self.max_pending_per_user,
+            "users": len(self._pending_by_user),
+            "hosts": len(self._host_semaphores),
+            "submitted": self.submitted,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "retries": self.retries,
+            "dropped": self.dropped,
+            "skipped": self.skipped,
+            "target_cache": ha_push_target_cache.stats(),
+        }
+
+    async def _deliver(self, event: dict, user_id: str) -> None:
+        try:
+            target = await get_ha_push_target(user_id)
+        except Exception as e:
+            self.failed += 1
+            logger.error("Failed to load HA push settings for user %s: %s", user_id, e)
+            return
+
+        if not target or target.get("tier") != "pro":
+            self.skipped += 1
+            logger.info("Webhook push skipped for user %s: Not a Pro tier user.", user_id)
+            return
+        if not target.get("ha_webhook_id") or not target.get("ha_external_url"):
+            self.skipped += 1
+            logger.error("HA Webhook ID/URL missing in database for user_id=%s", user_id)
+            return
+
+        url = f"{target['ha_external_url'].rstrip('/')}/api/webhook/{target['ha_webhook_id']}"
+        host = urlsplit(url).netloc
+        host_semaphore = self._acquire_host(host)
+        try:
+            await self._attempt(url, event, user_id, host_semaphore)
+        finally:
+            self._release_host(host)
+
+    async def _attempt(self, url: str, event: dict, user_id: str, host_semaphore: asyncio.Semaphore) -> None:
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                async with host_semaphore, self._semaphore:
+                    await self._post(url, event)
+                self.delivered += 1
+                logger.info("Successfully pushed event to HA for user %s", user_id)
+                return
+            except _RetryableError as e:
+                if attempt == self.max_attempts:
+                    self.failed += 1
+                    logger.error("Failed to push to HA webhook for user %s after %d attempt(s): %s", user_id, attempt, e)
+                    return
+                self.retries += 1
+                # Back off outside the semaphores so other pushes keep flowing
+                delay = self.retry_backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+                logger.warning("HA push for user %s failed (%s), retrying in %.1fs", user_id, e, delay)
+                await asyncio.sleep(delay)
+            except Exception as e:
+                self.failed += 1
+                logger.error("Failed to push to HA webhook for user %s: %s", user_id, e)
+                return
+
+    def _finished(self, task: asyncio.Task, user_id: str) -> None:
+        self._tasks.discard(task)
+        remaining = self._pending_by_user.get(user_id, 0) - 1
+        if remaining > 0:
+            self._pending_by_user[user_id] = remaining
+        else:
+            self._pending_by_user.pop(user_id, None)
+
+    def _acquire_host(self, host: str) -> asyncio.Semaphore:
+        """Returns the host's semaphore, creating it for the first delivery to the host."""
+        semaphore, deliveries = self._host_semaphores.get(host) or (asyncio.Semaphore(self.per_host_concurrency), 0)
+        self._host_semaphores[host] = (semaphore, deliveries + 1)
+        return semaphore
+
+    def _release_host(self, host: str) -> None:
+        """Drops the host's semaphore once its last delivery is done."""
+        semaphore, deliveries = self._host_semaphores[host]
+        if deliveries > 1:
+            self._host_semaphores[host] = (semaphore, deliveries - 1)
+        else:
+            del self._host_semaphores[host]
+
+    async def _post(self, url: str, event: dict) -> None:
+        try:
+            resp = await self._client.post(url, json=event)
+        except httpx.TransportError as e:
+            # Connect/read timeouts and connection errors
+            raise _RetryableError(f"{type(e).__name__}: {e}") from e
+        if resp.status_code == 429 or resp.status_code >= 500:
+            raise _RetryableError(f"HTTP {resp.status_code}")
+        resp.raise_for_status()
+
+
+ha_push_dispatcher = HAPushDispatcher(
+    concurrency=HA_PUSH_CONCURRENCY,
+    per_host_concurrency=HA_PUSH_PER_HOST_CONCURRENCY,
+    connect_timeout=HA_PUSH_CONNECT_TIMEOUT_SECONDS,
+    timeout=HA_PUSH_TIMEOUT_SECONDS,
+    max_attempts=HA_PUSH_MAX_ATTEMPTS,
+    retry_backoff=HA_PUSH_RETRY_BACKOFF_SECONDS,
+    max_pending=HA_PUSH_MAX_PENDING,
+    max_pending_per_user=HA_PUSH_MAX_PENDING_PER_USER,
+)
@@ -0,0 +1,238 @@
+"""
+backend/app/services/log_retention.py
+
+Retention and compaction of the high-volume log tables.
+
+poll_logs, api_telemetry, webhook_logs, stripe_webhook_logs and status_logs
+only ever grow. Every run of this job, per source:
+
+1. rolls each finished UTC day not compacted yet into log_rollups (hour and
+   day buckets per key, user and vehicle), at most `max_days` days per run;
+2. clears the payloads of api_telemetry and stripe_webhook_logs rows older
+   than their payload retention;
+3. deletes the raw rows older than the source's retention. Only days that
+   are rolled up are ever deleted.
+
+Steps 2 and 3 run as statements of at most `batch_size` rows with a short
+pause between them, so the tables stay writable while a backlog is worked
+off. Readers use `get_log_activity`, which joins the rollups with the raw
+rows that are not compacted yet.
+"""
+import asyncio
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
+
+from app.config import (
+    API_TELEMETRY_PAYLOAD_RETENTION_DAYS,
+    API_TELEMETRY_RETENTION_DAYS,
+    LOG_COMPACTION_MAX_DAYS_PER_RUN,
+    LOG_RETENTION_BATCH_DELAY_SECONDS,
+    LOG_RETENTION_BATCH_SIZE,
+    LOG_RETENTION_INTERVAL_SECONDS,
+    LOG_RETENTION_MAX_BATCHES_PER_RUN,
+    POLL_LOGS_RETENTION_DAYS,
+    STATUS_LOGS_RETENTION_DAYS,
+    STRIPE_WEBHOOK_LOGS_RETENTION_DAYS,
+    STRIPE_WEBHOOK_PAYLOAD_RETENTION_DAYS,
+    WEBHOOK_LOGS_RETENTION_DAYS,
+)
+from app.storage.log_retention import (
+    LOG_SOURCES,
+    PAYLOAD_SOURCES,
+    compact_next_log_day,
+    prune_log_payloads,
+    prune_log_rows,
+)
+
+logger = logging.getLogger(__name__)
+
+# A day is compacted once it ended this long ago, so rows still buffered by
+# the telemetry writer or the webhook ingestor are included
+COMPACTION_GRACE = timedelta(hours=1)
+
+
+class LogRetentionInProgress(Exception):
+    pass
+
+
+class LogRetentionJob:
+    """Periodic compaction and bounded pruning of the log tables."""
+
+    def __init__(
+        self,
+        interval: float,
+        retention_days: dict[str, int],
+        payload_retention_days: dict[str, int],
+        batch_size: int,
+        max_batches: int,
+        batch_delay: float,
+        max_days: int,
+    ):
+        self.interval = interval
+        self.retention_days = retention_days
+        self.payload_retention_days = payload_retention_days
+        self.batch_size = max(1, batch_size)
+        self.max_batches = max(1, max_batches)
+        self.batch_delay = batch_delay
+        self.max_days = max(1, max_days)
+
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+        self.runs = 0
+        self.failed_sources = 0
+        self.totals: Counter = Counter()
+        self.last_run: Optional[dict] = None
+
+    async def start(self) -> None:
+        """Starts the periodic run. Called from the application lifespan."""
+        if self._task is not None or self.interval <= 0:
+            return
+        self._stopping = asyncio.Event()
+        self._task = asyncio.create_task(self._loop(), name="log-retention")
+        logger.info(
+            "[🧹 log retention] Started (every %.0fs, batches of %d, retention %s)",
+            self.interval,
+            self.batch_size,
+            self.retention_days,
+        )
+
+    async def stop(self) -> None:
+        """Stops the periodic run; each batch is its own statement, so a cancelled run loses nothing."""
+        if self._task is None:
+            return
+        self._stopping.set()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        logger.info("[🧹 log retention] Stopped")
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    async def run_once(self) -> dict:
+        """
+        Compacts and prunes every source once and returns what was done per
+        source. Raises LogRetentionInProgress if a run is already going on.
+        """
+        if self._lock.locked():
+            raise LogRetentionInProgress("A log retention run is already in progress")
+        async with self._lock:
+            self.runs += 1
+            start = time.perf_counter()
+            now = datetime.now(timezone.utc)
+            sources = {}
+            for source in LOG_SOURCES:
+                sources[source] = await self._run_source(source, now)
+            summary = {
+                "started_at": now.isoformat(),
+                "duration_ms": round((time.perf_counter() - start) * 1000),
+                "sources": sources,
+            }
+            self.last_run = summary
+            return summary
+
+    def stats(self) -> dict:
+        """Returns run counters and the rows handled since the process started."""
+        return {
+            "running": self.running,
+            "runs": self.runs,
+            "failed_sources": self.failed_sources,
+            "retention_days": self.retention_days,
+            "payload_retention_days": self.payload_retention_days,
+            "totals": dict(self.totals),
+            "last_run": self.last_run,
+        }
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.run_once()
+            except LogRetentionInProgress:
+                pass
+            except Exception as e:
+                logger.error(f"[❌ log retention] Run failed: {e}")
+
+    async def _run_source(self, source: str, now: datetime) -> dict:
+        """Compacts, then prunes one source. A failure is recorded and the other sources still run."""
+        result = {"days_compacted": [], "payloads_cleared": 0, "rows_pruned": 0}
+        try:
+            until = (now - COMPACTION_GRACE).date()
+            for _ in range(self.max_days):
+                day = await compact_next_log_day(source, until)
+                if not day:
+                    break
+                result["days_compacted"].append(day)
+
+            payload_days = self.payload_retention_days.get(source, 0)
+            if source in PAYLOAD_SOURCES and payload_days > 0:
+                result["payloads_cleared"] = await self._in_batches(
+                    prune_log_payloads, source, now - timedelta(days=payload_days)
+                )
+
+            retention_days = self.retention_days.get(source, 0)
+            if retention_days > 0:
+                result["rows_pruned"] = await self._in_batches(
+                    prune_log_rows, source, now - timedelta(days=retention_days)
+                )
+        except Exception as e:
+            self.failed_sources += 1
+            result["error"] = str(e)[:500]
+            logger.error(f"[❌ log retention] {source}: {e}")
+
+        self.totals[f"{source}.days_compacted"] += len(result["days_compacted"])
+        self.totals[f"{source}.payloads_cleared"] += result["payloads_cleared"]
+        self.totals[f"{source}.rows_pruned"] += result["rows_pruned"]
+        if result["days_compacted"] or result["payloads_cleared"] or result["rows_pruned"]:
+            logger.info(
+                f"[🧹 log retention] {source}: {len(result['days_compacted'])} day(s) compacted, "
+                f"{result['payloads_cleared']} payload(s) cleared, {result['rows_pruned']} row(s) pruned"
+            )
+        return result
+
+    async def _in_batches(
+        self,
+        prune: Callable[[str, datetime, int], Awaitable[int]],
+        source: str,
+        before: datetime,
+    ) -> int:
+        """Calls `prune` until a batch comes back short or `max_batches` were run; returns the rows handled."""
+        total = 0
+        for batch in range(self.max_batches):
+            if batch and self.batch_delay:
+                await asyncio.sleep(self.batch_delay)
+            handled = await prune(source, before, self.batch_size)
+            total += handled
+            if handled < self.batch_size:
+                break
+        return total
+
+
+log_retention_job = LogRetentionJob(
+    interval=LOG_RETENTION_INTERVAL_SECONDS,
+    retention_days={
+        "poll_logs": POLL_LOGS_RETENTION_DAYS,
+        "api_telemetry": API_TELEMETRY_RETENTION_DAYS,
+        "webhook_logs": WEBHOOK_LOGS_RETENTION_DAYS,
+        "stripe_webhook_logs": STRIPE_WEBHOOK_LOGS_RETENTION_DAYS,
+        "status_logs": STATUS_LOGS_RETENTION_DAYS,
+    },
+    payload_retention_days={
+        "api_telemetry": API_TELEMETRY_PAYLOAD_RETENTION_DAYS,
+        "stripe_webhook_logs": STRIPE_WEBHOOK_PAYLOAD_RETENTION_DAYS,
+    },
+    batch_size=LOG_RETENTION_BATCH_SIZE,
+    max_batches=LOG_RETENTION_MAX_BATCHES_PER_RUN,
+    batch_delay=LOG_RETENTION_BATCH_DELAY_SECONDS,
+    max_days=LOG_COMPACTION_MAX_DAYS_PER_RUN,
+)
@@ -0,0 +1,248 @@
+"""
+backend/app/services/rate_limiter.py
+
+Windowed poll counters for API-key rate limiting.
+
+Counting poll_logs rows over a 30-day window on every request gets slower as
+a user polls more. Instead, polls are counted in fixed per-day buckets for
+each user and each vehicle. Checking a window means summing at most ~31
+buckets, and recording a poll is a single increment.
+
+Buckets live either in process memory (single node) or in Redis (shared
+between workers). They are seeded from poll_logs the first time a key is seen
+and re-seeded every RATE_LIMIT_RECONCILE_SECONDS, so poll_logs stays the
+source of truth for billing and the counters cannot drift low for long.
+poll_logs rows are written after the response, so a seed merges into the
+existing buckets, keeping the higher count per day, rather than replacing
+them; otherwise polls still in flight would be lost from the counters.
+"""
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import redis.asyncio as redis
+
+from app.config import (
+    ENDPOINT_COST,
+    ENDPOINT_COST_NOT_MODIFIED,
+    NOT_MODIFIED_POLLS_COUNT,
+    RATE_LIMIT_BACKEND,
+    RATE_LIMIT_RECONCILE_SECONDS,
+    REDIS_URL,
+)
+from app.storage.poll_logs import count_polls_by_day, count_polls_since, count_polls_since_for_vehicle
+
+logger = logging.getLogger(__name__)
+
+# Buckets are kept a little longer than the longest window (30 days).
+BUCKET_RETENTION_DAYS = 32
+
+SCOPE_USER = "user"
+SCOPE_VEHICLE = "vehicle"
+
+
+def _day(ts: datetime) -> str:
+    return ts.astimezone(timezone.utc).date().isoformat()
+
+
+def _first_kept_day() -> str:
+    return _day(datetime.now(timezone.utc) - timedelta(days=BUCKET_RETENTION_DAYS))
+
+
+# Merges seeded counts into a bucket hash, keeping the higher count per day,
+# and drops days older than ARGV[1]. ARGV[2..] are day/count pairs.
+_MERGE_SEED_SCRIPT = """
+for _, day in ipairs(redis.call('HKEYS', KEYS[1])) do
+  if day < ARGV[1] then redis.call('HDEL', KEYS[1], day) end
+end
+for i = 2, #ARGV - 1, 2 do
+  local current = tonumber(redis.call('HGET', KEYS[1], ARGV[i]) or '0')
+  if tonumber(ARGV[i + 1]) > current then redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1]) end
+end
+return redis.call('HGETALL', KEYS[1])
+"""
+
+
+class InMemoryCounterBackend:
+    """Per-process daily buckets. Suitable for a single backend instance."""
+
+    name = "memory"
+
+    def __init__(self):
+        # key -> (reconcile_at, {day: count})
+        self._data: dict[str, tuple[float, dict[str, int]]] = {}
+        self._next_prune = 0.0
+
+    async def get_buckets(self, key: str) -> Optional[dict[str, int]]:
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    async def seed(self, key: str, buckets: dict[str, int], ttl: float) -> dict[str, int]:
+        now = time.monotonic()
+        if now >= self._next_prune:
+            self._prune(now, ttl)
+        first_day = _first_kept_day()
+        entry = self._data.get(key)
+        merged = {day: count for day, count in entry[1].items() if day >= first_day} if entry else {}
+        for day, count in buckets.items():
+            if count > merged.get(day, 0):
+                merged[day] = count
+        self._data[key] = (now + ttl, merged)
+        return merged
+
+    async def incr(self, key: str, day: str, amount: int) -> None:
+        entry = self._data.get(key)
+        if entry is None:
+            # Not seeded yet; the next read seeds from poll_logs, which includes this poll.
+            return
+        buckets = entry[1]
+        buckets[day] = buckets.get(day, 0) + amount
+        if len(buckets) > BUCKET_RETENTION_DAYS:
+            for old_day in sorted(buckets)[:-BUCKET_RETENTION_DAYS]:
+                del buckets[old_day]
+
+    def size(self) -> int:
+        return len(self._data)
+
+    def _prune(self, now: float, ttl: float) -> None:
+        """Drops keys not read for a whole reconcile period; they are reseeded when seen again."""
+        stale = [key for key, (reconcile_at, _) in self._data.items() if reconcile_at + ttl <= now]
+        for key in stale:
+            del self._data[key]
+        self._next_prune = now + ttl
+
+
+class RedisCounterBackend:
+    """Daily buckets in a Redis hash per key, shared by all workers."""
+
+    name = "redis"
+
+    def __init__(self, url: str):
+        self.url = url
+        self._client = None
+        self._merge_seed = None
+
+    async def _redis(self):
+        if self._client is None:
+            self._client = redis.from_url(self.url, decode_responses=True)
+            self._merge_seed = self._client.register_script(_MERGE_SEED_SCRIPT)
+        return self._client
+
+    async def get_buckets(self, key: str) -> Optional[dict[str, int]]:
+        client = await self._redis()
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.exists(f"ratelimit:{key}:seeded")
+            pipe.hgetall(f"ratelimit:{key}")
+            seeded, buckets = await pipe.execute()
+        if not seeded:
+            return None
+        return {day: int(count) for day, count in buckets.items()}
+
+    async def seed(self, key: str, buckets: dict[str, int], ttl: float) -> dict[str, int]:
+        client = await self._redis()
+        args = [_first_kept_day()]
+        for day, count in buckets.items():
+            args += [day, count]
+        # Atomic, so increments from other workers are never overwritten
+        merged = await self._merge_seed(keys=[f"ratelimit:{key}"], args=args)
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.expire(f"ratelimit:{key}", BUCKET_RETENTION_DAYS * 86400)
+            pipe.set(f"ratelimit:{key}:seeded", 1, ex=max(int(ttl), 1))
+            await pipe.execute()
+        return {merged[i]: int(merged[i + 1]) for i in range(0, len(merged), 2)}
+
+    async def incr(self, key: str, day: str, amount: int) -> None:
+        client = await self._redis()
+        await client.hincrby(f"ratelimit:{key}", day, amount)
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+class PollCounter:
+    """Counts polls per user and per vehicle over rolling windows of whole days."""
+
+    def __init__(self, backend, reconcile_seconds: float):
+        self.backend = backend
+        self.reconcile_seconds = reconcile_seconds
+        self.seeds = 0
+        self.fallbacks = 0
+
+    async def count_since(self, scope: str, ident: str, since: datetime) -> int:
+        """
+        Returns the number of polls for ``ident`` since the start of the UTC day of ``since``.
+        Falls back to an exact poll_logs count if the counter backend is unavailable.
+        """
+        key = f"{scope}:{ident}"
+        try:
+            buckets = await self.backend.get_buckets(key)
+            if buckets is None:
+                buckets = await self._seed(scope, ident, key)
+        except Exception as e:
+            self.fallbacks += 1
+            logger.warning("[⚠️ rate_limiter] Counter backend failed for %s, counting poll_logs: %s", key, e)
+            if scope == SCOPE_VEHICLE:
+                return await count_polls_since_for_vehicle(ident, since, include_not_modified=NOT_MODIFIED_POLLS_COUNT)
+            return await count_polls_since(ident, since, include_not_modified=NOT_MODIFIED_POLLS_COUNT)
+
+        first_day = _day(since)
+        return sum(count for day, count in buckets.items() if day >= first_day)
+
+    async def record(self, scope: str, ident: str, when: datetime, amount: int = 1) -> None:
+        """Adds ``amount`` polls to today's bucket. Never raises."""
+        try:
+            await self.backend.incr(f"{scope}:{ident}", _day(when), amount)
+        except Exception as e:
+            logger.warning("[⚠️ rate_limiter] Failed to record poll for %s:%s: %s", scope, ident, e)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "keys": self.backend.size(),
+            "reconcile_seconds": self.reconcile_seconds,
+            "seeds": self.seeds,
+            "fallbacks": self.fallbacks,
+        }
+
+    async def _seed(self, scope: str, ident: str, key: str) -> dict[str, int]:
+        since = datetime.now(timezone.utc) - timedelta(days=BUCKET_RETENTION_DAYS)
+        if scope == SCOPE_VEHICLE:
+            buckets = await count_polls_by_day(since, vehicle_id=ident, include_not_modified=NOT_MODIFIED_POLLS_COUNT)
+        else:
+            buckets = await count_polls_by_day(since, user_id=ident, include_not_modified=NOT_MODIFIED_POLLS_COUNT)
+        buckets = await self.backend.seed(key, buckets, self.reconcile_seconds)
+        self.seeds += 1
+        logger.debug("[rate_limiter] Seeded %s from poll_logs (%d day(s))", key, len(buckets))
+        return buckets
+
+
+def endpoint_cost(path: str, not_modified: bool = False) -> int:
+    """
+    Token cost of a request to `path`. 304 answers use ENDPOINT_COST_NOT_MODIFIED
+    and fall back to ENDPOINT_COST for prefixes it does not list.
+    """
+    if not_modified:
+        for prefix, cost in ENDPOINT_COST_NOT_MODIFIED.items():
+            if path.startswith(prefix):
+                return cost
+    for prefix, cost in ENDPOINT_COST.items():
+        if path.startswith(prefix):
+            return cost
+    return 0
+
+
+def counts_against_allowance(not_modified: bool) -> bool:
+    """Full responses always count; 304 answers only with NOT_MODIFIED_POLLS_COUNT."""
+    return not not_modified or NOT_MODIFIED_POLLS_COUNT
+
+
+def _create_backend():
+    if RATE_LIMIT_BACKEND == "redis":
+        return RedisCounterBackend(REDIS_URL)
+    return InMemoryCounterBackend()
+
+
+poll_counter = PollCounter(_create_backend(), reconcile_seconds=RATE_LIMIT_RECONCILE_SECONDS)
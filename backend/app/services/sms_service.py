@@ -23,6 +23,7 @@ from ..config import (
     TWILIO_FROM_NUMBER,
     REDIS_URL
 )
+from ..lib.api_key_utils import invalidate_api_key_user
 from ..lib.supabase import get_supabase_admin_client
 
 logger = logging.getLogger(__name__)
@@ -340,6 +341,7 @@ class SMSService:
                 result = supabase.table("users").update(update_payload).eq("id", user_id).execute()
             
             if result.data:
+                invalidate_api_key_user(user_id)
                 # Clean up verification data
                 await redis_client.delete(key)
                 
@@ -0,0 +1,128 @@
+"""
+backend/app/services/status_panel.py
+
+Data for the public status panel (/public/status/webhook).
+
+The panel shows one ok/failed square per UTC day and the uptime over the
+range. Both come from the per-day check counts of `get_status_daily_summary`,
+fetched in a single call for the days that are not cached. A day's counts
+no longer change once it has ended, so finished days stay cached until
+evicted; only the current day is reloaded, every `recent_ttl` seconds. A
+90-day panel therefore costs at most one small query per minute.
+"""
+import asyncio
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Hashable
+
+from app.config import STATUS_PANEL_CACHE_MAXSIZE, STATUS_PANEL_RECENT_TTL_SECONDS
+from app.lib.ttl_cache import TTLCache
+from app.storage.status_logs import get_status_daily_summary
+
+logger = logging.getLogger(__name__)
+
+# A day is final once it ended this long ago (checks are logged with the time they ran)
+FINAL_AFTER = timedelta(minutes=10)
+# Finished days are kept this long, i.e. until evicted
+FINAL_TTL_SECONDS = 400 * 24 * 3600
+# Longest range served, in days
+MAX_DAYS = 366
+
+
+def _utc_day(value: datetime) -> date:
+    """The UTC day of a datetime; naive datetimes are taken as UTC."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+
+class StatusPanelCache:
+    """Per-category, per-day check counts, cached for good once the day is over."""
+
+    def __init__(self, recent_ttl: float, maxsize: int):
+        # (category, day) -> (checks, failed); finished days only leave by eviction
+        self._final = TTLCache(maxsize=maxsize, ttl=FINAL_TTL_SECONDS)
+        self._recent = TTLCache(maxsize=maxsize, ttl=recent_ttl)
+        self._loading: dict[Hashable, asyncio.Task] = {}
+
+        self.loads = 0
+        self.failed_loads = 0
+
+    async def get_panel(self, category: str, from_date: datetime, to_date: datetime) -> list[dict]:
+        """Returns the status panel of a category: uptime and one entry per day with checks."""
+        now = datetime.now(timezone.utc)
+        first, last = _utc_day(from_date), min(_utc_day(to_date), now.date())
+        first = max(first, last - timedelta(days=MAX_DAYS - 1))
+        final_before = (now - FINAL_AFTER).date()
+
+        counts: dict[date, tuple[int, int]] = {}
+        missing: list[date] = []
+        day = first
+        while day <= last:
+            cache = self._final if day < final_before else self._recent
+            entry = cache.get((category, day))
+            if entry is None:
+                missing.append(day)
+            else:
+                counts[day] = entry
+            day += timedelta(days=1)
+
+        if missing:
+            loaded = await asyncio.shield(self._load(category, missing[0], missing[-1]))
+            for day in missing:
+                entry = loaded.get(day, (0, 0))
+                counts[day] = entry
+                (self._final if day < final_before else self._recent).set((category, day), entry)
+
+        total = sum(checks for checks, _ in counts.values())
+        total_failed = sum(failed for _, failed in counts.values())
+        uptime = round((total - total_failed) / total * 100, 2) if total else 100.0  # No data = assume 100% uptime
+
+        logger.debug(f"[📊] Status panel for {category}: {len(counts)} days ({len(missing)} loaded), uptime {uptime}%")
+        return [{
+            "category": category,
+            "uptime": uptime,
+            "days": [
+                {"date": day.isoformat(), "ok": failed == 0}
+                for day, (checks, failed) in sorted(counts.items())
+                if checks
+            ],
+        }]
+
+    def stats(self) -> dict:
+        """Returns load counters and the state of both caches."""
+        return {
+            "loads": self.loads,
+            "failed_loads": self.failed_loads,
+            "loading": len(self._loading),
+            "final_days": self._final.stats(),
+            "recent_days": self._recent.stats(),
+        }
+
+    def _load(self, category: str, first: date, last: date) -> asyncio.Task:
+        """Starts a load of the range unless the same one is running; returns the running one."""
+        key = (category, first, last)
+        task = self._loading.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key))
+            self._loading[key] = task
+        return task
+
+    async def _fetch(self, key: tuple[str, date, date]) -> dict[date, tuple[int, int]]:
+        category, first, last = key
+        try:
+            rows = await get_status_daily_summary(category, first, last)
+        except Exception as e:
+            self.failed_loads += 1
+            logger.error(f"[❌ status panel] Failed to load {category} {first}..{last}: {e}")
+            raise
+        finally:
+            self._loading.pop(key, None)
+        self.loads += 1
+        return {date.fromisoformat(row["day"]): (row["checks"], row["failed"]) for row in rows}
+
+
+status_panel_cache = StatusPanelCache(
+    recent_ttl=STATUS_PANEL_RECENT_TTL_SECONDS,
+    maxsize=STATUS_PANEL_CACHE_MAXSIZE,
+)
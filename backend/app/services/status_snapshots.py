@@ -0,0 +1,230 @@
+"""
+backend/app/services/status_snapshots.py
+
+Pre-encoded response bodies for the vehicle status endpoints.
+
+`/api/ha/status/{id}` and `/api/status/{id}` are polled far more often than
+vehicle data changes. For each vehicle and endpoint this store keeps the
+serialized JSON body together with its ETag and Last-Modified values, so
+conditional requests can be answered with a 304 without building anything. A
+snapshot is valid for as long as the row's `updated_at` matches the one it
+was built from, so a write from any worker is picked up on the next poll.
+Writes in this process rebuild the snapshot right away.
+"""
+import hashlib
+import json
+import logging
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Callable, Optional
+
+from fastapi import Request, Response
+
+from app.config import STATUS_SNAPSHOT_MAXSIZE
+from app.lib.timestamps import parse_updated_at
+from app.lib.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+KIND_HA = "ha"
+KIND_LEGACY = "legacy"
+
+
+def build_ha_status(cache: dict) -> dict:
+    """Response of /api/ha/status/{vehicle_id}."""
+    info = cache.get("information", {})
+    return {
+        "vehicleName": f"{info.get('brand', '')} {info.get('model', '')}",
+        "isReachable": cache.get("isReachable"),
+        "chargeState": cache.get("chargeState", {}),
+        "information": info,
+        "location": cache.get("location", {}),
+        "odometer": cache.get("odometer", {}),
+        "vendor": cache.get("vendor"),
+        "smartChargingPolicy": cache.get("smartChargingPolicy", {}),
+        "capabilities": cache.get("capabilities", {}),
+        "lastSeen": cache.get("lastSeen"),
+    }
+
+
+def build_legacy_status(cache: dict) -> dict:
+    """Response of /api/status/{vehicle_id}."""
+    charge = cache.get("chargeState", {})
+    info = cache.get("information", {})
+    location = cache.get("location", {})
+    return {
+        # legacy keys (to be removed later)
+        "batteryLevel": charge.get("batteryLevel"),
+        "range": charge.get("range"),
+        "isCharging": charge.get("isCharging"),
+        "isPluggedIn": charge.get("isPluggedIn"),
+        "chargingState": charge.get("powerDeliveryState"),
+        # old keys (to be used in Home Assistant)
+        "vehicleName": f"{info.get('brand', '')} {info.get('model', '')}",
+        "latitude": location.get("latitude"),
+        "longitude": location.get("longitude"),
+        "lastSeen": cache.get("lastSeen"),
+        "isReachable": cache.get("isReachable"),
+        # new full block for future Home Assistant sensors
+        "chargeState": charge,
+        "information": info,
+        "location": location,
+        "odometer": cache.get("odometer", {}),
+        "vendor": cache.get("vendor"),
+        "smartChargingPolicy": cache.get("smartChargingPolicy", {}),
+    }
+
+
+BUILDERS: dict[str, Callable[[dict], dict]] = {
+    KIND_HA: build_ha_status,
+    KIND_LEGACY: build_legacy_status,
+}
+
+
+def body_etag(body: bytes) -> str:
+    """Strong ETag of an encoded response body."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def encode_body(payload: Any) -> tuple[bytes, str]:
+    """Encodes a JSON response body the way JSONResponse does and returns it with its strong ETag."""
+    body = json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+    return body, body_etag(body)
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """
+    Evaluates If-None-Match (weak comparison, RFC 9110) and, when it is absent,
+    If-Modified-Since against a response's validators.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return etag in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime]) -> dict[str, str]:
+    """ETag and, when known, Last-Modified headers."""
+    headers = {"ETag": etag}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    return headers
+
+
+def not_modified_response(etag: str, last_modified: Optional[datetime]) -> Response:
+    """304 response carrying the validators of the unchanged representation."""
+    return Response(status_code=304, headers=validator_headers(etag, last_modified))
+
+
+class StatusSnapshot:
+    """Encoded status body of one vehicle plus its validators."""
+
+    __slots__ = ("user_id", "updated_at", "body", "etag", "last_modified")
+
+    def __init__(self, user_id: str, updated_at: Optional[datetime], body: bytes, etag: str, last_modified: datetime):
+        self.user_id = user_id
+        self.updated_at = updated_at
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def headers(self) -> dict[str, str]:
+        return validator_headers(self.etag, self.last_modified)
+
+    def to_response(self, request: Optional[Request] = None) -> Response:
+        """
+        Returns the pre-encoded body as a JSON response, or a 304 when the
+        request's conditional headers match this snapshot.
+        """
+        if request is not None and is_not_modified(request, self.etag, self.last_modified):
+            return not_modified_response(self.etag, self.last_modified)
+        return Response(content=self.body, media_type="application/json", headers=self.headers())
+
+
+class StatusSnapshotStore:
+    """LRU of status snapshots keyed by (kind, vehicles.id)."""
+
+    def __init__(self, maxsize: int):
+        self._snapshots = TTLCache(maxsize=maxsize, ttl=24 * 3600)
+        # Enode vehicle_id -> vehicles.id, so writes can find the snapshots to rebuild
+        self._db_ids = TTLCache(maxsize=maxsize, ttl=24 * 3600)
+
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.builds = 0
+        self.rebuilt_on_write = 0
+
+    def get(self, kind: str, db_id: str, updated_at: Any) -> Optional[StatusSnapshot]:
+        """Returns the snapshot if it was built from the row version `updated_at`."""
+        snapshot = self._snapshots.get((kind, db_id))
+        if snapshot is None:
+            self.misses += 1
+            return None
+        if snapshot.updated_at != parse_updated_at(updated_at):
+            self.stale += 1
+            return None
+        self.hits += 1
+        return snapshot
+
+    def put(self, kind: str, row: dict, cache: dict) -> StatusSnapshot:
+        """Builds, stores and returns the snapshot of a `vehicles` row and its vehicle object."""
+        db_id = row["id"]
+        body, etag = encode_body(BUILDERS[kind](cache))
+        updated_at = parse_updated_at(row.get("updated_at"))
+
+        # Last-Modified moves only when the body does, not on refresh-only writes
+        previous = self._snapshots.get((kind, db_id))
+        if previous is not None and previous.etag == etag:
+            last_modified = previous.last_modified
+        else:
+            last_modified = (updated_at or datetime.now(timezone.utc)).replace(microsecond=0)
+
+        snapshot = StatusSnapshot(row.get("user_id"), updated_at, body, etag, last_modified)
+        self._snapshots.set((kind, db_id), snapshot)
+        if row.get("vehicle_id"):
+            self._db_ids.set(row["vehicle_id"], db_id)
+        self.builds += 1
+        return snapshot
+
+    def on_vehicle_written(self, row: dict, cache: dict) -> None:
+        """
+        Rebuilds the snapshots of a vehicle just written by this process from
+        the written `vehicles` row and the status fields of its vehicle object.
+        """
+        db_id = self._db_ids.get(row["vehicle_id"])
+        if db_id is None:
+            return
+        for kind in BUILDERS:
+            if self._snapshots.get((kind, db_id)) is not None:
+                self.put(kind, {**row, "id": db_id}, cache)
+                self.rebuilt_on_write += 1
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the number of stored snapshots."""
+        lookups = self.hits + self.misses + self.stale
+        return {
+            "snapshots": self._snapshots.stats()["size"],
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "builds": self.builds,
+            "rebuilt_on_write": self.rebuilt_on_write,
+        }
+
+
+status_snapshots = StatusSnapshotStore(maxsize=STATUS_SNAPSHOT_MAXSIZE)
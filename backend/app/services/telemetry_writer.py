@@ -0,0 +1,193 @@
+"""
+backend/app/services/telemetry_writer.py
+
+Batched, non-blocking writer for the api_telemetry table.
+
+Requests only put a row on a bounded in-process queue. A single background
+task drains the queue and bulk-inserts rows once a batch is full or the flush
+interval has passed. When the queue is full, rows are dropped and counted
+instead of slowing down the request path.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from app.config import (
+    TELEMETRY_BATCH_SIZE,
+    TELEMETRY_FLUSH_INTERVAL_SECONDS,
+    TELEMETRY_QUEUE_MAXSIZE,
+)
+from app.storage.telemetry import insert_api_telemetry_batch
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class TelemetryWriter:
+    """Bounded queue plus background flusher for api_telemetry rows."""
+
+    def __init__(self, batch_size: int, flush_interval: float, max_queue_size: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # Rows taken off the queue but not yet handed to the database
+        self._pending: list[dict] = []
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushed_rows = 0
+        self.flushed_batches = 0
+        self.failed_rows = 0
+
+    async def start(self) -> None:
+        """Starts the background flusher. Called from the application lifespan."""
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._task = asyncio.create_task(self._run(), name="telemetry-writer")
+        logger.info(
+            "[📈 telemetry] Writer started (batch_size=%d, flush_interval=%.2fs, max_queue=%d)",
+            self.batch_size,
+            self.flush_interval,
+            self.max_queue_size,
+        )
+
+    async def stop(self) -> None:
+        """Stops the flusher and writes out everything still queued."""
+        if self._task is None:
+            return
+        # The flusher writes out its current batch and exits at this marker.
+        # Cancelling it instead can be swallowed by asyncio.wait_for on 3.11
+        # and leave shutdown waiting forever.
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+        # Detached first, so rows logged from here on are rejected by log()
+        # instead of landing on a queue nobody reads any more
+        queue, self._queue = self._queue, None
+        remaining, self._pending = self._pending, []
+        while not queue.empty():
+            remaining.append(queue.get_nowait())
+
+        for i in range(0, len(remaining), self.batch_size):
+            await self._flush(remaining[i:i + self.batch_size])
+        logger.info("[📈 telemetry] Writer stopped, flushed %d remaining row(s)", len(remaining))
+
+    def log(
+        self,
+        endpoint: str,
+        user_id: Optional[str],
+        vehicle_id: Optional[str],
+        status: int,
+        error_message: Optional[str],
+        duration_ms: int,
+        timestamp: str,
+        request_size: Optional[int] = None,
+        response_size: Optional[int] = None,
+        request_payload: Optional[dict | str] = None,
+        response_payload: Optional[str] = None,
+        cost_tokens: int = 0,
+    ) -> bool:
+        """
+        Queues a telemetry record for the next batch insert.
+        Never blocks; returns False if the record was dropped.
+        """
+        row = {
+            "endpoint":         endpoint,
+            "user_id":          user_id,
+            "vehicle_id":       vehicle_id,
+            "status":           status,
+            "error_message":    error_message,
+            "duration_ms":      duration_ms,
+            "timestamp":        timestamp,
+            "request_size":     request_size,
+            "response_size":    response_size,
+            "request_payload":  request_payload,
+            "response_payload": response_payload,
+            "cost_tokens":      cost_tokens,
+        }
+
+        if self._queue is None:
+            # Writer not running (lifespan not started or already stopped) – shed the row.
+            self.dropped += 1
+            return False
+
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning("[⚠️ telemetry] Queue full, %d row(s) dropped so far", self.dropped)
+            return False
+
+        self.enqueued += 1
+        return True
+
+    def stats(self) -> dict:
+        """Returns counters describing queue depth and flush results."""
+        return {
+            "queue_size": self._queue.qsize() if self._queue else 0,
+            "max_queue_size": self.max_queue_size,
+            "batch_size": self.batch_size,
+            "flush_interval_seconds": self.flush_interval,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "flushed_rows": self.flushed_rows,
+            "flushed_batches": self.flushed_batches,
+            "failed_rows": self.failed_rows,
+            "running": self._task is not None and not self._task.done(),
+        }
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            # Block until there is at least one row, then collect until the
+            # batch is full or the flush interval has passed.
+            row = await self._queue.get()
+            deadline = loop.time() + self.flush_interval
+
+            while row is not _STOP:
+                self._pending.append(row)
+                if len(self._pending) >= self.batch_size:
+                    break
+                try:
+                    row = self._queue.get_nowait()
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            stopping = row is _STOP
+
+            batch, self._pending = self._pending, []
+            await self._flush(batch)
+
+    async def _flush(self, batch: list[dict]) -> None:
+        if not batch:
+            return
+        try:
+            await insert_api_telemetry_batch(batch)
+            self.flushed_rows += len(batch)
+            self.flushed_batches += 1
+            logger.debug("[📈 telemetry] Flushed %d row(s)", len(batch))
+        except Exception as e:
+            self.failed_rows += len(batch)
+            logger.error("[❌ telemetry] Failed to insert batch of %d row(s): %s", len(batch), e)
+
+
+telemetry_writer = TelemetryWriter(
+    batch_size=TELEMETRY_BATCH_SIZE,
+    flush_interval=TELEMETRY_FLUSH_INTERVAL_SECONDS,
+    max_queue_size=TELEMETRY_QUEUE_MAXSIZE,
+)
@@ -0,0 +1,215 @@
+"""
+backend/app/services/vehicle_refresher.py
+
+Background refresh of users' vehicles from Enode.
+
+`GET /api/user/vehicles` serves the vehicle cache right away and, when it is
+older than CACHE_EXPIRATION_MINUTES, asks the refresher to update it. There
+is at most one refresh per user in flight, callers asking for the same user
+share it, and a user is not fetched again within `min_interval` seconds. A
+periodic sweep also refreshes the stale vehicles of users who polled the API
+recently, so active users rarely see stale data at all.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from app.config import (
+    CACHE_EXPIRATION_MINUTES,
+    VEHICLE_REFRESH_ACTIVE_WINDOW_MINUTES,
+    VEHICLE_REFRESH_CONCURRENCY,
+    VEHICLE_REFRESH_MIN_INTERVAL_SECONDS,
+    VEHICLE_REFRESH_SWEEP_LIMIT,
+    VEHICLE_REFRESH_SWEEP_SECONDS,
+)
+from app.enode.user import get_user_vehicles_enode
+from app.lib.ttl_cache import TTLCache
+from app.services.vehicle_updates import save_vehicles
+from app.storage.vehicle import get_vehicle_refresh_candidates
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshFailed(Exception):
+    """The user's last refresh failed and a new one is not allowed yet."""
+
+
+class VehicleRefresher:
+    """Deduplicated, concurrency-limited Enode refreshes plus a sweep over active users."""
+
+    def __init__(
+        self,
+        concurrency: int,
+        min_interval: float,
+        stale_after: float,
+        sweep_interval: float,
+        active_window: float,
+        sweep_limit: int,
+    ):
+        self.concurrency = concurrency
+        self.min_interval = min_interval
+        self.stale_after = stale_after
+        self.sweep_interval = sweep_interval
+        self.active_window = active_window
+        self.sweep_limit = sweep_limit
+
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._inflight: dict[str, asyncio.Task] = {}
+        # user_id -> (monotonic time of the last completed refresh, its error or None)
+        self._refreshed_at = TTLCache(maxsize=50000, ttl=max(min_interval, 1))
+        self._sweep_task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+        self.scheduled = 0
+        self.joined = 0
+        self.throttled = 0
+        self.refreshed = 0
+        self.failed = 0
+        self.vehicles_written = 0
+        self.sweeps = 0
+
+    async def start(self) -> None:
+        """Starts the sweep. Called from the application lifespan."""
+        if self._sweep_task is not None or self.sweep_interval <= 0:
+            return
+        self._stopping = asyncio.Event()
+        self._sweep_task = asyncio.create_task(self._sweep_loop(), name="vehicle-refresh-sweep")
+        logger.info(
+            "[🔄 vehicle refresh] Sweep started (every %.0fs, users active in the last %.0fs)",
+            self.sweep_interval,
+            self.active_window,
+        )
+
+    async def stop(self, grace_seconds: float = 5.0) -> None:
+        """Stops the sweep and gives running refreshes a short grace period."""
+        if self._sweep_task is not None:
+            self._stopping.set()
+            await self._sweep_task
+            self._sweep_task = None
+        if self._inflight:
+            _, still_pending = await asyncio.wait(set(self._inflight.values()), timeout=grace_seconds)
+            for task in still_pending:
+                task.cancel()
+            if still_pending:
+                await asyncio.gather(*still_pending, return_exceptions=True)
+                logger.warning("[⚠️ vehicle refresh] Cancelled %d refresh(es) on shutdown", len(still_pending))
+        logger.info("[🔄 vehicle refresh] Stopped")
+
+    def schedule(self, user_id: str) -> bool:
+        """
+        Starts a background refresh of the user's vehicles unless one is
+        running or the last one finished less than `min_interval` ago.
+        Never blocks; returns True if a refresh is running afterwards.
+        """
+        if user_id in self._inflight:
+            self.joined += 1
+            return True
+        if self._refreshed_at.get(user_id) is not None:
+            self.throttled += 1
+            return False
+        self.scheduled += 1
+        task = asyncio.create_task(self._refresh(user_id))
+        self._inflight[user_id] = task
+        task.add_done_callback(lambda t: self._on_done(user_id, t))
+        return True
+
+    async def refresh(self, user_id: str) -> None:
+        """
+        Refreshes the user's vehicles and waits for it, joining a refresh that
+        is already running. Raises if the Enode fetch or the write fails, and
+        RefreshFailed if no refresh may run yet because the last one failed.
+        """
+        self.schedule(user_id)
+        task = self._inflight.get(user_id)
+        if task is not None:
+            # Shielded so a caller that goes away does not cancel it for the others
+            await asyncio.shield(task)
+            return
+        last = self._refreshed_at.get(user_id)
+        if last is not None and last[1] is not None:
+            raise RefreshFailed(f"Last refresh of user {user_id} failed: {last[1]}")
+
+    def is_stale(self, updated_at: Optional[datetime]) -> bool:
+        """True if a cache entry written at `updated_at` should be refreshed."""
+        if updated_at is None:
+            return True
+        return datetime.now(timezone.utc) - updated_at >= timedelta(seconds=self.stale_after)
+
+    def stats(self) -> dict:
+        """Returns refresh counters."""
+        return {
+            "inflight": len(self._inflight),
+            "scheduled": self.scheduled,
+            "joined": self.joined,
+            "throttled": self.throttled,
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "vehicles_written": self.vehicles_written,
+            "sweeps": self.sweeps,
+            "sweep_running": self._sweep_task is not None and not self._sweep_task.done(),
+        }
+
+    def _on_done(self, user_id: str, task: asyncio.Task) -> None:
+        self._inflight.pop(user_id, None)
+        if not task.cancelled():
+            # Already logged in _refresh; retrieved so asyncio does not warn about it
+            task.exception()
+
+    async def _refresh(self, user_id: str) -> None:
+        async with self._semaphore:
+            start = time.perf_counter()
+            error = None
+            try:
+                vehicles = await get_user_vehicles_enode(user_id)
+                for vehicle in vehicles:
+                    vehicle["userId"] = user_id
+                written = await save_vehicles(vehicles)
+            except Exception as e:
+                self.failed += 1
+                error = e
+                logger.error(f"[❌ vehicle refresh] Failed to refresh vehicles for user {user_id}: {e}")
+                raise
+            finally:
+                self._refreshed_at.set(user_id, (time.monotonic(), error))
+            self.refreshed += 1
+            self.vehicles_written += written
+            logger.info(
+                f"[🔄 vehicle refresh] Refreshed {len(vehicles)} vehicle(s) for user {user_id} "
+                f"({written} written) in {(time.perf_counter() - start) * 1000:.0f} ms"
+            )
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.sweep_interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self._sweep()
+            except Exception as e:
+                logger.error(f"[❌ vehicle refresh] Sweep failed: {e}")
+
+    async def _sweep(self) -> None:
+        now = datetime.now(timezone.utc)
+        user_ids = await get_vehicle_refresh_candidates(
+            active_since=now - timedelta(seconds=self.active_window),
+            stale_before=now - timedelta(seconds=self.stale_after),
+            limit=self.sweep_limit,
+        )
+        scheduled = sum(self.schedule(user_id) for user_id in user_ids)
+        self.sweeps += 1
+        if user_ids:
+            logger.info(f"[🔄 vehicle refresh] Sweep found {len(user_ids)} active user(s) with stale vehicles, {scheduled} refresh(es) running")
+
+
+vehicle_refresher = VehicleRefresher(
+    concurrency=VEHICLE_REFRESH_CONCURRENCY,
+    min_interval=VEHICLE_REFRESH_MIN_INTERVAL_SECONDS,
+    stale_after=CACHE_EXPIRATION_MINUTES * 60,
+    sweep_interval=VEHICLE_REFRESH_SWEEP_SECONDS,
+    active_window=VEHICLE_REFRESH_ACTIVE_WINDOW_MINUTES * 60,
+    sweep_limit=VEHICLE_REFRESH_SWEEP_LIMIT,
+)
@@ -0,0 +1,261 @@
+"""
+backend/app/services/vehicle_stream.py
+
+In-process fan-out hub behind the `/api/ha/stream` Server-Sent Events endpoint.
+
+Every vehicle write that changes what Home Assistant shows is turned into one
+SSE frame, encoded once and handed to the queues of that user's subscribers,
+so the cost of a write does not depend on the number of open streams and
+streams cause no database reads after the initial state. Recent frames are
+kept in a ring buffer: a client that reconnects with `Last-Event-ID` gets the
+frames it missed, or the full state again when they are no longer buffered.
+
+Event IDs are `<epoch>-<sequence>`, where the epoch identifies this process.
+Streams only see writes made by the same process (the backend runs as a
+single uvicorn worker).
+"""
+import asyncio
+import json
+import logging
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from app.config import (
+    HA_STREAM_BUFFER_SIZE,
+    HA_STREAM_HEARTBEAT_SECONDS,
+    HA_STREAM_MAX_PER_USER,
+    HA_STREAM_QUEUE_SIZE,
+)
+from app.services.status_snapshots import build_ha_status
+
+logger = logging.getLogger(__name__)
+
+EVENT_STATE = "state"
+EVENT_DELTA = "delta"
+
+HEARTBEAT = b": ping\n\n"
+# Sent first on every stream: clients wait this long (ms) before reconnecting
+RETRY = b"retry: 5000\n\n"
+
+# Queued in place of the pending frames when a subscriber falls too far behind
+_OVERFLOW = object()
+
+
+class StreamLimitExceeded(Exception):
+    pass
+
+
+class _Subscriber:
+    __slots__ = ("user_id", "queue")
+
+    def __init__(self, user_id: str, queue_size: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+
+class _Stream:
+    """
+    The frames of one subscriber. Holds its slot from creation: `aclose()`
+    releases it even when the frames were never read, which an async
+    generator's `finally` cannot do.
+    """
+
+    def __init__(self, hub: "VehicleStreamHub", sub: _Subscriber, frames: AsyncIterator[bytes]):
+        self._hub = hub
+        self._sub = sub
+        self._frames = frames
+
+    def __aiter__(self) -> "_Stream":
+        return self
+
+    async def __anext__(self) -> bytes:
+        return await self._frames.__anext__()
+
+    async def aclose(self) -> None:
+        await self._frames.aclose()
+        self._hub._unsubscribe(self._sub)
+
+    def __del__(self) -> None:
+        # Last resort for a stream dropped without aclose()
+        self._hub._unsubscribe(self._sub)
+
+
+def state_payload(db_id: str, cache: dict, updated_at: Any) -> dict:
+    """Full status of one vehicle, in the shape of /api/ha/status/{vehicle_id}."""
+    return {"vehicleId": db_id, "updatedAt": updated_at, "status": build_ha_status(cache)}
+
+
+def delta_payload(db_id: str, cache: dict, changes: dict[str, Any], updated_at: Any) -> dict:
+    """Changed status fields of one vehicle, as flattened paths ("chargeState.batteryLevel")."""
+    changes = dict(changes)
+    if any(path.startswith("information.") for path in changes):
+        changes["vehicleName"] = build_ha_status(cache)["vehicleName"]
+    return {"vehicleId": db_id, "updatedAt": updated_at, "lastSeen": cache.get("lastSeen"), "changes": changes}
+
+
+class VehicleStreamHub:
+    """Fans vehicle updates out to SSE subscribers and buffers them for resumption."""
+
+    def __init__(self, buffer_size: int, queue_size: int, heartbeat_seconds: float, max_per_user: int):
+        self.queue_size = queue_size
+        self.heartbeat_seconds = heartbeat_seconds
+        self.max_per_user = max_per_user
+
+        self._epoch = uuid.uuid4().hex[:8]
+        self._seq = 0
+        # (sequence, user_id, frame), oldest first
+        self._buffer: deque[tuple[int, str, bytes]] = deque(maxlen=buffer_size)
+        self._subscribers: dict[str, set[_Subscriber]] = {}
+
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+        self.resumed = 0
+        self.full_states = 0
+        self.rejected = 0
+
+    def publish(self, user_id: str, event: str, payload: dict) -> None:
+        """Encodes one event and queues it for every stream of the user."""
+        self._seq += 1
+        frame = self._frame(event, payload, self._seq)
+        self._buffer.append((self._seq, user_id, frame))
+        self.published += 1
+
+        for sub in self._subscribers.get(user_id, ()):
+            try:
+                sub.queue.put_nowait(frame)
+                self.delivered += 1
+            except asyncio.QueueFull:
+                # The stream is closed and the client resumes from the buffer
+                self.overflows += 1
+                while not sub.queue.empty():
+                    sub.queue.get_nowait()
+                sub.queue.put_nowait(_OVERFLOW)
+
+    def publish_vehicle(
+        self,
+        user_id: str,
+        db_id: str,
+        cache: dict,
+        changes: Optional[dict[str, Any]],
+        updated_at: Any,
+    ) -> None:
+        """
+        Publishes a written vehicle: the changed fields when `changes` is known,
+        otherwise its full state. Nothing is sent if no status field changed.
+        """
+        if changes is None:
+            self.publish(user_id, EVENT_STATE, state_payload(db_id, cache, updated_at))
+        elif changes:
+            self.publish(user_id, EVENT_DELTA, delta_payload(db_id, cache, changes, updated_at))
+
+    def stream(
+        self,
+        user_id: str,
+        last_event_id: Optional[str],
+        load_state: Callable[[], Awaitable[list[dict]]],
+    ) -> _Stream:
+        """
+        Returns the SSE frames of one subscriber, which run until the client
+        disconnects or falls behind. `load_state` returns the state payloads
+        sent when the stream cannot be resumed from the buffer.
+        Raises StreamLimitExceeded when the user already has `max_per_user` streams.
+        The subscriber is registered here rather than when the frames are first
+        read, so concurrent calls cannot get past the limit together. It is
+        released when the frames end or the stream's `aclose()` is called,
+        which the caller must do even if it never reads them.
+        """
+        if len(self._subscribers.get(user_id, ())) >= self.max_per_user:
+            self.rejected += 1
+            raise StreamLimitExceeded(f"At most {self.max_per_user} streams per user")
+        sub, replay, start_seq = self._subscribe(user_id, last_event_id)
+        return _Stream(self, sub, self._run(sub, replay, start_seq, load_state))
+
+    def stats(self) -> dict:
+        """Returns subscriber and delivery counters."""
+        return {
+            "subscribers": sum(len(subs) for subs in self._subscribers.values()),
+            "users": len(self._subscribers),
+            "sequence": self._seq,
+            "buffered": len(self._buffer),
+            "published": self.published,
+            "delivered": self.delivered,
+            "overflows": self.overflows,
+            "resumed": self.resumed,
+            "full_states": self.full_states,
+            "rejected": self.rejected,
+        }
+
+    def _frame(self, event: str, payload: dict, seq: int) -> bytes:
+        data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str)
+        return f"id: {self._epoch}-{seq}\nevent: {event}\ndata: {data}\n\n".encode("utf-8")
+
+    def _subscribe(self, user_id: str, last_event_id: Optional[str]) -> tuple[_Subscriber, Optional[list[bytes]], int]:
+        # Registering and taking the replay happen without awaiting in
+        # between, so no event can fall between the two.
+        sub = _Subscriber(user_id, self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(sub)
+        return sub, self._replay(user_id, last_event_id), self._seq
+
+    def _replay(self, user_id: str, last_event_id: Optional[str]) -> Optional[list[bytes]]:
+        """Buffered frames of the user after `last_event_id`, or None if the gap cannot be filled."""
+        if not last_event_id:
+            return None
+        epoch, _, seq = last_event_id.strip().partition("-")
+        if epoch != self._epoch or not seq.isdigit():
+            return None
+        last_seq = int(seq)
+        if last_seq > self._seq:
+            return None
+        if self._buffer and last_seq < self._buffer[0][0] - 1:
+            return None
+        return [frame for seq, uid, frame in self._buffer if seq > last_seq and uid == user_id]
+
+    def _unsubscribe(self, sub: _Subscriber) -> None:
+        subs = self._subscribers.get(sub.user_id)
+        if subs is None or sub not in subs:
+            return
+        subs.discard(sub)
+        if not subs:
+            del self._subscribers[sub.user_id]
+
+    async def _run(
+        self,
+        sub: _Subscriber,
+        replay: Optional[list[bytes]],
+        start_seq: int,
+        load_state: Callable[[], Awaitable[list[dict]]],
+    ) -> AsyncIterator[bytes]:
+        try:
+            yield RETRY
+            if replay is None:
+                self.full_states += 1
+                for payload in await load_state():
+                    yield self._frame(EVENT_STATE, payload, start_seq)
+            else:
+                self.resumed += 1
+                for frame in replay:
+                    yield frame
+
+            while True:
+                try:
+                    async with asyncio.timeout(self.heartbeat_seconds):
+                        frame = await sub.queue.get()
+                except TimeoutError:
+                    yield HEARTBEAT
+                    continue
+                if frame is _OVERFLOW:
+                    logger.warning("[⚠️ ha stream] Closing stream of user %s, client fell behind", sub.user_id)
+                    return
+                yield frame
+        finally:
+            self._unsubscribe(sub)
+
+
+vehicle_stream_hub = VehicleStreamHub(
+    buffer_size=HA_STREAM_BUFFER_SIZE,
+    queue_size=HA_STREAM_QUEUE_SIZE,
+    heartbeat_seconds=HA_STREAM_HEARTBEAT_SECONDS,
+    max_per_user=HA_STREAM_MAX_PER_USER,
+)
@@ -0,0 +1,34 @@
+"""
+backend/app/services/vehicle_updates.py
+
+Vehicle writes together with what this process derives from them.
+
+Every path that stores vehicles from Enode (webhook ingestion, the background
+refresher and the fleet reconciliation) saves them through `save_vehicles`,
+which rebuilds the status snapshots of each written vehicle and publishes it
+to the user's `/api/ha/stream` subscribers.
+"""
+from typing import Optional
+
+from app.services.status_snapshots import status_snapshots
+from app.services.vehicle_stream import vehicle_stream_hub
+from app.storage.vehicle import project_changes, project_vehicle, save_vehicles_batch
+
+
+def on_vehicle_written(row: dict, result: dict, diff: Optional[dict]) -> None:
+    """Refreshes the status snapshots of a written vehicle and publishes the change."""
+    status_cache = project_vehicle(row["vehicle_cache"])
+    status_snapshots.on_vehicle_written(row, status_cache)
+    if result.get("id"):
+        vehicle_stream_hub.publish_vehicle(
+            row["user_id"],
+            result["id"],
+            status_cache,
+            project_changes(diff),
+            row["updated_at"],
+        )
+
+
+async def save_vehicles(vehicles: list[dict]) -> int:
+    """Saves vehicles with `save_vehicles_batch`; returns the number of rows written."""
+    return await save_vehicles_batch(vehicles, on_written=on_vehicle_written)
@@ -0,0 +1,248 @@
+"""
+backend/app/services/webhook_ingest.py
+
+Background ingestion pipeline for Enode webhooks.
+
+The webhook endpoint only verifies the signature and queues the payload, so
+Enode gets its acknowledgement right away. A single worker drains the queue,
+stores the raw payloads in webhook_logs, coalesces vehicle events so only the
+latest state per vehicle is kept, writes those vehicles with one bulk upsert,
+turns every vehicle event into a charging sample for the sample writer and
+the session detector, and hands the events to the Home Assistant push
+dispatcher.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from app.config import WEBHOOK_INGEST_MAX_BATCH_EVENTS, WEBHOOK_INGEST_QUEUE_MAXSIZE
+from app.lib.ttl_cache import TTLCache
+from app.services.charging_samples import charging_sample_writer, project_sample
+from app.services.charging_sessions import charging_session_detector
+from app.services.ha_push import ha_push_dispatcher
+from app.services.vehicle_updates import save_vehicles
+from app.storage.user import get_existing_user_ids
+from app.storage.webhook import save_webhook_event
+
+logger = logging.getLogger(__name__)
+
+VEHICLE_EVENTS = ("user:vehicle:discovered", "user:vehicle:updated")
+
+KNOWN_USERS_CACHE_MAXSIZE = 20000
+KNOWN_USERS_CACHE_TTL_SECONDS = 600
+
+_STOP = object()
+
+
+def _last_seen(event: dict) -> str:
+    return (event.get("vehicle") or {}).get("lastSeen") or ""
+
+
+class WebhookIngestor:
+    """Bounded queue of verified Enode payloads plus the worker that processes them."""
+
+    def __init__(self, max_queue_size: int, max_batch_events: int):
+        self.max_queue_size = max_queue_size
+        self.max_batch_events = max_batch_events
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # Users known to have a row in users; unknown ones are looked up again
+        self._known_users = TTLCache(maxsize=KNOWN_USERS_CACHE_MAXSIZE, ttl=KNOWN_USERS_CACHE_TTL_SECONDS)
+
+        self.accepted_payloads = 0
+        self.rejected_payloads = 0
+        self.events = 0
+        self.coalesced_events = 0
+        self.vehicles_written = 0
+        self.unknown_user_vehicles = 0
+        self.samples = 0
+        self.pushes = 0
+        self.batches = 0
+        self.failed_batches = 0
+
+    async def start(self) -> None:
+        """Starts the worker. Called from the application lifespan."""
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._task = asyncio.create_task(self._run(), name="webhook-ingest")
+        logger.info(
+            "[📥 webhook ingest] Worker started (max_queue=%d, max_batch_events=%d)",
+            self.max_queue_size,
+            self.max_batch_events,
+        )
+
+    async def stop(self) -> None:
+        """Stops the worker once everything queued before the call has been processed."""
+        if self._task is None:
+            return
+        # The worker exits when it reaches this marker, so no batch is cut short.
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+        self._queue = None
+        logger.info("[📥 webhook ingest] Worker stopped")
+
+    def submit(self, payload: dict | list) -> bool:
+        """
+        Queues a verified webhook payload for processing.
+        Never blocks; returns False if the queue is full or the worker is not running.
+        """
+        if self._queue is None:
+            self.rejected_payloads += 1
+            return False
+        try:
+            self._queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.rejected_payloads += 1
+            logger.warning("[⚠️ webhook ingest] Queue full, rejecting payload (%d rejected so far)", self.rejected_payloads)
+            return False
+        self.accepted_payloads += 1
+        return True
+
+    def stats(self) -> dict:
+        """Returns queue depth and processing counters."""
+        return {
+            "queue_size": self._queue.qsize() if self._queue else 0,
+            "max_queue_size": self.max_queue_size,
+            "accepted_payloads": self.accepted_payloads,
+            "rejected_payloads": self.rejected_payloads,
+            "events": self.events,
+            "coalesced_events": self.coalesced_events,
+            "vehicles_written": self.vehicles_written,
+            "unknown_user_vehicles": self.unknown_user_vehicles,
+            "charging_samples": self.samples,
+            "ha_pushes": self.pushes,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "running": self._task is not None and not self._task.done(),
+        }
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            # Wait for one payload, then take whatever else is already queued.
+            payloads = []
+            event_count = 0
+            payload = await self._queue.get()
+            while True:
+                if payload is _STOP:
+                    stopping = True
+                    break
+                payloads.append(payload)
+                event_count += len(payload) if isinstance(payload, list) else 1
+                if event_count >= self.max_batch_events:
+                    break
+                try:
+                    payload = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+
+            if not payloads:
+                continue
+            try:
+                await self._process(payloads)
+            except Exception as e:
+                self.failed_batches += 1
+                logger.exception("[❌ webhook ingest] Failed to process batch of %d payload(s): %s", len(payloads), e)
+
+    async def _known_user_ids(self, user_ids: set[str]) -> set[str]:
+        """The subset of `user_ids` that exist; if the lookup fails, all of them."""
+        known = {user_id for user_id in user_ids if self._known_users.get(user_id)}
+        unknown = user_ids - known
+        if not unknown:
+            return known
+        try:
+            found = await get_existing_user_ids(list(unknown))
+        except Exception as e:
+            logger.warning("[⚠️ webhook ingest] User lookup failed, saving vehicles of all users: %s", e)
+            return user_ids
+        for user_id in found:
+            self._known_users.set(user_id, True)
+        return known | found
+
+    async def _process(self, payloads: list[dict | list]) -> None:
+        # 1) Raw payloads are logged as they arrived
+        for result in await asyncio.gather(*(save_webhook_event(payload) for payload in payloads), return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error("[❌ webhook ingest] Failed to log webhook payload: %s", result)
+
+        # 2) Keep only the latest event per vehicle
+        latest: dict[str, dict] = {}
+        vehicle_events: list[dict] = []
+        others: list[dict] = []
+        for payload in payloads:
+            for event in payload if isinstance(payload, list) else [payload]:
+                self.events += 1
+                event_type = event.get("event")
+                if event_type == "system:heartbeat":
+                    logger.info("💓 Heartbeat received")
+                    continue
+                if event_type not in VEHICLE_EVENTS:
+                    logger.warning(f"[⚠️ Unhandled event] type: {event_type}")
+                    others.append(event)
+                    continue
+
+                vehicle = event.get("vehicle")
+                user_id = (event.get("user") or {}).get("id")
+                if not vehicle or not user_id or not vehicle.get("id"):
+                    logger.warning(f"[⚠️ Missing data] vehicle or user_id missing in event: {event}")
+                    continue
+                vehicle["userId"] = user_id
+                vehicle_events.append(event)
+
+                previous = latest.get(vehicle["id"])
+                if previous is not None:
+                    self.coalesced_events += 1
+                    if _last_seen(event) < _last_seen(previous):
+                        continue
+                latest[vehicle["id"]] = event
+
+        # 3) One bulk upsert for all vehicles in the batch. Vehicles can only be
+        #    stored for users we know (users.id is a foreign key), so the others
+        #    are left out rather than failing the statement for everyone.
+        known_users = await self._known_user_ids({event["user"]["id"] for event in vehicle_events})
+        to_save = [event["vehicle"] for event in latest.values() if event["user"]["id"] in known_users]
+        self.unknown_user_vehicles += len(latest) - len(to_save)
+        if to_save:
+            try:
+                self.vehicles_written += await save_vehicles(to_save)
+            except Exception as e:
+                logger.error("[❌ webhook ingest] Failed to save %d vehicle(s): %s", len(to_save), e)
+
+        # 4) Every vehicle event, not just the latest, becomes a charging sample;
+        #    the session detector needs them in time order
+        try:
+            samples = [
+                project_sample(event["user"]["id"], event["vehicle"], event.get("createdAt"))
+                for event in vehicle_events
+                if event["user"]["id"] in known_users
+            ]
+            for sample in sorted(filter(None, samples), key=lambda s: s["sample_time"]):
+                charging_session_detector.observe(sample)
+                if charging_sample_writer.submit(sample):
+                    self.samples += 1
+        except Exception as e:
+            logger.error("[❌ webhook ingest] Failed to record charging samples: %s", e)
+
+        # 5) Hand the events to the push dispatcher; delivery happens in the background
+        for event in [*latest.values(), *others]:
+            try:
+                if ha_push_dispatcher.submit(event, (event.get("user") or {}).get("id")):
+                    self.pushes += 1
+            except Exception as e:
+                logger.error("[❌ webhook ingest] Failed to queue HA push: %s", e)
+
+        self.batches += 1
+        logger.info(
+            "[📥 webhook ingest] Processed %d payload(s): %d vehicle(s) upserted, %d other event(s)",
+            len(payloads),
+            len(to_save),
+            len(others),
+        )
+
+
+webhook_ingestor = WebhookIngestor(
+    max_queue_size=WEBHOOK_INGEST_QUEUE_MAXSIZE,
+    max_batch_events=WEBHOOK_INGEST_MAX_BATCH_EVENTS,
+)
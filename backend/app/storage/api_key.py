@@ -6,8 +6,15 @@ Storage functions for API key management in EVLink backend.
 from typing import Optional
 from uuid import uuid4
 
-from app.lib.api_key_utils import generate_api_key, hash_api_key
-from app.lib.supabase import get_supabase_admin_client
+from app.lib.api_key_utils import (
+    api_key_invalidation_generation,
+    api_key_user_cache,
+    generate_api_key,
+    hash_api_key,
+    invalidate_api_key_user,
+    remember_api_key_user,
+)
+from app.lib.supabase import get_admin_db
 from app.models.user import User
 from app.storage.user import get_user_by_id
 import logging
@@ -15,9 +22,9 @@ import logging
 # Module logger
 logger = logging.getLogger(__name__)
 
-supabase = get_supabase_admin_client()
+supabase = get_admin_db()
 
-def create_api_key(user_id: str) -> str:
+async def create_api_key(user_id: str) -> str:
     """
     Creates a new API key for a user, deactivates old ones (if any),
     and returns the new plaintext key.
@@ -29,12 +36,15 @@ def create_api_key(user_id: str) -> str:
 
         logger.info("[create_api_key] Deactivating old keys for user_id=%s", user_id)
         try:
-            supabase.table("api_keys") \
+            await supabase.table("api_keys") \
                 .update({"active": False}) \
                 .eq("user_id", user_id) \
                 .execute()
         except Exception as update_err:
             logger.warning("[create_api_key] Failed to deactivate old keys: %s", update_err)
+        finally:
+            # Old keys must stop resolving immediately, not after the cache TTL.
+            invalidate_api_key_user(user_id)
 
         payload = {
             "id": key_id,
@@ -44,7 +54,8 @@ def create_api_key(user_id: str) -> str:
         }
 
         logger.info("[create_api_key] Inserting new API key with ID=%s", key_id)
-        response = supabase.table("api_keys").insert(payload).execute()
+        response = await supabase.table("api_keys").insert(payload).execute()
+        api_key_user_cache.invalidate(hashed_key)
 
         if not response or not getattr(response, 'data', None):
             logger.warning("[create_api_key] Inserted key but no data returned for user_id=%s", user_id)
@@ -58,13 +69,13 @@ def create_api_key(user_id: str) -> str:
         return ""
 
 
-def get_api_key_info(user_id: str) -> Optional[dict]:
+async def get_api_key_info(user_id: str) -> Optional[dict]:
     """
     Returns metadata for the currently active API key.
     """
     try:
         logger.info("[get_api_key_info] Fetching active key for user_id=%s", user_id)
-        response = supabase.table("api_keys") \
+        response = await supabase.table("api_keys") \
             .select("id, created_at, active") \
             .eq("user_id", user_id) \
             .eq("active", True) \
@@ -86,27 +97,39 @@ def get_api_key_info(user_id: str) -> Optional[dict]:
 async def get_user_by_api_key(api_key: str) -> User | None:
     """
     Returns a User if the provided API key is valid and active.
+    Results (including misses) are cached per key hash; see `api_key_user_cache`.
     """
+    hashed = hash_api_key(api_key)
     try:
-        hashed = hash_api_key(api_key)
-        logger.info("[get_user_by_api_key] Lookup for API key hash=%s", hashed)
-        response = supabase.table("api_keys") \
-            .select("user_id") \
-            .eq("key_hash", hashed) \
-            .eq("active", True) \
-            .maybe_single() \
-            .execute()
-
-        if not response:
-            logger.warning("[get_user_by_api_key] No response for API key lookup")
-            return None
-
-        row = getattr(response, 'data', None)
-        if not row:
-            logger.warning("[get_user_by_api_key] Invalid or inactive API key")
-            return None
-
-        return await get_user_by_id(row["user_id"])
+        return await api_key_user_cache.get_or_load(hashed, lambda: _load_user_by_key_hash(hashed))
     except Exception as e:
         logger.error("[get_user_by_api_key] Exception during lookup: %s", e, exc_info=True)
         return None
+
+async def _load_user_by_key_hash(hashed: str) -> User | None:
+    """
+    Resolves a key hash against the database. Raises on lookup errors so that
+    failures are not cached as invalid keys.
+    """
+    logger.info("[get_user_by_api_key] Lookup for API key hash=%s", hashed)
+    generation = api_key_invalidation_generation()
+    response = await supabase.table("api_keys") \
+        .select("user_id") \
+        .eq("key_hash", hashed) \
+        .eq("active", True) \
+        .maybe_single() \
+        .execute()
+
+    if not response:
+        logger.warning("[get_user_by_api_key] No response for API key lookup")
+        return None
+
+    row = getattr(response, 'data', None)
+    if not row:
+        logger.warning("[get_user_by_api_key] Invalid or inactive API key")
+        remember_api_key_user(hashed, None, generation)
+        return None
+
+    user = await get_user_by_id(row["user_id"])
+    remember_api_key_user(hashed, user, generation)
+    return user
@@ -0,0 +1,17 @@
+# backend/app/storage/charging_samples.py
+
+from app.lib.supabase import get_admin_db
+
+supabase = get_admin_db()
+
+async def insert_charging_samples_batch(rows: list[dict]) -> None:
+    """
+    Insert a batch of charging_samples rows in a single statement. Rows whose
+    source_event_id is already stored are skipped, so a batch can be retried
+    and redelivered webhooks are not counted twice.
+    """
+    if not rows:
+        return
+    await supabase.table("charging_samples") \
+        .upsert(rows, on_conflict="source_event_id", ignore_duplicates=True, returning="minimal") \
+        .execute()
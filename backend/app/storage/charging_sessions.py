@@ -0,0 +1,36 @@
+# backend/app/storage/charging_sessions.py
+
+from app.lib.supabase import get_admin_db
+
+supabase = get_admin_db()
+
+async def get_open_charging_sessions() -> list[dict]:
+    """Returns all checkpointed charging sessions that have not ended."""
+    res = await supabase.table("charging_sessions_open").select("*").execute()
+    return res.data or []
+
+async def upsert_open_charging_sessions(rows: list[dict]) -> None:
+    """Checkpoints open charging sessions, one row per vehicle, in one statement."""
+    if not rows:
+        return
+    await supabase.table("charging_sessions_open") \
+        .upsert(rows, on_conflict="vehicle_id", returning="minimal") \
+        .execute()
+
+async def delete_open_charging_sessions(session_ids: list[str]) -> None:
+    """Removes the checkpoints of sessions that have ended."""
+    if not session_ids:
+        return
+    await supabase.table("charging_sessions_open").delete().in_("session_id", session_ids).execute()
+
+async def record_charging_sessions(rows: list[dict]) -> int:
+    """
+    Inserts ended sessions into charging_sessions and adds them to the stats
+    rollups, in one `record_charging_sessions` RPC call. Sessions already
+    stored under the same session_id are skipped, so a failed checkpoint can
+    be retried. Returns the number of sessions inserted.
+    """
+    if not rows:
+        return 0
+    res = await supabase.rpc("record_charging_sessions", {"p_sessions": rows}).execute()
+    return res.data or 0
@@ -0,0 +1,44 @@
+# 📄 backend/app/storage/enode_reconcile.py
+
+from datetime import datetime, timezone
+import logging
+from app.lib.supabase import get_admin_db
+
+logger = logging.getLogger(__name__)
+supabase = get_admin_db()
+
+RUN_IN_PROGRESS = "in_progress"
+RUN_COMPLETED = "completed"
+RUN_ABANDONED = "abandoned"
+
+
+async def get_open_reconcile_run() -> dict | None:
+    """Returns the most recent reconciliation pass that has not finished, if any."""
+    res = await supabase.table("enode_reconcile_runs") \
+        .select("*") \
+        .eq("status", RUN_IN_PROGRESS) \
+        .order("started_at", desc=True) \
+        .limit(1) \
+        .execute()
+    return res.data[0] if res.data else None
+
+async def create_reconcile_run() -> dict:
+    """Starts a new reconciliation pass at the first page."""
+    res = await supabase.table("enode_reconcile_runs").insert({"status": RUN_IN_PROGRESS}).execute()
+    return res.data[0]
+
+async def update_reconcile_run(run_id: str, fields: dict) -> None:
+    """Stores the cursor, counters or status of a reconciliation pass."""
+    fields = {**fields, "updated_at": datetime.now(timezone.utc).isoformat()}
+    if fields.get("status") in (RUN_COMPLETED, RUN_ABANDONED):
+        fields["finished_at"] = fields["updated_at"]
+    await supabase.table("enode_reconcile_runs").update(fields).eq("id", run_id).execute()
+
+async def get_recent_reconcile_runs(limit: int = 20) -> list[dict]:
+    """Returns the latest reconciliation passes, newest first."""
+    res = await supabase.table("enode_reconcile_runs") \
+        .select("*") \
+        .order("started_at", desc=True) \
+        .limit(limit) \
+        .execute()
+    return res.data or []
@@ -1,31 +1,52 @@
-from typing import Optional
-from app.lib.supabase import get_supabase_admin_client
-from postgrest.exceptions import APIError
+from app.lib.supabase import get_admin_db
 
-supabase = get_supabase_admin_client()
+supabase = get_admin_db()
 
-def get_global_stats_row() -> dict | None:
+def _with_average_rate(row: dict) -> dict:
+    """Adds average_charge_rate_kwh_per_hour (kWh per charging hour) to a rollup row."""
+    minutes = float(row.get("total_minutes_charged") or 0)
+    kwh = float(row.get("total_kwh_charged") or 0)
+    row["average_charge_rate_kwh_per_hour"] = kwh / (minutes / 60) if minutes > 0 else 0
+    return row
+
+async def get_global_stats_row() -> dict | None:
+    """Retrieves the system-wide charging statistics from the charging_stats_global rollup."""
     result = (
-        supabase
-        .table("global_stats_view")
-        .select("*")
+        await supabase
+        .table("charging_stats_global")
+        .select(
+            "unique_users, unique_vehicles, total_sessions, total_kwh_charged, total_minutes_charged, "
+            "highest_max_charge_rate_kw, highest_average_charge_rate_kw, min_start_time, max_end_time"
+        )
+        .eq("id", 1)
         .maybe_single()
         .execute()
     )
-    return result.data
-
-def get_user_stats_row(user_id: str) -> dict | None:
-    """Retrieves user-specific statistics by calling the 'get_user_stats' RPC function."""
-    try:
-        result = (
-            supabase
-            .rpc('get_user_stats', {'p_user_id': user_id})
-            .execute()
-        )
-        if result.data:
-            return result.data[0] # RPC function returns a list of records
+    if not result or not result.data:
         return None
-    except APIError as e:
-        if e.code == '204': # No Content
-            return None
-        raise e
\ No newline at end of file
+    return _with_average_rate(result.data)
+
+async def get_user_stats_row(user_id: str) -> dict:
+    """
+    Retrieves a user's charging statistics from the charging_stats_user rollup.
+    Users without sessions get zero totals, as from the former get_user_stats RPC.
+    """
+    result = (
+        await supabase
+        .table("charging_stats_user")
+        .select("total_sessions, total_kwh_charged, total_minutes_charged, min_start_time, max_end_time, unique_vehicles")
+        .eq("user_id", user_id)
+        .maybe_single()
+        .execute()
+    )
+    if not result or not result.data:
+        return {
+            "total_sessions": 0,
+            "total_kwh_charged": None,
+            "total_minutes_charged": None,
+            "average_charge_rate_kwh_per_hour": 0,
+            "min_start_time": None,
+            "max_end_time": None,
+            "unique_vehicles": 0,
+        }
+    return _with_average_rate(result.data)
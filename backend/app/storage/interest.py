@@ -2,21 +2,21 @@
 
 import logging
 import uuid
-from app.lib.supabase import get_supabase_admin_client
+from app.lib.supabase import get_admin_db
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-supabase = get_supabase_admin_client()
+supabase = get_admin_db()
 
-def save_interest(name: str, email: str) -> None:
+async def save_interest(name: str, email: str) -> None:
     """
     Save interest submission to the Supabase 'interest' table.
     This uses the service role key (admin) to bypass RLS for public inserts.
     """
     try:
         payload = {"name": name, "email": email}
-        response = supabase.table("interest").insert(payload).execute()
+        response = await supabase.table("interest").insert(payload).execute()
 
         if hasattr(response, "error") and response.error:
             logger.error(f"[❌ save_interest] Supabase error: {response.error}")
@@ -28,7 +28,7 @@ def save_interest(name: str, email: str) -> None:
 
 async def get_uncontacted_interest_entries():
     """Retrieves all interest entries that have not yet been contacted."""
-    response = supabase.table("interest") \
+    response = await supabase.table("interest") \
         .select("*") \
         .eq("contacted", False) \
         .execute()
@@ -36,7 +36,7 @@ async def get_uncontacted_interest_entries():
 
 async def mark_interest_contacted(entry_id: str):
     """Marks an interest entry as contacted with the current timestamp."""
-    return supabase.table("interest") \
+    return await supabase.table("interest") \
         .update({
             "contacted": True,
             "contacted_at": datetime.utcnow().isoformat()
@@ -46,7 +46,7 @@ async def mark_interest_contacted(entry_id: str):
 
 async def list_interest_entries():
     """Lists all interest entries, ordered by creation date (newest first)."""
-    response = supabase.table("interest") \
+    response = await supabase.table("interest") \
         .select("id, name, email, created_at, contacted, contacted_at, access_code") \
         .order("created_at", desc=True) \
         .execute()
@@ -54,7 +54,7 @@ async def list_interest_entries():
 
 async def count_uncontacted_interest():
     """Counts the number of interest entries that have not yet been contacted."""
-    response = supabase.table("interest") \
+    response = await supabase.table("interest") \
         .select("id", count="exact") \
         .eq("contacted", False) \
         .execute()
@@ -62,7 +62,7 @@ async def count_uncontacted_interest():
 
 async def get_interest_by_access_code(code: str) -> dict | None:
     """Retrieves an interest entry by its unique access code."""
-    result = supabase.table("interest") \
+    result = await supabase.table("interest") \
         .select("id, name, email, access_code, user_id") \
         .eq("access_code", code) \
         .maybe_single() \
@@ -71,7 +71,7 @@ async def get_interest_by_access_code(code: str) -> dict | None:
 
 async def assign_interest_user(code: str, user_id: str):
     """Assigns a user ID to an interest entry using its access code."""
-    supabase.table("interest") \
+    await supabase.table("interest") \
         .update({"user_id": user_id}) \
         .eq("access_code", code) \
         .execute()
@@ -81,7 +81,7 @@ async def generate_codes_for_interest_ids(interest_ids: list[str]) -> int:
     updated_count = 0
 
     for interest_id in interest_ids:
-        result = supabase.table("interest") \
+        result = await supabase.table("interest") \
             .select("id, access_code") \
             .eq("id", interest_id) \
             .maybe_single() \
@@ -90,7 +90,7 @@ async def generate_codes_for_interest_ids(interest_ids: list[str]) -> int:
         row = result.data
         if row and not row.get("access_code"):
             new_code = uuid.uuid4().hex[:10]  # shorter code
-            supabase.table("interest") \
+            await supabase.table("interest") \
                 .update({"access_code": new_code}) \
                 .eq("id", interest_id) \
                 .execute()
@@ -100,7 +100,7 @@ async def generate_codes_for_interest_ids(interest_ids: list[str]) -> int:
 
 async def get_interest_by_id(interest_id: str):
     """Retrieves an interest entry by its ID."""
-    result = supabase.table("interest") \
+    result = await supabase.table("interest") \
         .select("id, name, email, access_code, user_id") \
         .eq("id", interest_id) \
         .maybe_single() \
@@ -1,11 +1,11 @@
-from app.lib.supabase import get_supabase_admin_client
+from app.lib.supabase import get_admin_db
 from datetime import datetime, timezone
 import logging
 
 from app.storage.user import get_user_id_by_stripe_customer_id
 
 logger = logging.getLogger(__name__)
-supabase = get_supabase_admin_client()
+supabase = get_admin_db()
 
 def find_subscription_id(invoice) -> str | None:
     """Attempts to find the subscription ID from various locations within a Stripe invoice object."""
@@ -90,8 +90,6 @@ async def extract_invoice_fields(invoice, user_id=None) -> dict:
 
 async def upsert_invoice_from_stripe(invoice, user_id=None):
     """Inserts or updates an invoice record in the database based on a Stripe invoice object."""
-    supabase = get_supabase_admin_client()
-
     # 1. Extract all fields safely
     data = await extract_invoice_fields(invoice, user_id)
     if not data:
@@ -105,25 +103,24 @@ async def upsert_invoice_from_stripe(invoice, user_id=None):
         return
 
     # 3. Does the invoice already exist?
-    result = supabase.table("invoices").select("id").eq("invoice_id", invoice_id).execute()
+    result = await supabase.table("invoices").select("id").eq("invoice_id", invoice_id).execute()
     logger.info(f"[🔎] Invoice upsert: select result: {result}")
     exists = result and hasattr(result, "data") and result.data and len(result.data) > 0
 
     if exists:
         # Update existing row
-        update_result = supabase.table("invoices").update(data).eq("invoice_id", invoice_id).execute()
+        update_result = await supabase.table("invoices").update(data).eq("invoice_id", invoice_id).execute()
         logger.info(f"[📝] Invoice {invoice_id} updated: {update_result}")
     else:
         # Create new row
-        insert_result = supabase.table("invoices").insert(data).execute()
+        insert_result = await supabase.table("invoices").insert(data).execute()
         logger.info(f"[➕] Invoice {invoice_id} inserted: {insert_result}")
 
     return True
 
 async def get_user_invoices(user_id: str) -> list[dict]:
     """Retrieves all invoices for a specific user, ordered by creation date (newest first)."""
-    supabase = get_supabase_admin_client()
-    res = supabase.table("invoices").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
+    res = await supabase.table("invoices").select("*").eq("user_id", user_id).order("created_at", desc=True).execute()
     return res.data if hasattr(res, "data") else []
 
 async def get_all_invoices() -> list[dict]:
@@ -131,7 +128,7 @@ async def get_all_invoices() -> list[dict]:
     Fetches all invoices from the database, ordered by creation date.
     """
     try:
-        res = supabase.table("invoices").select("*").order("created_at", desc=True).execute()
+        res = await supabase.table("invoices").select("*").order("created_at", desc=True).execute()
         return res.data if hasattr(res, "data") else []
     except Exception as e:
         logger.error(f"[❌ get_all_invoices] {e}")
@@ -142,7 +139,7 @@ async def get_total_revenue() -> float:
     Calculates the total revenue from all paid invoices.
     """
     try:
-        res = supabase.table("invoices").select("amount_due", "currency").eq("status", "paid").execute()
+        res = await supabase.table("invoices").select("amount_due", "currency").eq("status", "paid").execute()
         total_revenue = 0.0
         for invoice in res.data:
             # Assuming all amounts are in the same currency or need conversion.
@@ -165,7 +162,7 @@ async def get_monthly_revenue(year: int, month: int) -> float:
         else:
             end_date = datetime(year, month + 1, 1, 0, 0, 0, tzinfo=timezone.utc)
 
-        res = supabase.table("invoices").select("amount_due", "currency") \
+        res = await supabase.table("invoices").select("amount_due", "currency") \
             .eq("status", "paid") \
             .gte("created_at", start_date.isoformat().replace("+00:00", "Z")) \
             .lt("created_at", end_date.isoformat().replace("+00:00", "Z")) \
@@ -187,7 +184,7 @@ async def get_yearly_revenue(year: int) -> float:
         start_date = datetime(year, 1, 1, 0, 0, 0, tzinfo=timezone.utc)
         end_date = datetime(year + 1, 1, 1, 0, 0, 0, tzinfo=timezone.utc)
 
-        res = supabase.table("invoices").select("amount_due", "currency") \
+        res = await supabase.table("invoices").select("amount_due", "currency") \
             .eq("status", "paid") \
             .gte("created_at", start_date.isoformat().replace("+00:00", "Z")) \
             .lt("created_at", end_date.isoformat().replace("+00:00", "Z")) \
@@ -0,0 +1,72 @@
+# 📄 backend/app/storage/log_retention.py
+
+from datetime import date, datetime
+from typing import Optional
+from app.lib.supabase import get_admin_db
+
+supabase = get_admin_db()
+
+# Log tables handled by compact_next_log_day / prune_log_rows (supabase/sql_definitions/log_retention.sql)
+LOG_SOURCES = ("poll_logs", "api_telemetry", "webhook_logs", "stripe_webhook_logs", "status_logs")
+# Sources whose payloads prune_log_payloads can clear
+PAYLOAD_SOURCES = ("api_telemetry", "stripe_webhook_logs")
+
+
+async def compact_next_log_day(source: str, until: date) -> Optional[str]:
+    """
+    Rolls the oldest uncompacted day of `source` before `until` into
+    log_rollups. Returns that day ('YYYY-MM-DD'), or None if none is left.
+    """
+    res = await supabase.rpc("compact_next_log_day", {
+        "p_source": source,
+        "p_until": until.isoformat(),
+    }).execute()
+    return res.data or None
+
+async def prune_log_rows(source: str, before: datetime, limit: int) -> int:
+    """Deletes up to `limit` compacted raw rows of `source` older than `before`; returns how many."""
+    res = await supabase.rpc("prune_log_rows", {
+        "p_source": source,
+        "p_before": before.isoformat(),
+        "p_limit": limit,
+    }).execute()
+    return int(res.data or 0)
+
+async def prune_log_payloads(source: str, before: datetime, limit: int) -> int:
+    """Clears the payloads of up to `limit` rows of `source` older than `before`; returns how many."""
+    res = await supabase.rpc("prune_log_payloads", {
+        "p_source": source,
+        "p_before": before.isoformat(),
+        "p_limit": limit,
+    }).execute()
+    return int(res.data or 0)
+
+async def get_log_compaction_state() -> list[dict]:
+    """Returns the compaction boundary and pruning counters of every source."""
+    res = await supabase.table("log_compaction_state").select("*").order("source").execute()
+    return res.data or []
+
+async def get_log_activity(
+    source: str,
+    start: datetime,
+    end: datetime,
+    granularity: str = "day",
+    key: Optional[str] = None,
+    user_id: Optional[str] = None,
+    vehicle_id: Optional[str] = None,
+) -> list[dict]:
+    """
+    Returns per-bucket counts of a log source between `start` and `end`,
+    one row per bucket and key: older buckets come from log_rollups, recent
+    ones are aggregated from the raw rows.
+    """
+    res = await supabase.rpc("get_log_activity", {
+        "p_source": source,
+        "p_granularity": granularity,
+        "p_from": start.isoformat(),
+        "p_to": end.isoformat(),
+        "p_key": key,
+        "p_user_id": user_id,
+        "p_vehicle_id": vehicle_id,
+    }).execute()
+    return res.data or []
@@ -4,10 +4,10 @@ import uuid
 from datetime import datetime, timedelta, timezone
 import logging
 
-from app.lib.supabase import get_supabase_admin_client
+from app.lib.supabase import get_admin_db
 
 logger = logging.getLogger(__name__)
-supabase = get_supabase_admin_client()
+supabase = get_admin_db()
 
 VERIFICATION_CODE_TTL_HOURS = 48  # Adjust if you want a shorter/longer expiry
 
@@ -48,7 +48,7 @@ async def create_newsletter_request(email: str, name: str | None = None):
     }
 
     # 4) Upsert on unique email
-    result = supabase.table("interest") \
+    result = await supabase.table("interest") \
         .upsert(payload, on_conflict="email") \
         .execute()
 
@@ -75,7 +75,7 @@ async def verify_newsletter_request(code: str):
 
     # 1) Try to select a single row matching the code and not expired
     result = (
-        supabase.table("interest")
+        await supabase.table("interest")
         .select("*")
         .eq("newsletter_verification_code", code)
         .eq("newsletter_verified", False)
@@ -98,7 +98,7 @@ async def verify_newsletter_request(code: str):
         "newsletter_code_expires_at": None
     }
 
-    updated = supabase.table("interest") \
+    updated = await supabase.table("interest") \
         .update(update_payload) \
         .eq("id", row["id"]) \
         .execute()
@@ -121,7 +121,7 @@ async def remove_public_subscriber(email: str):
     email = email.strip().lower()
 
     # 1) Check if a row exists
-    existing = supabase.table("interest") \
+    existing = await supabase.table("interest") \
         .select("id") \
         .eq("email", email) \
         .maybe_single() \
@@ -138,7 +138,7 @@ async def remove_public_subscriber(email: str):
         "newsletter_code_expires_at": None
     }
 
-    result = supabase.table("interest") \
+    result = await supabase.table("interest") \
         .update(update_payload) \
         .eq("email", email) \
         .execute()
@@ -162,7 +162,7 @@ async def set_subscriber(email: str, is_subscribed: bool):
         "newsletter_verified": is_subscribed,
     }
 
-    result = supabase.table("interest") \
+    result = await supabase.table("interest") \
         .upsert(payload, on_conflict="email") \
         .execute()
 
@@ -173,7 +173,7 @@ async def is_subscriber(email: str) -> bool:
     """Return ``True`` if a verified newsletter subscriber exists."""
     email = email.strip().lower()
     result = (
-        supabase.table("interest")
+        await supabase.table("interest")
         .select("is_newsletter, newsletter_verified")
         .eq("email", email)
         .maybe_single()
@@ -1,15 +1,22 @@
 import logging
 from datetime import datetime
 from typing import Optional
-from app.lib.supabase import get_supabase_admin_client
+from app.lib.supabase import get_admin_db
 
 # Initialize Supabase admin client
-supabase = get_supabase_admin_client()
+supabase = get_admin_db()
 
-async def log_poll(user_id: str, endpoint: str, timestamp: datetime, vehicle_id: Optional[str] = None) -> None:
+async def log_poll(
+    user_id: str,
+    endpoint: str,
+    timestamp: datetime,
+    vehicle_id: Optional[str] = None,
+    not_modified: bool = False,
+) -> None:
     """
     Insert a new record into poll_logs when a user polls an endpoint.
-    Optionally include the vehicle_id.
+    Optionally include the vehicle_id. Polls answered with 304 are flagged
+    with not_modified.
     """
     log_entry = {
         "user_id": user_id,
@@ -18,44 +25,107 @@ async def log_poll(user_id: str, endpoint: str, timestamp: datetime, vehicle_id:
     }
     if vehicle_id:
         log_entry["vehicle_id"] = vehicle_id
+    if not_modified:
+        log_entry["not_modified"] = True
         
-    supabase.table("poll_logs").insert(log_entry).execute()
+    await supabase.table("poll_logs").insert(log_entry).execute()
 
-async def count_polls_since(user_id: str, since: datetime) -> int:
+async def log_polls(
+    user_id: str,
+    endpoint: str,
+    timestamp: datetime,
+    vehicle_ids: list[Optional[str]],
+    not_modified: bool = False,
+) -> None:
+    """
+    Insert one poll_logs record per vehicle polled by a single request, in one
+    insert. A None id logs the poll without a vehicle_id, as log_poll does.
+    """
+    if not vehicle_ids:
+        return
+    log_entries = []
+    for vehicle_id in vehicle_ids:
+        log_entry = {
+            "user_id": user_id,
+            "endpoint": endpoint,
+            "created_at": timestamp.isoformat(),
+        }
+        if vehicle_id:
+            log_entry["vehicle_id"] = vehicle_id
+        if not_modified:
+            log_entry["not_modified"] = True
+        log_entries.append(log_entry)
+
+    await supabase.table("poll_logs").insert(log_entries).execute()
+
+async def count_polls_since(user_id: str, since: datetime, include_not_modified: bool = False) -> int:
     """
     Count how many poll_logs entries exist for a user since the given datetime.
+    Polls answered with 304 are only counted with include_not_modified.
     Returns the exact count of rows.
     """
-    resp = supabase \
+    query = supabase \
         .table("poll_logs") \
         .select("id", count="exact") \
         .eq("user_id", user_id) \
-        .gte("created_at", since.isoformat()) \
-        .execute()
+        .gte("created_at", since.isoformat())
+    if not include_not_modified:
+        query = query.eq("not_modified", False)
+    resp = await query.execute()
     return resp.count or 0
 
-async def count_polls_since_for_vehicle(vehicle_id: str, since: datetime) -> int:
+async def count_polls_since_for_vehicle(vehicle_id: str, since: datetime, include_not_modified: bool = False) -> int:
     """
     Count how many poll_logs entries exist for a specific vehicle since the given datetime.
+    Polls answered with 304 are only counted with include_not_modified.
     """
-    resp = supabase \
+    query = supabase \
         .table("poll_logs") \
         .select("id", count="exact") \
         .eq("vehicle_id", vehicle_id) \
-        .gte("created_at", since.isoformat()) \
-        .execute()
+        .gte("created_at", since.isoformat())
+    if not include_not_modified:
+        query = query.eq("not_modified", False)
+    resp = await query.execute()
     return resp.count or 0
 
-async def count_polls_in_period(user_id: str, start_time: datetime, end_time: datetime) -> int:
+async def count_polls_in_period(
+    user_id: str,
+    start_time: datetime,
+    end_time: datetime,
+    include_not_modified: bool = False,
+) -> int:
     """
     Count how many poll_logs entries exist for a user within a specific period.
+    Polls answered with 304 are only counted with include_not_modified.
     Returns the exact count of rows.
     """
-    resp = supabase \
+    query = supabase \
         .table("poll_logs") \
         .select("id", count="exact") \
         .eq("user_id", user_id) \
         .gte("created_at", start_time.isoformat()) \
-        .lte("created_at", end_time.isoformat()) \
-        .execute()
+        .lte("created_at", end_time.isoformat())
+    if not include_not_modified:
+        query = query.eq("not_modified", False)
+    resp = await query.execute()
     return resp.count or 0
+
+async def count_polls_by_day(
+    since: datetime,
+    user_id: Optional[str] = None,
+    vehicle_id: Optional[str] = None,
+    include_not_modified: bool = False,
+) -> dict[str, int]:
+    """
+    Count poll_logs entries per UTC day since the given datetime, for a user and/or a vehicle.
+    Polls answered with 304 are only counted with include_not_modified.
+    Returns a mapping of 'YYYY-MM-DD' -> count (days without polls are omitted).
+    """
+    resp = await supabase.rpc("count_polls_by_day", {
+        "p_since": since.isoformat(),
+        "p_user_id": user_id,
+        "p_vehicle_id": vehicle_id,
+        "p_include_not_modified": include_not_modified,
+    }).execute()
+    return {row["day"]: int(row["poll_count"]) for row in (resp.data or [])}
@@ -1,33 +1,102 @@
 # 📄 backend/app/storage/settings.py
 
+import asyncio
 import logging
-from app.lib.supabase import get_supabase_admin_client
+import time
+from datetime import datetime, timezone
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+from app.config import SETTINGS_CACHE_TTL_SECONDS
+from app.lib.supabase import get_admin_db
 
 logger = logging.getLogger(__name__)
-supabase = get_supabase_admin_client()
+supabase = get_admin_db()
+
+
+class SettingsSnapshot:
+    """
+    Immutable in-memory copy of the settings table, keyed by setting name.
+
+    Loaded at startup and replaced as a whole whenever it is refreshed, so
+    readers never see a half-updated set. It is refreshed once it is older
+    than SETTINGS_CACHE_TTL_SECONDS (this is how other workers pick up
+    changes) and immediately after every write made through this module.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.version = 0
+        self.loaded_at: Optional[datetime] = None
+        self.refreshes = 0
+        self.failed_refreshes = 0
+        self._settings: Mapping[str, Mapping] = MappingProxyType({})
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self, name: str) -> Optional[Mapping]:
+        if self._expires_at <= time.monotonic():
+            await self.refresh(force=False)
+        return self._settings.get(name)
+
+    async def refresh(self, force: bool = True) -> None:
+        """
+        Reloads the snapshot. Concurrent TTL reloads share one query; a forced
+        reload (after a write) always runs its own, since a reload that was
+        already in flight may have read the table before the write.
+        """
+        async with self._lock:
+            if not force and self._expires_at > time.monotonic():
+                # Someone else reloaded (or failed and backed off) while we waited.
+                return
+            try:
+                res = await supabase.table("settings").select("*").execute()
+            except Exception as e:
+                # Keep serving the previous snapshot and retry after the TTL.
+                self.failed_refreshes += 1
+                self._expires_at = time.monotonic() + self.ttl
+                logger.error(f"[❌ settings snapshot] Refresh failed, keeping version {self.version}: {e}")
+                return
+            self._settings = MappingProxyType({
+                row["name"]: MappingProxyType(row) for row in (res.data or []) if row.get("name")
+            })
+            self._expires_at = time.monotonic() + self.ttl
+            self.loaded_at = datetime.now(timezone.utc)
+            self.version += 1
+            self.refreshes += 1
+            logger.info(f"[⚙️ settings snapshot] Loaded version {self.version} ({len(self._settings)} settings)")
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at.isoformat() if self.loaded_at else None,
+            "ttl_seconds": self.ttl,
+            "settings_count": len(self._settings),
+            "refreshes": self.refreshes,
+            "failed_refreshes": self.failed_refreshes,
+        }
+
+
+settings_snapshot = SettingsSnapshot(ttl=SETTINGS_CACHE_TTL_SECONDS)
 
 async def get_all_settings():
     """Retrieves all application settings from the database."""
     try:
-        res = supabase.table("settings").select("*").order("group_name").execute()
+        res = await supabase.table("settings").select("*").order("group_name").execute()
         return res.data or []
     except Exception as e:
         logger.error(f"[❌ get_all_settings] {e}")
         return []
     
 async def get_setting_by_name(name: str):
-    """Retrieves a single setting by its name."""
-    try:
-        res = supabase.table("settings").select("*").eq("name", name).maybe_single().execute()
-        return res.data
-    except Exception as e:
-        logger.error(f"[❌ get_setting_by_name] {e}")
-        return None
+    """Retrieves a single setting by its name from the in-memory snapshot (read-only)."""
+    return await settings_snapshot.get(name)
 
 async def add_setting(setting: dict):
     """Adds a new setting to the database."""
     try:
-        res = supabase.table("settings").insert(setting).execute()
+        res = await supabase.table("settings").insert(setting).execute()
+        await settings_snapshot.refresh()
         return res.data or []
     except Exception as e:
         logger.error(f"[❌ add_setting] {e}")
@@ -36,7 +105,8 @@ async def add_setting(setting: dict):
 async def update_setting(setting_id: str, setting: dict):
     """Updates an existing setting in the database."""
     try:
-        res = supabase.table("settings").update(setting).eq("id", setting_id).execute()
+        res = await supabase.table("settings").update(setting).eq("id", setting_id).execute()
+        await settings_snapshot.refresh()
         return res.data or []
     except Exception as e:
         logger.error(f"[❌ update_setting] {e}")
@@ -45,8 +115,9 @@ async def update_setting(setting_id: str, setting: dict):
 async def delete_setting(setting_id: str):
     """Deletes a setting from the database."""
     try:
-        res = supabase.table("settings").delete().eq("id", setting_id).execute()
+        res = await supabase.table("settings").delete().eq("id", setting_id).execute()
+        await settings_snapshot.refresh()
         return res.data or []
     except Exception as e:
         logger.error(f"[❌ delete_setting] {e}")
-        return []
\ No newline at end of file
+        return []
@@ -3,11 +3,11 @@ from datetime import datetime
 from typing import Any, Dict, Optional
 
 from pydantic import BaseModel, Field
-from app.lib.supabase import get_supabase_admin_client
+from app.lib.supabase import get_admin_db
 from app.storage.user import get_user_id_by_stripe_customer_id
 
 # Initialize Supabase admin client
-supabase = get_supabase_admin_client()
+supabase = get_admin_db()
 logger = logging.getLogger(__name__)
 
 class DBSubscription(BaseModel):
@@ -93,7 +93,7 @@ async def get_user_record(user_id: str) -> dict:
       - subscription_status (e.g. "active", "canceled", "")
       - stripe_customer_id (str or None)
     """
-    response = supabase \
+    response = await supabase \
         .table("users") \
         .select(
             "tier",
@@ -107,22 +107,12 @@ async def get_user_record(user_id: str) -> dict:
 
     return response.data or {}
 
-async def update_linked_vehicle_count(user_id: str, new_count: int) -> None:
-    """
-    Updates the linked_vehicle_count for a user in the database.
-    """
-    supabase \
-        .table("users") \
-        .update({"linked_vehicle_count": new_count}) \
-        .eq("id", user_id) \
-        .execute()
-
 async def get_all_subscription_plans() -> list[dict]:
     """
     Fetch all subscription plans from the subscription_plans table.
     Returns a list of dicts, one per plan.
     """
-    response = supabase \
+    response = await supabase \
         .table("subscription_plans") \
         .select(
             "id",
@@ -147,7 +137,7 @@ async def get_price_id_map() -> dict:
     Return a dict mapping local plan codes to Stripe price_ids.
     Example: { "pro_monthly": "price_xxx", "sms_50": "price_yyy" }
     """
-    response = supabase.table("subscription_plans") \
+    response = await supabase.table("subscription_plans") \
         .select("code", "stripe_price_id") \
         .eq("is_active", True) \
         .execute()
@@ -157,7 +147,7 @@ async def get_price_id_map() -> dict:
 async def update_subscription_status(subscription_id: str, status: str):
     """Update the status of a subscription (e.g. 'active', 'canceled')."""
     try:
-        result = supabase.table("subscriptions") \
+        result = await supabase.table("subscriptions") \
             .update({"status": status}) \
             .eq("subscription_id", subscription_id) \
             .execute()
@@ -169,7 +159,6 @@ async def update_subscription_status(subscription_id: str, status: str):
 
 async def upsert_subscription_from_stripe(sub, user_id=None):
     """Inserts or updates a subscription record in the database based on a Stripe subscription object."""
-    supabase = get_supabase_admin_client()
     # 1. Extract all fields
     data = await extract_subscription_fields(sub, user_id)
     if not data:
@@ -183,15 +172,15 @@ async def upsert_subscription_from_stripe(sub, user_id=None):
         return False
 
     # 3. Does the subscription already exist?
-    result = supabase.table("subscriptions").select("id").eq("subscription_id", subscription_id).execute()
+    result = await supabase.table("subscriptions").select("id").eq("subscription_id", subscription_id).execute()
     logger.info(f"[🔎] Subscription upsert: select result: {result.data if hasattr(result, 'data') else result}")
     exists = result and hasattr(result, "data") and result.data and len(result.data) > 0
 
     if exists:
-        update_result = supabase.table("subscriptions").update(data).eq("subscription_id", subscription_id).execute()
+        update_result = await supabase.table("subscriptions").update(data).eq("subscription_id", subscription_id).execute()
         logger.info(f"[📝] Subscription {subscription_id} updated: {getattr(update_result, 'data', update_result)}")
     else:
-        insert_result = supabase.table("subscriptions").insert(data).execute()
+        insert_result = await supabase.table("subscriptions").insert(data).execute()
         logger.info(f"[➕] Subscription {subscription_id} inserted: {getattr(insert_result, 'data', insert_result)}")
 
     return True
@@ -201,10 +190,8 @@ async def get_user_subscription(user_id: str) -> dict | None:
     Retrieves a single subscription record for a given user ID,
     and enriches it with plan details like amount and currency.
     """
-    supabase = get_supabase_admin_client()
-    
     # Fetch the user's subscription
-    res = supabase.table("subscriptions").select("*").eq("user_id", user_id).maybe_single().execute()
+    res = await supabase.table("subscriptions").select("*").eq("user_id", user_id).maybe_single().execute()
     
     # The result from maybe_single() might not contain data if no record is found.
     if not res or not res.data:
@@ -215,7 +202,7 @@ async def get_user_subscription(user_id: str) -> dict | None:
     # If the subscription has a plan_name, fetch the plan details
     if plan_name := subscription_data.get("plan_name"):
         try:
-            plan_res = supabase.table("subscription_plans").select("amount, currency").eq("name", plan_name).single().execute()
+            plan_res = await supabase.table("subscription_plans").select("amount, currency").eq("name", plan_name).single().execute()
             if plan_res and plan_res.data:
                 subscription_data["amount"] = plan_res.data.get("amount")
                 subscription_data["currency"] = plan_res.data.get("currency")
@@ -229,7 +216,7 @@ async def get_subscription_by_stripe_id(stripe_subscription_id: str) -> Optional
     Retrieves a subscription record from the local database using the Stripe Subscription ID.
     """
     try:
-        response = supabase.table("subscriptions") \
+        response = await supabase.table("subscriptions") \
             .select("*, current_period_start, current_period_end") \
             .eq("subscription_id", stripe_subscription_id) \
             .single()  \
@@ -255,7 +242,7 @@ async def get_all_subscriptions() -> list[dict]:
     Fetches all subscriptions from the database, ordered by creation date.
     """
     try:
-        res = supabase.table("subscriptions").select("*").order("created_at", desc=True).execute()
+        res = await supabase.table("subscriptions").select("*").order("created_at", desc=True).execute()
         return res.data if hasattr(res, "data") else []
     except Exception as e:
         logger.error(f"[❌ get_all_subscriptions] {e}")
@@ -266,7 +253,7 @@ async def count_subscriptions_by_plan(plan_name: str) -> int:
     Counts the number of active subscriptions for a given plan name.
     """
     try:
-        res = supabase.table("subscriptions").select("id", count="exact") \
+        res = await supabase.table("subscriptions").select("id", count="exact") \
             .eq("plan_name", plan_name) \
             .eq("status", "active") \
             .execute()
@@ -280,7 +267,7 @@ async def count_users_on_trial() -> int:
     Counts the number of users currently on a trial period.
     """
     try:
-        res = supabase.table("users").select("id", count="exact") \
+        res = await supabase.table("users").select("id", count="exact") \
             .eq("is_on_trial", True) \
             .execute()
         return res.count
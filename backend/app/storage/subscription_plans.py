@@ -1,9 +1,9 @@
 # backend/app/storage/subscription_plans.py
 
-from app.lib.supabase import get_supabase_admin_client
+from app.lib.supabase import get_admin_db
 from app.logger import logger
 
-supabase = get_supabase_admin_client()
+supabase = get_admin_db()
 
 async def get_plan_by_price_id(price_id: str) -> dict | None:
     """
@@ -17,7 +17,7 @@ async def get_plan_by_price_id(price_id: str) -> dict | None:
         A dictionary representing the plan, or None if not found.
     """
     try:
-        response = supabase.table("subscription_plans") \
+        response = await supabase.table("subscription_plans") \
             .select("*") \
             .eq("stripe_price_id", price_id) \
             .maybe_single() \
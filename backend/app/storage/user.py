@@ -1,8 +1,10 @@
 # backend/app/storage/user.py
 
 import os
-from supabase import create_client, Client
-from app.lib.supabase import get_supabase_admin_client
+from app.config import HA_PUSH_TARGET_CACHE_TTL_SECONDS
+from app.lib.api_key_utils import invalidate_api_key_user
+from app.lib.ttl_cache import TTLCache
+from app.lib.supabase import get_admin_db
 from app.enode.user import get_all_users as get_enode_users
 from app.models.user import User
 from app.logger import logger
@@ -11,7 +13,16 @@ from datetime import datetime, timezone # NEW: Import datetime and timezone
 # -------------------------------------------------------------------
 # Initialize Supabase admin client (service role key) from `app/lib/supabase.py`
 # -------------------------------------------------------------------
-supabase: Client = get_supabase_admin_client()
+supabase = get_admin_db()
+
+# Tier and HA webhook settings per user, used for every Home Assistant push
+ha_push_target_cache = TTLCache(maxsize=10000, ttl=HA_PUSH_TARGET_CACHE_TTL_SECONDS)
+
+
+def _invalidate_user_caches(user_id: str) -> None:
+    """Drops cached copies of a user's row after it was updated."""
+    invalidate_api_key_user(user_id)
+    ha_push_target_cache.invalidate(user_id)
 
 # -------------------------------------------------------------------
 # ORIGINAL FUNCTIONS (restored in full)
@@ -23,7 +34,7 @@ async def get_all_users_with_enode_info():
     """
     try:
         logger.info("🔎 Fetching Supabase users...")
-        res = supabase.table("users").select("id, email, name, role, is_approved").limit(1000).execute()
+        res = await supabase.table("users").select("id, email, name, role, is_approved").limit(1000).execute()
         users = res.data or []
         logger.info(f"ℹ️ Found {len(users)} users in Supabase")
 
@@ -58,7 +69,7 @@ async def set_user_approval(user_id: str, is_approved: bool) -> None:
     Update the `is_approved` column for a given user.
     """
     try:
-        result = supabase.table("users") \
+        result = await supabase.table("users") \
             .update({"is_approved": is_approved}) \
             .eq("id", user_id) \
             .execute()
@@ -75,7 +86,7 @@ async def get_user_approved_status(user_id: str) -> bool:
     Return the `is_approved` status for a given user ID.
     """
     try:
-        result = supabase.table("users").select("is_approved").eq("id", user_id).maybe_single().execute()
+        result = await supabase.table("users").select("is_approved").eq("id", user_id).maybe_single().execute()
         if not result.data:
             return False
         return result.data.get("is_approved", False)
@@ -88,7 +99,7 @@ async def get_user_accepted_terms(user_id: str) -> bool:
     Return the `accepted_terms` status for a given user ID.
     """
     try:
-        result = supabase.table("users").select("accepted_terms").eq("id", user_id).maybe_single().execute()
+        result = await supabase.table("users").select("accepted_terms").eq("id", user_id).maybe_single().execute()
         if not result.data:
             return False
         return result.data.get("accepted_terms", False)
@@ -101,7 +112,7 @@ async def get_user_by_id(user_id: str) -> User | None:
     Fetch a single user by ID. Returns an instance of `User` model or None.
     """
     try:
-        response = supabase.table("users") \
+        response = await supabase.table("users") \
             .select("id, email, role, name, notify_offline, notification_preferences, phone_number, phone_verified, stripe_customer_id, tier, sms_credits, purchased_api_tokens, is_on_trial, trial_ends_at") \
             .eq("id", user_id) \
             .maybe_single() \
@@ -126,13 +137,14 @@ async def update_user_stripe_id(user_id: str, stripe_customer_id: str) -> None:
     Update the `stripe_customer_id` column for a given user.
     """
     try:
-        result = supabase.table("users") \
+        result = await supabase.table("users") \
             .update({"stripe_customer_id": stripe_customer_id}) \
             .eq("id", user_id) \
             .execute()
 
         if not result.data:
             raise Exception("No rows were updated for stripe_customer_id")
+        _invalidate_user_caches(user_id)
         logger.info(f"✅ Updated stripe_customer_id={stripe_customer_id} for user_id={user_id}")
     except Exception as e:
         logger.error(f"[❌ update_user_stripe_id] {e}")
@@ -142,7 +154,7 @@ async def is_subscriber(user_id: str) -> bool:
     """Return True if the user has `is_newsletter` flag set in interest."""
     try:
         result = (
-            supabase.table("interest")
+            await supabase.table("interest")
             .select("is_newsletter")
             .eq("user_id", user_id)
             .maybe_single()
@@ -161,7 +173,7 @@ async def get_user_online_status(user_id: str) -> str:
     Returns one of: “green”, “yellow”, “red”, or “grey”.
     """
     try:
-        result = supabase.table("vehicles").select("online").eq("user_id", user_id).execute()
+        result = await supabase.table("vehicles").select("online").eq("user_id", user_id).execute()
         vehicles = result.data or []
 
         if not vehicles:
@@ -186,7 +198,7 @@ async def update_user_terms(user_id: str, accepted_terms: bool):
     Update the `accepted_terms` column for a given user.
     """
     try:
-        result = supabase.table("users").update({"accepted_terms": accepted_terms}).eq("id", user_id).execute()
+        result = await supabase.table("users").update({"accepted_terms": accepted_terms}).eq("id", user_id).execute()
         logger.info(f"✅ Updated accepted_terms={accepted_terms} for user_id={user_id}")
         return result
     except Exception as e:
@@ -198,10 +210,11 @@ async def update_notify_offline(user_id: str, notify_offline: bool):
     Update the `notify_offline` column for a given user.
     """
     try:
-        result = supabase.table("users") \
+        result = await supabase.table("users") \
             .update({"notify_offline": notify_offline}) \
             .eq("id", user_id) \
             .execute()
+        _invalidate_user_caches(user_id)
         logger.info(f"✅ Updated notify_offline={notify_offline} for user_id={user_id}")
         return result
     except Exception as e:
@@ -218,7 +231,7 @@ async def get_user_by_email(email: str) -> dict | None:
     Returns a dict with user fields, or None if not found.
     """
     try:
-        response = supabase.table("users") \
+        response = await supabase.table("users") \
             .select("id, email, name, role, is_approved, is_subscribed") \
             .eq("email", email) \
             .maybe_single() \
@@ -242,13 +255,13 @@ async def set_user_subscription(email: str, is_subscribed: bool) -> dict:
     """
     try:
         # 1) Perform the update
-        _ = supabase.table("users") \
+        _ = await supabase.table("users") \
             .update({"is_subscribed": is_subscribed}) \
             .eq("email", email) \
             .execute()
 
         # 2) Fetch the updated row separately
-        select_resp = supabase.table("users") \
+        select_resp = await supabase.table("users") \
             .select("id, email, name, role, is_approved, is_subscribed") \
             .eq("email", email) \
             .maybe_single() \
@@ -277,7 +290,7 @@ async def update_user_subscription(
     """
     try:
         resp = (
-            supabase.table("users")
+            await supabase.table("users")
             .update({"tier": tier, "subscription_status": status})
             .eq("id", user_id)
             .execute()
@@ -285,6 +298,7 @@ async def update_user_subscription(
         # Check that a row was updated
         if not resp.data:
             raise Exception(f"No rows updated for user {user_id}")
+        _invalidate_user_caches(user_id)
         logger.info(
             f"✅ Updated subscription for user {user_id}: tier={tier}, status={status}"
         )
@@ -296,11 +310,8 @@ async def add_user_sms_credits(user_id: str, credits: int) -> None:
     """
     Adds SMS credits to the user's balance in the `sms_credits` column.
     """
-    from app.lib.supabase import get_supabase_admin_client
-    supabase = get_supabase_admin_client()
-
     # Read current credits
-    resp = supabase \
+    resp = await supabase \
         .table("users") \
         .select("sms_credits") \
         .eq("id", user_id) \
@@ -309,16 +320,17 @@ async def add_user_sms_credits(user_id: str, credits: int) -> None:
     current = resp.data.get("sms_credits", 0) if resp.data else 0
 
     # Update with new credits
-    supabase \
+    await supabase \
         .table("users") \
         .update({"sms_credits": current + credits}) \
         .eq("id", user_id) \
         .execute()
+    _invalidate_user_caches(user_id)
 
 async def get_onboarding_status(user_id: str) -> dict | None:
     """Retrieves the onboarding progress status for a given user."""
     try:
-        result = supabase.table("onboarding_progress") \
+        result = await supabase.table("onboarding_progress") \
             .select("*") \
             .eq("user_id", user_id) \
             .maybe_single() \
@@ -334,7 +346,7 @@ async def get_onboarding_status(user_id: str) -> dict | None:
 async def set_welcome_sent_if_needed(user_id: str) -> None:
     """Sets the `welcome_sent` flag to True for a user's onboarding progress."""
     try:
-        supabase.table("onboarding_progress") \
+        await supabase.table("onboarding_progress") \
             .update({"welcome_sent": True}) \
             .eq("user_id", user_id) \
             .execute()
@@ -347,7 +359,7 @@ async def create_onboarding_row(user_id: str) -> dict | None:
     Returns the inserted row as dict, or None on failure.
     """
     try:
-        result = supabase.table("onboarding_progress").insert({
+        result = await supabase.table("onboarding_progress").insert({
             "user_id": user_id
         }).execute()
 
@@ -359,22 +371,23 @@ async def create_onboarding_row(user_id: str) -> dict | None:
         logger.error(f"[❌ create_onboarding_row] {e}")
         return None
 
-def set_ha_webhook_settings(user_id: str, webhook_id: str, external_url: str) -> bool:
+async def set_ha_webhook_settings(user_id: str, webhook_id: str, external_url: str) -> bool:
     """Saves Home Assistant webhook settings for a user."""
     try:
-        result = supabase.table("users") \
+        result = await supabase.table("users") \
             .update({"ha_webhook_id": webhook_id, "ha_external_url": external_url}) \
             .eq("id", user_id) \
             .execute()
+        ha_push_target_cache.invalidate(user_id)
         return result.status_code == 204
     except Exception as e:
         logger.error(f"[❌ set_ha_webhook_settings] {e}")
         return False
 
-def get_ha_webhook_settings(user_id: str) -> dict | None:
+async def get_ha_webhook_settings(user_id: str) -> dict | None:
     """Retrieves Home Assistant webhook settings for a user."""
     try:
-        result = supabase.table("users") \
+        result = await supabase.table("users") \
             .select("ha_webhook_id, ha_external_url") \
             .eq("id", user_id) \
             .maybe_single() \
@@ -390,13 +403,30 @@ def get_ha_webhook_settings(user_id: str) -> dict | None:
         logger.error(f"[❌ get_ha_webhook_settings] {e}")
         return None
       
+async def get_ha_push_target(user_id: str) -> dict | None:
+    """
+    Returns the tier and Home Assistant webhook settings for a user in one row,
+    or None if the user does not exist. Cached in `ha_push_target_cache`;
+    lookup errors are raised and not cached.
+    """
+    async def load():
+        result = await supabase.table("users") \
+            .select("tier, ha_webhook_id, ha_external_url") \
+            .eq("id", user_id) \
+            .maybe_single() \
+            .execute()
+        return result.data if result else None
+
+    return await ha_push_target_cache.get_or_load(user_id, load)
+
 async def update_user_subscription(user_id: str, tier: str, status: str = "active"):
     """Update the user's tier (e.g. 'free', 'basic', 'pro') and status (e.g. 'active', 'canceled')."""
     try:
-        result = supabase.table("users") \
+        result = await supabase.table("users") \
             .update({"tier": tier, "subscription_status": status}) \
             .eq("id", user_id) \
             .execute()
+        _invalidate_user_caches(user_id)
         logger.info(f"[DB] Updated user {user_id} to tier {tier}, status {status}")
         return result
     except Exception as e:
@@ -406,10 +436,11 @@ async def update_user_subscription(user_id: str, tier: str, status: str = "activ
 async def remove_stripe_customer_id(user_id: str):
     """Set stripe_customer_id to NULL for a given user."""
     try:
-        result = supabase.table("users") \
+        result = await supabase.table("users") \
             .update({"stripe_customer_id": None}) \
             .eq("id", user_id) \
             .execute()
+        _invalidate_user_caches(user_id)
         logger.info(f"[DB] Removed stripe_customer_id for user {user_id}")
         return result
     except Exception as e:
@@ -418,8 +449,7 @@ async def remove_stripe_customer_id(user_id: str):
 
 async def get_user_id_by_stripe_customer_id(stripe_customer_id):
     """Retrieves a user ID based on their Stripe customer ID."""
-    supabase = get_supabase_admin_client()
-    result = supabase.table("users").select("id").eq("stripe_customer_id", stripe_customer_id).execute()
+    result = await supabase.table("users").select("id").eq("stripe_customer_id", stripe_customer_id).execute()
     if result and hasattr(result, "data") and result.data:
         return result.data[0]["id"]
     return None
@@ -440,13 +470,14 @@ async def update_user(user_id: str, **kwargs):
             logger.warning(f"[⚠️] update_user called for {user_id} with only None values, no update performed.")
             return
 
-        result = supabase.table("users") \
+        result = await supabase.table("users") \
             .update(update_data) \
             .eq("id", user_id) \
             .execute()
         
         if not result.data:
             raise Exception(f"No rows were updated for user {user_id}")
+        _invalidate_user_caches(user_id)
         
         logger.info(f"[✅] Updated user {user_id} with: {update_data}")
         return result
@@ -459,12 +490,19 @@ async def get_total_user_count() -> int:
     Returns the total number of users in the database.
     """
     try:
-        res = supabase.table("users").select("id", count="exact").execute()
+        res = await supabase.table("users").select("id", count="exact").execute()
         return res.count
     except Exception as e:
         logger.error(f"[❌ get_total_user_count] {e}")
         return 0
 
+async def get_existing_user_ids(user_ids: list[str]) -> set[str]:
+    """Returns the subset of `user_ids` that have a row in users."""
+    if not user_ids:
+        return set()
+    res = await supabase.table("users").select("id").in_("id", user_ids).execute()
+    return {row["id"] for row in (res.data or [])}
+
 async def get_new_user_count(days: int) -> int:
     """
     Returns the number of new users created within the last 'days' days.
@@ -475,7 +513,7 @@ async def get_new_user_count(days: int) -> int:
         time_ago = datetime.utcnow() - timedelta(days=days)
         time_ago_iso = time_ago.isoformat() + "Z" # Supabase expects ISO format with Z for UTC
 
-        res = supabase.table("users").select("id", count="exact").gte("created_at", time_ago_iso).execute()
+        res = await supabase.table("users").select("id", count="exact").gte("created_at", time_ago_iso).execute()
         return res.count
     except Exception as e:
         logger.error(f"[❌ get_new_user_count] {e}")
@@ -489,7 +527,7 @@ async def get_all_customers() -> list[dict]:
         # This query fetches users who have a stripe_customer_id OR
         # whose 'tier' is not 'free' (implying a basic/pro subscription)
         # You might need to adjust the 'tier' logic based on your exact schema for active subscriptions.
-        res = supabase.table("users").select("id, email, name, stripe_customer_id, tier, subscription_status") \
+        res = await supabase.table("users").select("id, email, name, stripe_customer_id, tier, subscription_status") \
             .or_("stripe_customer_id.not.is.null,tier.neq.free") \
             .execute()
         return res.data if hasattr(res, "data") else []
@@ -507,7 +545,7 @@ async def get_user_rate_limit_data(user_id: str) -> dict | None:
     """
     try:
         # 1. Get basic user data, including trial info
-        user_response = supabase.table("users")             .select("tier, linked_vehicle_count, purchased_api_tokens, is_on_trial, trial_ends_at")             .eq("id", user_id)             .maybe_single()             .execute()
+        user_response = await supabase.table("users")             .select("tier, linked_vehicle_count, purchased_api_tokens, is_on_trial, trial_ends_at")             .eq("id", user_id)             .maybe_single()             .execute()
         
         if not user_response.data:
             logger.warning(f"[⚠️] get_user_rate_limit_data: No user record found for rate limit check: {user_id}")
@@ -567,10 +605,10 @@ async def decrement_purchased_api_tokens(user_id: str) -> None:
     Atomically decrements the user's purchased_api_tokens by 1.
     This uses an RPC call to a database function to prevent race conditions.
     """
-    from app.lib.supabase import get_supabase_admin_async_client
-    supabase_async = await get_supabase_admin_async_client()
     try:
-        await supabase_async.rpc('decrement_user_tokens', {'p_user_id': user_id}).execute()
+        # No cache invalidation: the token balance is read through
+        # get_user_rate_limit_data, never from the cached API-key user
+        await supabase.rpc('decrement_user_tokens', {'p_user_id': user_id}).execute()
     except Exception as e:
         logger.error(f"[❌ decrement_purchased_api_tokens] Failed to decrement tokens for user {user_id}: {e}")
         # We might want to raise an exception here to fail the request if the decrement fails
@@ -583,10 +621,9 @@ async def add_purchased_api_tokens(user_id: str, quantity: int) -> None:
     """
     if quantity <= 0:
         return
-    from app.lib.supabase import get_supabase_admin_async_client
-    supabase_async = await get_supabase_admin_async_client()
     try:
-        await supabase_async.rpc('add_user_tokens', {'p_user_id': user_id, 'p_quantity': quantity}).execute()
+        await supabase.rpc('add_user_tokens', {'p_user_id': user_id, 'p_quantity': quantity}).execute()
+        _invalidate_user_caches(user_id)
         logger.info(f"[✅] Added {quantity} tokens to user {user_id}")
     except Exception as e:
         logger.error(f"[❌ add_purchased_api_tokens] Failed to add {quantity} tokens for user {user_id}: {e}")
@@ -1,24 +1,144 @@
 # 📄 backend/app/storage/vehicle.py
 
+from collections import Counter
 from datetime import datetime, timedelta
 import json
 import logging
-from app.lib.supabase import get_supabase_admin_client
+import time
+from typing import Callable, Optional
+from app.config import VEHICLE_CACHE_REFRESH_SECONDS, VEHICLE_STATE_CACHE_MAXSIZE
+from app.lib.supabase import get_admin_db
+from app.lib.ttl_cache import TTLCache
+from app.lib.vehicle_diff import diff_vehicle, flatten_vehicle, vehicle_digest
 from app.logic.vehicle import handle_offline_notification_if_needed
-from app.storage.subscription import update_linked_vehicle_count # NEW IMPORT
 
 logger = logging.getLogger(__name__)
+supabase = get_admin_db()
 
-def get_all_cached_vehicles(user_id: str) -> list[dict]:
+
+class VehicleChangeTracker:
+    """
+    Remembers the last written content hash and fields of each vehicle so
+    unchanged vehicles are not rewritten, and records which fields changed.
+    """
+
+    def __init__(self, maxsize: int, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        # vehicle_id -> (cache_hash, flattened fields, monotonic time of last write)
+        self._states = TTLCache(maxsize=maxsize, ttl=24 * 3600)
+
+        self.skipped_unchanged = 0
+        self.skipped_unchanged_db = 0
+        self.written = 0
+        self.changed = 0
+        self.changed_fields: Counter = Counter()
+
+    def needs_write(self, vehicle_id: str, cache_hash: str) -> bool:
+        """False if the same content was written less than `refresh_seconds` ago."""
+        state = self._states.get(vehicle_id)
+        if state and state[0] == cache_hash and time.monotonic() - state[2] < self.refresh_seconds:
+            self.skipped_unchanged += 1
+            return False
+        return True
+
+    def record_diff(self, vehicle_id: str, cache_hash: str, flat: dict) -> dict | None:
+        """
+        Logs and counts the fields that changed since the last known state.
+        Returns None if no earlier state of the vehicle is known.
+        """
+        state = self._states.get(vehicle_id)
+        if not state:
+            return None
+        if state[0] == cache_hash:
+            return {}
+        diff = diff_vehicle(state[1], flat)
+        self.changed += 1
+        self.changed_fields.update(diff.keys())
+        logger.debug(f"[🔀 vehicle diff] {vehicle_id}: {diff}")
+        return diff
+
+    def remember(self, vehicle_id: str, cache_hash: str, flat: dict, written: bool) -> None:
+        """Stores the state the database now holds for a vehicle."""
+        if written:
+            self.written += 1
+        else:
+            self.skipped_unchanged_db += 1
+        self._states.set(vehicle_id, (cache_hash, flat, time.monotonic()))
+
+    def stats(self) -> dict:
+        """Returns write/skip counters and the most frequently changing fields."""
+        return {
+            "written": self.written,
+            "skipped_unchanged": self.skipped_unchanged,
+            "skipped_unchanged_db": self.skipped_unchanged_db,
+            "changed": self.changed,
+            "top_changed_fields": dict(self.changed_fields.most_common(20)),
+            "refresh_seconds": self.refresh_seconds,
+            "states": self._states.stats(),
+        }
+
+
+vehicle_change_tracker = VehicleChangeTracker(
+    maxsize=VEHICLE_STATE_CACHE_MAXSIZE,
+    refresh_seconds=VEHICLE_CACHE_REFRESH_SECONDS,
+)
+
+# Top-level keys of the Enode vehicle object served to Home Assistant
+HA_VEHICLE_FIELDS = (
+    "chargeState",
+    "information",
+    "location",
+    "odometer",
+    "vendor",
+    "smartChargingPolicy",
+    "capabilities",
+    "lastSeen",
+    "isReachable",
+)
+
+def _cache_projection(fields: tuple[str, ...]) -> str:
+    """PostgREST select list that pulls single keys out of the jsonb vehicle_cache."""
+    return ", ".join(f"{field}:vehicle_cache->{field}" for field in fields)
+
+def project_vehicle(vehicle: dict, fields: tuple[str, ...] = HA_VEHICLE_FIELDS) -> dict:
+    """The keys of `fields` that are set, as returned by a projected read."""
+    return {field: vehicle[field] for field in fields if vehicle.get(field) is not None}
+
+def project_changes(diff: dict | None, fields: tuple[str, ...] = HA_VEHICLE_FIELDS) -> dict | None:
+    """New values of the changed paths of a `diff_vehicle` result that fall under `fields`."""
+    if diff is None:
+        return None
+    return {path: new for path, (_, new) in diff.items() if path.split(".", 1)[0] in fields}
+
+def vehicle_cache_of(row: dict, fields: tuple[str, ...] = HA_VEHICLE_FIELDS) -> dict:
+    """
+    Returns the Enode vehicle object of a `vehicles` row.
+    Accepts rows with the full vehicle_cache (jsonb, or a JSON string from
+    before the jsonb migration) as well as rows read with a projection of `fields`.
+    A vehicle_cache string that is not valid JSON is logged and read as empty.
+    """
+    cache = row.get("vehicle_cache")
+    if isinstance(cache, str):
+        try:
+            return json.loads(cache)
+        except json.JSONDecodeError as e:
+            logger.error(f"[❌ vehicle_cache_of] Invalid vehicle_cache for vehicle {row.get('id')}: {e}")
+            return {}
+    if isinstance(cache, dict):
+        return cache
+    return project_vehicle(row, fields)
+
+async def get_all_cached_vehicles(user_id: str, fields: tuple[str, ...] | None = None) -> list[dict]:
     """
     Return all cached vehicles for a specific user.
+    With `fields`, only those keys of vehicle_cache are read (see `vehicle_cache_of`).
     """
-    supabase = get_supabase_admin_client()
     logger.info(f"[🔎 get_all_cached_vehicles] Fetching vehicles for user_id: {user_id}")
+    columns = f"id, updated_at, {_cache_projection(fields)}" if fields else "id, vehicle_cache, updated_at"
     try:
-        response = supabase \
+        response = await supabase \
             .table("vehicles") \
-            .select("id, vehicle_cache, updated_at") \
+            .select(columns) \
             .eq("user_id", user_id) \
             .execute()
         return response.data or []
@@ -26,82 +146,59 @@ def get_all_cached_vehicles(user_id: str) -> list[dict]:
         logger.error(f"[❌ get_all_cached_vehicles] Exception: {e}")
         return []
 
-async def save_vehicle_data_with_client(vehicle: dict):
-    """
-    Save vehicle cache entry, overwriting if vehicle_id exists.
-    Handles offline notifications if vehicle status changes.
-    """
-    supabase = get_supabase_admin_client()
-    try:
-        vehicle_id = vehicle.get("id") or vehicle.get("vehicle_id")
-        user_id    = vehicle.get("userId") or vehicle.get("user_id")
-        vendor     = vehicle.get("vendor")
-        online     = vehicle.get("isReachable", False)
-        data_str   = json.dumps(vehicle)
-        updated_at = datetime.utcnow().isoformat()
-
-        if not vehicle_id or not user_id:
-            raise ValueError("Missing vehicle_id or user_id in vehicle object")
-
-        payload = {
-            "vehicle_id":   vehicle_id,
-            "user_id":      user_id,
-            "vendor":       vendor,
-            "online":       online,
-            "vehicle_cache": data_str,
-            "updated_at":   updated_at
-        }
+def _vehicle_row(vehicle: dict, flat: dict) -> dict:
+    """Builds the `vehicles` row for an Enode vehicle object and its flattened fields."""
+    vehicle_id = vehicle.get("id") or vehicle.get("vehicle_id")
+    user_id    = vehicle.get("userId") or vehicle.get("user_id")
+    if not vehicle_id or not user_id:
+        raise ValueError("Missing vehicle_id or user_id in vehicle object")
 
-        # --- DEBUG: Show payload and types ---
-        logger.debug(f"[🔍 DEBUG] payload keys: {list(payload.keys())}")
-        logger.debug(f"[🔍 DEBUG] payload types: {{k: type(v) for k,v in payload.items()}}")
+    return {
+        "vehicle_id":   vehicle_id,
+        "user_id":      user_id,
+        "vendor":       vehicle.get("vendor"),
+        "online":       vehicle.get("isReachable", False),
+        "vehicle_cache": vehicle,
+        "cache_hash":   vehicle_digest(flat),
+        "updated_at":   datetime.utcnow().isoformat(),
+    }
 
-        # --- 1) Try fetching existing row ---
-        select_q = supabase.table("vehicles").select("online").eq("vehicle_id", vehicle_id).maybe_single()
-        logger.debug(f"[🔍 DEBUG] about to execute select: {select_q!r}")
-        existing = select_q.execute()
-        logger.debug(f"[🔍 DEBUG] select response repr: {existing!r}")
-        logger.debug(f"[🔍 DEBUG] select.data type: {type(getattr(existing, 'data', None))}, data: {getattr(existing,'data',None)}")
+async def get_vehicle_by_id(vehicle_id: str):
+    """Retrieves a vehicle record by its internal database ID."""
+    response = await supabase.table("vehicles") \
+        .select("*") \
+        .eq("id", vehicle_id) \
+        .maybe_single() \
+        .execute()
 
-        if not getattr(existing, "data", None):
-            logger.info(f"[ℹ️] Vehicle {vehicle_id} is new – skipping notification logic")
-        else:
-            online_old = existing.data.get("online")
-            logger.info(f"[ℹ️] Vehicle {vehicle_id} exists, online_old={online_old}, online_new={online}")
-            await handle_offline_notification_if_needed(
-                vehicle_id=vehicle_id,
-                user_id=user_id,
-                online_old=online_old,
-                online_new=online,
-            )
+    if not response or not response.data:
+        return None
 
-        # --- 2) Upsert ---
-        logger.debug(f"[💾 DEBUG] about to upsert payload")
-        upsert_q = supabase.table("vehicles").upsert(payload, on_conflict=["vehicle_id"])
-        logger.debug(f"[🔍 DEBUG] upsert query repr: {upsert_q!r}")
-        res = upsert_q.execute()
-        # logger.debug(f"[🔍 DEBUG] upsert response repr: {res!r}")
-        logger.debug(f"[🔍 DEBUG] upsert.data type: {type(getattr(res, 'data', None))}, data: {getattr(res,'data',None)}")
+    return response.data
 
-        if not getattr(res, "data", None):
-            logger.warning(f"⚠️ save_vehicle_data_with_client: No data returned, possible failure")
-        else:
-            logger.info(f"✅ Vehicle {vehicle_id} saved for user {user_id}")
-            # Update linked_vehicle_count for the user
-            user_vehicles_res = supabase.table("vehicles").select("id").eq("user_id", user_id).execute()
-            new_linked_count = len(user_vehicles_res.data) if user_vehicles_res.data else 0
-            logger.debug(f"[DEBUG] Calculated new_linked_count for user {user_id}: {new_linked_count}")
-            await update_linked_vehicle_count(user_id, new_linked_count)
+async def get_vehicle_head_by_id(vehicle_id: str):
+    """
+    Retrieves only the identifying columns and updated_at of a vehicle by its
+    internal database ID; enough for ownership checks and snapshot validation.
+    """
+    response = await supabase.table("vehicles") \
+        .select("id, user_id, vehicle_id, updated_at") \
+        .eq("id", vehicle_id) \
+        .maybe_single() \
+        .execute()
 
-    except Exception as e:
-        logger.error(f"[❌ save_vehicle_data_with_client] Exception: {e}")
+    if not response or not response.data:
+        return None
 
+    return response.data
 
-async def get_vehicle_by_id(vehicle_id: str):
-    """Retrieves a vehicle record by its internal database ID."""
-    supabase = get_supabase_admin_client()
-    response = supabase.table("vehicles") \
-        .select("*") \
+async def get_vehicle_status_by_id(vehicle_id: str):
+    """
+    Retrieves the identifying columns of a vehicle plus the HA_VEHICLE_FIELDS
+    keys of its vehicle_cache, by internal database ID.
+    """
+    response = await supabase.table("vehicles") \
+        .select(f"id, user_id, vehicle_id, updated_at, {_cache_projection(HA_VEHICLE_FIELDS)}") \
         .eq("id", vehicle_id) \
         .maybe_single() \
         .execute()
@@ -111,10 +208,19 @@ async def get_vehicle_by_id(vehicle_id: str):
 
     return response.data
 
+async def get_vehicle_statuses_by_ids(vehicle_ids: list[str]) -> list[dict]:
+    """Like `get_vehicle_status_by_id` for many internal database IDs, in one query."""
+    if not vehicle_ids:
+        return []
+    response = await supabase.table("vehicles") \
+        .select(f"id, user_id, vehicle_id, updated_at, {_cache_projection(HA_VEHICLE_FIELDS)}") \
+        .in_("id", vehicle_ids) \
+        .execute()
+    return response.data or []
+
 async def get_vehicle_by_vehicle_id(vehicle_id: str):
     """Retrieves a vehicle record by its Enode vehicle ID."""
-    supabase = get_supabase_admin_client()
-    response = supabase.table("vehicles") \
+    response = await supabase.table("vehicles") \
         .select("*") \
         .eq("vehicle_id", vehicle_id) \
         .maybe_single() \
@@ -125,13 +231,37 @@ async def get_vehicle_by_vehicle_id(vehicle_id: str):
 
     return response.data
 
+async def get_vehicle_hashes_by_vehicle_ids(vehicle_ids: list[str]) -> list[dict]:
+    """
+    Returns vehicle_id, user_id, cache_hash and updated_at of the vehicles
+    with the given Enode vehicle IDs, in one query.
+    """
+    if not vehicle_ids:
+        return []
+    response = await supabase.table("vehicles") \
+        .select("vehicle_id, user_id, cache_hash, updated_at") \
+        .in_("vehicle_id", vehicle_ids) \
+        .execute()
+    return response.data or []
+
+async def get_vehicle_refresh_candidates(active_since: datetime, stale_before: datetime, limit: int) -> list[str]:
+    """
+    Returns users who polled the API since `active_since` and have vehicles
+    last written before `stale_before`, most stale first.
+    """
+    res = await supabase.rpc("get_vehicle_refresh_candidates", {
+        "p_active_since": active_since.isoformat(),
+        "p_stale_before": stale_before.isoformat(),
+        "p_limit": limit,
+    }).execute()
+    return [row["user_id"] for row in (res.data or [])]
+
 async def get_total_vehicle_count() -> int:
     """
     Returns the total number of vehicles in the database.
     """
-    supabase = get_supabase_admin_client()
     try:
-        res = supabase.table("vehicles").select("id", count="exact").execute()
+        res = await supabase.table("vehicles").select("id", count="exact").execute()
         return res.count
     except Exception as e:
         logger.error(f"[❌ get_total_vehicle_count] {e}")
@@ -141,13 +271,100 @@ async def get_new_vehicle_count(days: int) -> int:
     """
     Returns the number of new vehicles created within the last 'days' days.
     """
-    supabase = get_supabase_admin_client()
     try:
         time_ago = datetime.utcnow() - timedelta(days=days)
         time_ago_iso = time_ago.isoformat() + "Z"
 
-        res = supabase.table("vehicles").select("id", count="exact").gte("created_at", time_ago_iso).execute()
+        res = await supabase.table("vehicles").select("id", count="exact").gte("created_at", time_ago_iso).execute()
         return res.count
     except Exception as e:
         logger.error(f"[❌ get_new_vehicle_count] {e}")
-        return 0
\ No newline at end of file
+        return 0
+
+async def _upsert_vehicle_rows(rows: list[dict]) -> dict[str, dict]:
+    """Runs one `upsert_vehicles` RPC call; returns its result rows by vehicle_id."""
+    res = await supabase.rpc("upsert_vehicles", {
+        "p_rows": rows,
+        "p_refresh_seconds": VEHICLE_CACHE_REFRESH_SECONDS,
+    }).execute()
+    return {row["vehicle_id"]: row for row in (res.data or [])}
+
+async def save_vehicles_batch(
+    vehicles: list[dict],
+    on_written: Optional[Callable[[dict, dict, Optional[dict]], None]] = None,
+) -> int:
+    """
+    Saves many vehicle cache entries with a single `upsert_vehicles` RPC call.
+    Vehicles whose content hash matches the last write are skipped, here when
+    it is known in memory and otherwise by the RPC, until the row is older than
+    VEHICLE_CACHE_REFRESH_SECONDS. The RPC reports the database ID and the
+    previous online state of each vehicle, and linked_vehicle_count is kept up
+    to date by triggers on insert/delete. Vehicles must be unique by ID.
+    `on_written(row, result, diff)` is called for every row written, with the
+    RPC result and the `diff_vehicle` changes (None if unknown), and offline
+    notifications are handled for vehicles that already existed. If the bulk
+    call fails, the vehicles are saved one by one so one bad row only loses
+    itself. Returns the number of rows written.
+    """
+    rows = []
+    flats = {}
+    diffs = {}
+    for vehicle in vehicles:
+        try:
+            flat = flatten_vehicle(vehicle)
+            row = _vehicle_row(vehicle, flat)
+        except ValueError as e:
+            logger.warning(f"[⚠️ save_vehicles_batch] Skipping vehicle {vehicle.get('id')}: {e}")
+            continue
+        if not vehicle_change_tracker.needs_write(row["vehicle_id"], row["cache_hash"]):
+            continue
+        diffs[row["vehicle_id"]] = vehicle_change_tracker.record_diff(row["vehicle_id"], row["cache_hash"], flat)
+        rows.append(row)
+        flats[row["vehicle_id"]] = flat
+    if not rows:
+        return 0
+
+    try:
+        results = await _upsert_vehicle_rows(rows)
+    except Exception as e:
+        if len(rows) == 1:
+            logger.error(f"[❌ save_vehicles_batch] Failed to save vehicle {rows[0]['vehicle_id']}: {e}")
+            return 0
+        # One bad row fails the whole statement; save the others one by one
+        logger.warning(f"[⚠️ save_vehicles_batch] Bulk upsert of {len(rows)} vehicle(s) failed, saving them one by one: {e}")
+        results = {}
+        for row in rows:
+            try:
+                results.update(await _upsert_vehicle_rows([row]))
+            except Exception as row_error:
+                logger.error(f"[❌ save_vehicles_batch] Failed to save vehicle {row['vehicle_id']}: {row_error}")
+    if not results:
+        logger.warning(f"⚠️ save_vehicles_batch: No data returned for {len(rows)} vehicle(s), possible failure")
+        return 0
+
+    written = 0
+    for row in rows:
+        result = results.get(row["vehicle_id"])
+        if not result:
+            continue
+        vehicle_change_tracker.remember(row["vehicle_id"], row["cache_hash"], flats[row["vehicle_id"]], result.get("written", True))
+        if not result.get("written", True):
+            continue
+        written += 1
+        try:
+            if on_written is not None:
+                on_written(row, result, diffs[row["vehicle_id"]])
+            if result.get("inserted"):
+                logger.info(f"[ℹ️] Vehicle {row['vehicle_id']} is new – skipping notification logic")
+                continue
+            await handle_offline_notification_if_needed(
+                vehicle_id=row["vehicle_id"],
+                user_id=row["user_id"],
+                online_old=result.get("online_old"),
+                online_new=row["online"],
+            )
+        except Exception as e:
+            logger.error(f"[❌ save_vehicles_batch] Post-write handling failed for vehicle {row['vehicle_id']}: {e}")
+
+    logger.info(f"✅ Saved {written} of {len(rows)} vehicle(s) in one upsert")
+    return written
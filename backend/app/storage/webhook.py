@@ -4,10 +4,10 @@ from datetime import datetime
 from typing import Optional
 import logging
 from app.enode.webhook import fetch_enode_webhook_subscriptions
-from app.lib.supabase import get_supabase_admin_client
+from app.lib.supabase import get_admin_db
 
 logger = logging.getLogger(__name__)
-supabase = get_supabase_admin_client()
+supabase = get_admin_db()
 
 async def sync_webhook_subscriptions_from_enode():
     """
@@ -20,7 +20,7 @@ async def sync_webhook_subscriptions_from_enode():
 
     for item in enode_subs:
         try:
-            response = supabase.table("webhook_subscriptions").upsert({
+            response = await supabase.table("webhook_subscriptions").upsert({
                 "enode_webhook_id": item["id"],
                 "url": item["url"],
                 "events": item.get("events", []),
@@ -41,7 +41,7 @@ async def sync_webhook_subscriptions_from_enode():
 async def get_all_webhook_subscriptions():
     """Retrieves all webhook subscriptions from the database, ordered by creation date."""
     try:
-        result = supabase.table("webhook_subscriptions") \
+        result = await supabase.table("webhook_subscriptions") \
             .select("*") \
             .order("created_at", desc=True) \
             .limit(100) \
@@ -51,7 +51,7 @@ async def get_all_webhook_subscriptions():
         logger.error(f"[❌ get_all_webhook_subscriptions] {e}")
         return []
 
-def get_webhook_logs(
+async def get_webhook_logs(
     limit: int = 50,
     event_filter: Optional[str] = None,
     user_filter: Optional[str] = None,
@@ -84,7 +84,7 @@ def get_webhook_logs(
                 logger.info(f"[🔎 webhook_logs] Filtering by vehicle_id_text like: {cleaned}")
                 query = query.ilike("vehicle_id_text", f"%{cleaned}%")
 
-        res = query.execute()
+        res = await query.execute()
         logger.info(f"[✅ webhook_logs] Returned {len(res.data or [])} logs")
         return res.data or []
     except Exception as e:
@@ -108,7 +108,7 @@ async def save_webhook_subscription(enode_response: dict):
         "created_at": enode_response.get("createdAt"),
     }
 
-    res = supabase.table("webhook_subscriptions") \
+    res = await supabase.table("webhook_subscriptions") \
         .upsert(data, on_conflict=["enode_webhook_id"]) \
         .execute()
 
@@ -123,7 +123,7 @@ async def mark_webhook_as_inactive(enode_webhook_id: str):
     Mark webhook as inactive before deleting from Enode.
     """
     
-    res = supabase.table("webhook_subscriptions") \
+    res = await supabase.table("webhook_subscriptions") \
         .update({
             "is_active": False,
             "ended_at": "now()"
@@ -137,7 +137,7 @@ async def mark_webhook_as_inactive(enode_webhook_id: str):
         logger.warning(f"[⚠️ mark_webhook_as_inactive] No data updated for {enode_webhook_id}")
     return res
 
-def save_webhook_event(payload: dict | list):
+async def save_webhook_event(payload: dict | list):
     """
     Save a webhook event with metadata like user_id, vehicle_id, and event type.
     Enhanced with debug logging.
@@ -156,7 +156,7 @@ def save_webhook_event(payload: dict | list):
         user_id = vehicle_id = event = version = None
 
     try:
-        response = supabase.table("webhook_logs").insert({
+        response = await supabase.table("webhook_logs").insert({
             "created_at": timestamp,
             "payload": payload,
             "user_id": user_id,
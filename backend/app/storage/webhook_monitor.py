@@ -1,16 +1,14 @@
 from app.storage.settings import get_setting_by_name
 from app.storage.status_logs import log_status
 from app.storage.webhook import sync_webhook_subscriptions_from_enode
-from app.lib.supabase import get_supabase_admin_client
-from app.enode.auth import get_access_token
-from app.config import ENODE_BASE_URL
+from app.lib.supabase import get_admin_db
+from app.enode.client import enode_client
 
 from datetime import datetime, timedelta, timezone
-import httpx
 import logging
 
 logger = logging.getLogger(__name__)
-supabase = get_supabase_admin_client()
+supabase = get_admin_db()
 
 async def monitor_webhook_health():
     """Monitors the health of Enode webhooks, syncing subscriptions and logging their status."""
@@ -20,7 +18,7 @@ async def monitor_webhook_health():
     logger.info("[🔄] Syncing webhook subscriptions from Enode...")
     await sync_webhook_subscriptions_from_enode()
     logger.info("[✅] Sync complete")
-    result = supabase.table("webhook_subscriptions").select("*").execute()
+    result = await supabase.table("webhook_subscriptions").select("*").execute()
     subscriptions = result.data or []
     inactive = [s for s in subscriptions if not s.get("is_active")]
 
@@ -51,7 +49,7 @@ async def monitor_webhook_health():
     logger.info(f"[⚙️] auto_reactivate: {auto_test}")
 
     # 3. Read current subscriptions
-    result = supabase.table("webhook_subscriptions").select("*").execute()
+    result = await supabase.table("webhook_subscriptions").select("*").execute()
     subscriptions = result.data or []
 
     logger.info(f"[📋] Checking {len(subscriptions)} webhook(s)...")
@@ -94,14 +92,9 @@ async def monitor_webhook_health():
 
 async def test_enode_webhook(webhook_id: str):
     """Sends a test webhook to a specified Enode webhook ID."""
-    token = await get_access_token()
-    url = f"{ENODE_BASE_URL}/webhooks/{webhook_id}/test"
-    headers = {"Authorization": f"Bearer {token}"}
-
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.post(url, headers=headers)
-            logger.info(f"[📡] Test result {webhook_id}: {res.status_code} {res.text[:100]}")
-            return res
+        res = await enode_client.post(f"/webhooks/{webhook_id}/test", "POST /webhooks/{id}/test")
+        logger.info(f"[📡] Test result {webhook_id}: {res.status_code} {res.text[:100]}")
+        return res
     except Exception as e:
         logger.error(f"[❌] Failed to send test webhook to {webhook_id}: {e}")
\ No newline at end of file
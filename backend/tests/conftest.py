@@ -0,0 +1,17 @@
+"""
+Shared test setup.
+
+The app modules read their configuration and create their Supabase clients at
+import time, so dummy credentials are set before anything from `app` is
+imported. Nothing here talks to the network.
+"""
+import os
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_ANON_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.x")
+os.environ.setdefault("SUPABASE_SERVICE_ROLE_KEY", "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoic2VydmljZSJ9.x")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "jwtsecret")
+os.environ.setdefault("ENODE_WEBHOOK_SECRET", "secret")
+os.environ.setdefault("BREVO_API_KEY", "x")
+os.environ.setdefault("STRIPE_SECRET_KEY", "sk_test_x")
+os.environ.setdefault("INTERNAL_API_KEY", "internal")
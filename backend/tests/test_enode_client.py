@@ -0,0 +1,136 @@
+import asyncio
+import importlib.util
+from pathlib import Path
+
+import httpx
+
+from app.enode import vehicle as enode_vehicle
+from app.enode.client import EnodeClient
+
+FAKE_SERVER = Path(__file__).resolve().parents[2] / "scripts" / "fake_enode_server.py"
+
+
+def load_fake_server():
+    spec = importlib.util.spec_from_file_location("fake_enode_server", FAKE_SERVER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+fake_server = load_fake_server()
+
+
+def make_client(*fake_args: str, max_attempts: int = 3, max_retry_after: float = 5) -> EnodeClient:
+    """An EnodeClient talking to an in-process fake Enode server started with `fake_args`."""
+    client = EnodeClient(
+        base_url="http://enode.fake",
+        auth_url="http://enode.fake/oauth2/token",
+        client_id="fake",
+        client_secret="fake",
+        timeout=5,
+        connect_timeout=5,
+        max_connections=5,
+        max_attempts=max_attempts,
+        retry_backoff=0.001,
+        max_retry_after=max_retry_after,
+    )
+    app = fake_server.build_app(fake_server.parse_args(list(fake_args)))
+    client._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app))
+    return client
+
+
+async def server_stats(client: EnodeClient) -> dict:
+    return (await client._http().get("http://enode.fake/__stats")).json()
+
+
+async def test_concurrent_requests_share_one_token():
+    client = make_client()
+
+    responses = await asyncio.gather(*(client.get("/vehicles") for _ in range(5)))
+
+    assert all(r.status_code == 200 for r in responses)
+    assert (await server_stats(client))["tokens_issued"] == 1
+    assert client.stats()["token_refreshes"] == 1
+
+
+async def test_token_fetch_is_retried_after_5xx():
+    client = make_client("--fail-first", "1")
+
+    assert (await client.get("/vehicles")).status_code == 200
+    assert client.stats()["endpoints"]["POST /oauth2/token"]["retries"] == 1
+
+
+async def test_idempotent_request_is_retried_after_5xx():
+    client = make_client()
+    await client.get_access_token()
+    await client._http().post("http://enode.fake/__reset", params={"fail_first": 2})
+
+    response = await client.get("/vehicles")
+
+    assert response.status_code == 200
+    assert client.stats()["endpoints"]["GET /vehicles"]["retries"] == 2
+    assert (await server_stats(client))["requests"] == {"GET /vehicles": 3}
+
+
+async def test_charging_command_is_not_retried_after_5xx():
+    client = make_client()
+    await client.get_access_token()
+    await client._http().post("http://enode.fake/__reset", params={"fail_first": 1})
+
+    response = await client.post("/vehicles/v1/charging", "POST /vehicles/{id}/charging", json={"action": "START"})
+
+    assert response.status_code == 503
+    assert client.stats()["endpoints"]["POST /vehicles/{id}/charging"]["requests"] == 1
+    assert (await server_stats(client))["requests"] == {"POST /vehicles/v1/charging": 1}
+
+
+async def test_429_is_retried_after_retry_after():
+    client = make_client("--rate-limit-first", "2", "--retry-after", "0")
+
+    response = await client.get("/vehicles")
+
+    assert response.status_code == 200
+    stats = client.stats()["endpoints"]
+    assert stats["POST /oauth2/token"]["retries"] + stats["GET /vehicles"]["retries"] == 2
+
+
+async def test_429_with_long_retry_after_is_returned_to_the_caller():
+    client = make_client("--retry-after", "60", max_retry_after=5)
+    await client.get_access_token()
+    await client._http().post("http://enode.fake/__reset", params={"rate_limit_first": 1})
+
+    response = await client.get("/vehicles")
+
+    assert response.status_code == 429
+    assert client.stats()["endpoints"]["GET /vehicles"]["retries"] == 0
+
+
+async def test_revoked_token_is_refreshed_once_on_401():
+    client = make_client()
+    assert (await client.get("/vehicles")).status_code == 200
+
+    await client._http().post("http://enode.fake/__revoke")
+    response = await client.get("/vehicles")
+
+    assert response.status_code == 200
+    assert client.stats()["token_refreshes"] == 2
+
+
+async def test_get_all_vehicles_pages_through_the_fleet(monkeypatch):
+    client = make_client("--users", "7", "--vehicles-per-user", "3")
+    monkeypatch.setattr(enode_vehicle, "enode_client", client)
+
+    seen = []
+    after = None
+    pages = 0
+    while True:
+        page = await enode_vehicle.get_all_vehicles(page_size=5, after=after)
+        pages += 1
+        seen += [v["id"] for v in page["data"]]
+        after = page["pagination"]["after"]
+        if not after:
+            break
+
+    assert pages == 5
+    assert len(seen) == len(set(seen)) == 21
+
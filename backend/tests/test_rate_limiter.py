@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.services import rate_limiter
+from app.services.rate_limiter import SCOPE_USER, SCOPE_VEHICLE, InMemoryCounterBackend, PollCounter
+
+
+class FakePollLogs:
+    """poll_logs as seen by the rate limiter: per-day counts per user."""
+
+    def __init__(self):
+        self.by_day: dict[str, int] = {}
+        self.seed_reads = 0
+
+    async def count_polls_by_day(self, since, user_id=None, vehicle_id=None, include_not_modified=False):
+        self.seed_reads += 1
+        return dict(self.by_day)
+
+
+@pytest.fixture
+def poll_logs(monkeypatch):
+    logs = FakePollLogs()
+    monkeypatch.setattr(rate_limiter, "count_polls_by_day", logs.count_polls_by_day)
+    return logs
+
+
+def day(ts: datetime) -> str:
+    return ts.date().isoformat()
+
+
+async def test_counts_recorded_polls_after_seeding(poll_logs):
+    now = datetime.now(timezone.utc)
+    poll_logs.by_day = {day(now): 4}
+    counter = PollCounter(InMemoryCounterBackend(), reconcile_seconds=60)
+
+    assert await counter.count_since(SCOPE_USER, "u1", now) == 4
+    await counter.record(SCOPE_USER, "u1", now)
+    await counter.record(SCOPE_USER, "u1", now)
+
+    assert await counter.count_since(SCOPE_USER, "u1", now) == 6
+    assert poll_logs.seed_reads == 1
+
+
+async def test_window_only_sums_days_since_its_start(poll_logs):
+    now = datetime.now(timezone.utc)
+    poll_logs.by_day = {day(now - timedelta(days=10)): 7, day(now - timedelta(days=1)): 2, day(now): 1}
+    counter = PollCounter(InMemoryCounterBackend(), reconcile_seconds=60)
+
+    assert await counter.count_since(SCOPE_USER, "u1", now - timedelta(days=1)) == 3
+    assert await counter.count_since(SCOPE_USER, "u1", now - timedelta(days=30)) == 10
+
+
+async def test_reseed_keeps_polls_not_yet_in_poll_logs(poll_logs):
+    now = datetime.now(timezone.utc)
+    backend = InMemoryCounterBackend()
+    counter = PollCounter(backend, reconcile_seconds=60)
+    await counter.count_since(SCOPE_VEHICLE, "v1", now)
+    for _ in range(3):
+        await counter.record(SCOPE_VEHICLE, "v1", now)
+    # Only one of the three poll_logs inserts has landed when the reseed runs
+    poll_logs.by_day = {day(now): 1}
+
+    await counter._seed(SCOPE_VEHICLE, "v1", f"{SCOPE_VEHICLE}:v1")
+
+    assert await counter.count_since(SCOPE_VEHICLE, "v1", now) == 3
+
+
+async def test_reseed_corrects_counters_that_fell_behind(poll_logs):
+    now = datetime.now(timezone.utc)
+    counter = PollCounter(InMemoryCounterBackend(), reconcile_seconds=60)
+    await counter.count_since(SCOPE_USER, "u1", now)
+    poll_logs.by_day = {day(now): 5}
+
+    await counter._seed(SCOPE_USER, "u1", f"{SCOPE_USER}:u1")
+
+    assert await counter.count_since(SCOPE_USER, "u1", now) == 5
+
+
+async def test_falls_back_to_poll_logs_when_the_backend_fails(monkeypatch):
+    class BrokenBackend(InMemoryCounterBackend):
+        async def get_buckets(self, key):
+            raise ConnectionError("redis down")
+
+    calls = []
+
+    async def count_polls_since(user_id, since, include_not_modified=False):
+        calls.append((user_id, include_not_modified))
+        return 9
+
+    monkeypatch.setattr(rate_limiter, "count_polls_since", count_polls_since)
+    monkeypatch.setattr(rate_limiter, "NOT_MODIFIED_POLLS_COUNT", False)
+    counter = PollCounter(BrokenBackend(), reconcile_seconds=60)
+
+    assert await counter.count_since(SCOPE_USER, "u1", datetime.now(timezone.utc)) == 9
+    assert calls == [("u1", False)]
+    assert counter.stats()["fallbacks"] == 1
+
+
+async def test_memory_backend_prunes_keys_not_read_for_a_reconcile_period(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, "monotonic", lambda: clock[0])
+    backend = InMemoryCounterBackend()
+
+    await backend.seed("user:old", {"2026-01-01": 1}, ttl=60)
+    clock[0] += 200
+    await backend.seed("user:new", {}, ttl=60)
+
+    assert backend.size() == 1
+    assert await backend.get_buckets("user:new") == {}
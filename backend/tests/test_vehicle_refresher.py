@@ -0,0 +1,52 @@
+import pytest
+
+from app.services import vehicle_refresher as refresher_module
+from app.services.vehicle_refresher import RefreshFailed, VehicleRefresher
+
+
+def make_refresher() -> VehicleRefresher:
+    return VehicleRefresher(
+        concurrency=2,
+        min_interval=60,
+        stale_after=300,
+        sweep_interval=0,
+        active_window=600,
+        sweep_limit=10,
+    )
+
+
+async def test_refresh_after_a_throttled_failure_raises(monkeypatch):
+    async def enode_down(user_id):
+        raise ConnectionError("enode down")
+
+    monkeypatch.setattr(refresher_module, "get_user_vehicles_enode", enode_down)
+    refresher = make_refresher()
+
+    with pytest.raises(ConnectionError):
+        await refresher.refresh("u1")
+    # Within min_interval no new fetch runs; the earlier failure is reported
+    with pytest.raises(RefreshFailed):
+        await refresher.refresh("u1")
+    assert refresher.stats()["failed"] == 1
+    assert refresher.stats()["throttled"] == 1
+
+
+async def test_refresh_after_a_throttled_success_returns(monkeypatch):
+    saved = []
+
+    async def enode_vehicles(user_id):
+        return [{"id": "v1"}]
+
+    async def save_vehicles(vehicles):
+        saved.extend(vehicles)
+        return len(vehicles)
+
+    monkeypatch.setattr(refresher_module, "get_user_vehicles_enode", enode_vehicles)
+    monkeypatch.setattr(refresher_module, "save_vehicles", save_vehicles)
+    refresher = make_refresher()
+
+    await refresher.refresh("u1")
+    await refresher.refresh("u1")
+
+    assert saved == [{"id": "v1", "userId": "u1"}]
+    assert refresher.stats()["refreshed"] == 1
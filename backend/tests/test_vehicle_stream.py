@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+
+from app.api import ha
+from app.api.dependencies import require_pro_tier
+from app.auth.api_key_auth import get_api_key_user
+from app.models.user import User
+from app.services.vehicle_stream import EVENT_DELTA, StreamLimitExceeded, VehicleStreamHub
+
+
+async def no_state() -> list[dict]:
+    return []
+
+
+def make_hub(max_per_user: int = 3) -> VehicleStreamHub:
+    return VehicleStreamHub(buffer_size=10, queue_size=10, heartbeat_seconds=5, max_per_user=max_per_user)
+
+
+async def test_stream_reserves_slot_before_first_read():
+    hub = make_hub(max_per_user=1)
+    stream = hub.stream("u1", None, no_state)
+
+    with pytest.raises(StreamLimitExceeded):
+        hub.stream("u1", None, no_state)
+    assert hub.stats()["rejected"] == 1
+
+    await stream.aclose()
+    assert hub.stats()["subscribers"] == 0
+
+
+async def test_aclose_releases_slot_of_stream_never_read():
+    hub = make_hub(max_per_user=1)
+    stream = hub.stream("u1", None, no_state)
+
+    await stream.aclose()
+
+    assert hub.stats()["subscribers"] == 0
+    await hub.stream("u1", None, no_state).aclose()
+
+
+async def test_stream_delivers_published_frames_and_releases_slot_on_close():
+    hub = make_hub()
+    stream = hub.stream("u1", None, no_state)
+    hub.publish("u1", EVENT_DELTA, {"vehicleId": "v1", "changes": {"chargeState.batteryLevel": 80}})
+    hub.publish("u2", EVENT_DELTA, {"vehicleId": "v2", "changes": {}})
+
+    assert (await anext(stream)).startswith(b"retry:")
+    frame = await anext(stream)
+    assert b"event: delta" in frame and b'"vehicleId":"v1"' in frame
+
+    await stream.aclose()
+    assert hub.stats()["subscribers"] == 0
+
+
+async def test_resume_replays_only_missed_frames_of_the_user():
+    hub = make_hub()
+    hub.publish("u1", EVENT_DELTA, {"n": 1})
+    hub.publish("u2", EVENT_DELTA, {"n": 2})
+    hub.publish("u1", EVENT_DELTA, {"n": 3})
+    first_id = hub._buffer[0][2].split(b"\n", 1)[0][len(b"id: "):].decode()
+
+    stream = hub.stream("u1", first_id, no_state)
+    await anext(stream)  # retry hint
+    replayed = await anext(stream)
+
+    assert b'{"n":3}' in replayed
+    assert hub.stats()["resumed"] == 1
+    await stream.aclose()
+
+
+async def test_early_disconnect_does_not_leak_stream_slots(monkeypatch):
+    hub = make_hub(max_per_user=3)
+    monkeypatch.setattr(ha, "vehicle_stream_hub", hub)
+    app = FastAPI()
+    app.include_router(ha.router, prefix="/api")
+    app.dependency_overrides[get_api_key_user] = lambda: User(id="u1", email="u1@example.com", role="user", tier="pro")
+    app.dependency_overrides[require_pro_tier] = lambda: None
+
+    async def disconnect():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        # A real server yields here, which is where the cancellation caused
+        # by the disconnect lands: before the first frame is read
+        await asyncio.sleep(0)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/api/ha/stream",
+        "raw_path": b"/api/ha/stream",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [],
+        "client": ("127.0.0.1", 1234),
+        "server": ("testserver", 80),
+    }
+    for _ in range(4):
+        await asyncio.wait_for(app(dict(scope), disconnect, send), timeout=5)
+
+    assert hub.stats()["subscribers"] == 0
+    assert hub.stats()["rejected"] == 0
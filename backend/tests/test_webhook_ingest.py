@@ -0,0 +1,124 @@
+import pytest
+
+from app.services import webhook_ingest
+from app.services.webhook_ingest import WebhookIngestor
+
+
+class Recorder:
+    """Stand-ins for everything the ingestor hands events to."""
+
+    def __init__(self):
+        self.logged = []
+        self.saved = []
+        self.samples = []
+        self.observed = []
+        self.pushed = []
+        self.known_users = {"u1", "u2"}
+        self.fail_save = False
+
+    async def save_webhook_event(self, payload):
+        self.logged.append(payload)
+
+    async def save_vehicles(self, vehicles):
+        if self.fail_save:
+            raise RuntimeError("upsert failed")
+        self.saved.extend(vehicles)
+        return len(vehicles)
+
+    async def get_existing_user_ids(self, user_ids):
+        return {user_id for user_id in user_ids if user_id in self.known_users}
+
+    def submit_push(self, event, user_id):
+        self.pushed.append((event, user_id))
+        return True
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    rec = Recorder()
+    monkeypatch.setattr(webhook_ingest, "save_webhook_event", rec.save_webhook_event)
+    monkeypatch.setattr(webhook_ingest, "save_vehicles", rec.save_vehicles)
+    monkeypatch.setattr(webhook_ingest, "get_existing_user_ids", rec.get_existing_user_ids)
+    monkeypatch.setattr(webhook_ingest.ha_push_dispatcher, "submit", rec.submit_push)
+    monkeypatch.setattr(webhook_ingest.charging_session_detector, "observe", rec.observed.append)
+    monkeypatch.setattr(webhook_ingest.charging_sample_writer, "submit", lambda sample: rec.samples.append(sample) or True)
+    return rec
+
+
+def vehicle_event(user_id: str, vehicle_id: str, last_seen: str, battery: int) -> dict:
+    return {
+        "event": "user:vehicle:updated",
+        "createdAt": last_seen,
+        "user": {"id": user_id},
+        "vehicle": {
+            "id": vehicle_id,
+            "lastSeen": last_seen,
+            "isReachable": True,
+            "chargeState": {"batteryLevel": battery, "isCharging": True, "isPluggedIn": True},
+        },
+    }
+
+
+async def run(ingestor: WebhookIngestor, *payloads) -> None:
+    await ingestor.start()
+    for payload in payloads:
+        assert ingestor.submit(payload)
+    await ingestor.stop()
+
+
+async def test_keeps_latest_event_per_vehicle_and_pushes_it(recorder):
+    ingestor = WebhookIngestor(max_queue_size=100, max_batch_events=100)
+
+    await run(
+        ingestor,
+        [
+            vehicle_event("u1", "v1", "2026-10-18T10:00:02Z", 52),
+            vehicle_event("u1", "v1", "2026-10-18T10:00:01Z", 51),
+        ],
+        vehicle_event("u2", "v2", "2026-10-18T10:00:00Z", 70),
+        {"event": "system:heartbeat"},
+    )
+
+    assert len(recorder.logged) == 3
+    assert sorted((v["id"], v["chargeState"]["batteryLevel"]) for v in recorder.saved) == [("v1", 52), ("v2", 70)]
+    assert sorted(user_id for _, user_id in recorder.pushed) == ["u1", "u2"]
+    stats = ingestor.stats()
+    assert stats["events"] == 4
+    assert stats["coalesced_events"] == 1
+    assert stats["vehicles_written"] == 2
+    assert stats["failed_batches"] == 0
+
+
+async def test_skips_vehicles_of_unknown_users(recorder):
+    ingestor = WebhookIngestor(max_queue_size=100, max_batch_events=100)
+
+    await run(
+        ingestor,
+        [
+            vehicle_event("u1", "v1", "2026-10-18T10:00:00Z", 50),
+            vehicle_event("ghost", "v9", "2026-10-18T10:00:00Z", 50),
+        ],
+    )
+
+    assert [v["id"] for v in recorder.saved] == ["v1"]
+    assert ingestor.stats()["unknown_user_vehicles"] == 1
+    assert [sample["vehicle_id"] for sample in recorder.samples] == ["v1"]
+
+
+async def test_failed_vehicle_save_still_records_samples_and_pushes(recorder):
+    recorder.fail_save = True
+    ingestor = WebhookIngestor(max_queue_size=100, max_batch_events=100)
+
+    await run(ingestor, vehicle_event("u1", "v1", "2026-10-18T10:00:00Z", 50))
+
+    assert recorder.saved == []
+    assert len(recorder.pushed) == 1
+    assert ingestor.stats()["failed_batches"] == 0
+    assert ingestor.stats()["batches"] == 1
+
+
+async def test_rejects_payloads_when_not_running(recorder):
+    ingestor = WebhookIngestor(max_queue_size=1, max_batch_events=100)
+
+    assert not ingestor.submit({"event": "system:heartbeat"})
+    assert ingestor.stats()["rejected_payloads"] == 1
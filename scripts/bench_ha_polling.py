@@ -0,0 +1,83 @@
+"""
+Load benchmark for the Home Assistant polling endpoints.
+
+Starts N concurrent pollers against a running backend and reports latency
+percentiles, throughput and status codes. Run it once against the old build
+and once against the new one to compare.
+
+Example:
+    python scripts/bench_ha_polling.py \
+        --base-url http://localhost:8000 \
+        --api-key $EVLINK_API_KEY \
+        --vehicle-id <vehicle uuid> \
+        --concurrency 200 --duration 30
+
+Note that every successful poll counts against the API key's rate limit.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+async def poller(args, path: str, deadline: float, latencies: list, statuses: Counter):
+    # One client (and connection) per poller, like separate Home Assistant instances.
+    async with httpx.AsyncClient(
+        base_url=args.base_url,
+        headers={"Authorization": f"Bearer {args.api_key}"},
+        timeout=args.timeout,
+    ) as client:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                resp = await client.get(path)
+                statuses[resp.status_code] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+
+
+async def main(args):
+    path = f"/api/ha/status/{args.vehicle_id}" if args.vehicle_id else "/api/ha/vehicles"
+    latencies: list[float] = []
+    statuses: Counter = Counter()
+
+    print(f"⏳ {args.concurrency} pollers -> {args.base_url}{path} for {args.duration}s")
+    deadline = time.perf_counter() + args.duration
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        poller(args, path, deadline, latencies, statuses) for _ in range(args.concurrency)
+    ])
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    total = sum(statuses.values())
+    print(f"requests:   {total} ({total / elapsed:.1f} req/s)")
+    print(f"statuses:   {dict(statuses)}")
+    if latencies:
+        print(f"mean:       {statistics.fmean(latencies):.1f} ms")
+        for pct in (50, 90, 95, 99):
+            print(f"{f'p{pct}:':<12}{percentile(latencies, pct):.1f} ms")
+        print(f"max:        {latencies[-1]:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark concurrent HA polling against the backend.")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--api-key", required=True, help="API key of a user with a high enough rate limit")
+    parser.add_argument("--vehicle-id", help="Poll /api/ha/status/{id}; defaults to /api/ha/vehicles")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--timeout", type=float, default=30)
+    asyncio.run(main(parser.parse_args()))
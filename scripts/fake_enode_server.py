@@ -0,0 +1,200 @@
+"""
+Local fake of the Enode API for exercising the backend's Enode client.
+
+Serves the endpoints the backend calls (token, vehicles, users, charging,
+links, webhooks) from generated in-memory data and can inject latency,
+429 responses with Retry-After and 5xx errors. Tokens are checked, so
+token expiry and refresh can be tested as well.
+
+Example:
+    python scripts/fake_enode_server.py --port 8010 --users 20 \
+        --error-rate 0.1 --rate-limit-rate 0.05 --retry-after 1
+
+    # then start the backend with
+    ENODE_BASE_URL=http://localhost:8010 \
+    ENODE_AUTH_URL=http://localhost:8010/oauth2/token \
+    ENODE_CLIENT_ID=fake ENODE_CLIENT_SECRET=fake ...
+
+GET /__stats returns request counts per path and the number of tokens issued;
+POST /__reset clears them (and takes fail_first/rate_limit_first to re-arm the
+fault injection), POST /__revoke invalidates every issued token.
+The backend tests (backend/tests/test_enode_client.py) serve
+`build_app(parse_args([...]))` in-process through httpx.ASGITransport.
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+
+def build_app(args) -> FastAPI:
+    app = FastAPI(title="Fake Enode API")
+    rng = random.Random(args.seed)
+    requests_by_path: Counter = Counter()
+    tokens: dict[str, float] = {}
+    state = {"tokens_issued": 0, "fail_first": args.fail_first, "rate_limit_first": args.rate_limit_first}
+
+    users = {}
+    for u in range(args.users):
+        user_id = f"user-{u}"
+        users[user_id] = [
+            {
+                "id": str(uuid.UUID(int=rng.getrandbits(128))),
+                "userId": user_id,
+                "vendor": rng.choice(["TESLA", "VOLKSWAGEN", "XPENG"]),
+                "isReachable": True,
+                "lastSeen": datetime.now(timezone.utc).isoformat(),
+                "information": {"brand": "Fake", "model": f"Model {v}", "year": 2024},
+                "chargeState": {"batteryLevel": rng.randint(10, 100), "range": rng.randint(50, 500), "isCharging": False, "isPluggedIn": False},
+                "location": {"latitude": 59.3, "longitude": 18.0},
+                "odometer": {"distance": rng.randint(1000, 90000)},
+                "smartChargingPolicy": {"isEnabled": False},
+                "capabilities": {},
+            }
+            for v in range(args.vehicles_per_user)
+        ]
+    webhooks = {}
+
+    def page(items: list, request: Request) -> dict:
+        size = int(request.query_params.get("pageSize", 50))
+        after = request.query_params.get("after")
+        start = int(after) if after else 0
+        chunk = items[start:start + size]
+        next_after = str(start + size) if start + size < len(items) else None
+        return {"data": chunk, "pagination": {"after": next_after, "before": None}}
+
+    @app.middleware("http")
+    async def faults(request: Request, call_next):
+        path = request.url.path
+        if path.startswith("/__"):
+            return await call_next(request)
+        requests_by_path[f"{request.method} {path}"] += 1
+        if args.latency_ms:
+            await asyncio.sleep(rng.uniform(0.5, 1.5) * args.latency_ms / 1000)
+        if state["fail_first"] > 0:
+            state["fail_first"] -= 1
+            return JSONResponse({"error": "injected failure"}, status_code=503)
+        if state["rate_limit_first"] > 0:
+            state["rate_limit_first"] -= 1
+            return JSONResponse({"error": "rate limited"}, status_code=429, headers={"Retry-After": str(args.retry_after)})
+        roll = rng.random()
+        if roll < args.rate_limit_rate:
+            return JSONResponse({"error": "rate limited"}, status_code=429, headers={"Retry-After": str(args.retry_after)})
+        if roll < args.rate_limit_rate + args.error_rate:
+            return JSONResponse({"error": "injected failure"}, status_code=503)
+        if path != "/oauth2/token":
+            token = request.headers.get("authorization", "").removeprefix("Bearer ")
+            if tokens.get(token, 0) < time.time():
+                return JSONResponse({"error": "invalid token"}, status_code=401)
+        return await call_next(request)
+
+    @app.post("/oauth2/token")
+    async def token():
+        state["tokens_issued"] += 1
+        value = f"fake-{uuid.uuid4().hex}"
+        tokens[value] = time.time() + args.token_ttl
+        return {"access_token": value, "expires_in": args.token_ttl, "token_type": "bearer"}
+
+    @app.get("/vehicles")
+    async def vehicles(request: Request):
+        return page([v for vs in users.values() for v in vs], request)
+
+    @app.post("/vehicles/{vehicle_id}/charging")
+    async def charging(vehicle_id: str, body: dict):
+        return {"id": str(uuid.uuid4()), "vehicleId": vehicle_id, "kind": body.get("action"), "state": "PENDING"}
+
+    @app.get("/users")
+    async def list_users(request: Request):
+        return page([{"id": user_id, "linkedVendors": []} for user_id in users], request)
+
+    @app.get("/users/{user_id}/vehicles")
+    async def user_vehicles(user_id: str, request: Request):
+        return page(users.get(user_id, []), request)
+
+    @app.delete("/users/{user_id}")
+    async def delete_user(user_id: str):
+        users.pop(user_id, None)
+        return Response(status_code=204)
+
+    @app.delete("/users/{user_id}/vendors/{vendor}")
+    async def unlink(user_id: str, vendor: str):
+        return Response(status_code=204)
+
+    @app.post("/users/{user_id}/link")
+    async def link(user_id: str):
+        return {"linkUrl": f"https://link.fake/{user_id}", "linkToken": uuid.uuid4().hex}
+
+    @app.post("/links/token")
+    async def link_result():
+        return {"userId": next(iter(users), "user-0"), "vendor": "TESLA"}
+
+    @app.get("/webhooks")
+    async def list_webhooks():
+        return {"data": list(webhooks.values())}
+
+    @app.post("/webhooks")
+    async def create_webhook(body: dict):
+        webhook_id = str(uuid.uuid4())
+        webhooks[webhook_id] = {"id": webhook_id, "url": body.get("url"), "events": body.get("events", []), "isActive": True}
+        return webhooks[webhook_id]
+
+    @app.delete("/webhooks/{webhook_id}")
+    async def delete_webhook(webhook_id: str):
+        webhooks.pop(webhook_id, None)
+        return Response(status_code=204)
+
+    @app.post("/webhooks/{webhook_id}/test")
+    async def test_webhook(webhook_id: str):
+        return {"status": "SUCCESS"}
+
+    @app.get("/__stats")
+    async def stats():
+        return {"tokens_issued": state["tokens_issued"], "requests": dict(requests_by_path)}
+
+    @app.post("/__revoke")
+    async def revoke():
+        tokens.clear()
+        return {"revoked": True}
+
+    @app.post("/__reset")
+    async def reset(fail_first: int | None = None, rate_limit_first: int | None = None):
+        requests_by_path.clear()
+        state["tokens_issued"] = 0
+        state["fail_first"] = args.fail_first if fail_first is None else fail_first
+        state["rate_limit_first"] = args.rate_limit_first if rate_limit_first is None else rate_limit_first
+        return {"reset": True}
+
+    return app
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Fake Enode API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--vehicles-per-user", type=int, default=2)
+    parser.add_argument("--token-ttl", type=int, default=3600, help="Token lifetime in seconds")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Mean added latency per request")
+    parser.add_argument("--error-rate", type=float, default=0, help="Share of requests answered with 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0, help="Share of requests answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429")
+    parser.add_argument("--fail-first", type=int, default=0, help="Answer the first N requests with 503")
+    parser.add_argument("--rate-limit-first", type=int, default=0, help="Answer the first N requests (after --fail-first) with 429")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    uvicorn.run(build_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
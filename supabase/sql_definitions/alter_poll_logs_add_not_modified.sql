@@ -0,0 +1,4 @@
+-- Flag polls answered with 304 Not Modified; they are logged but, by default,
+-- not counted against the monthly allowance (see count_polls_by_day).
+ALTER TABLE public.poll_logs
+ADD COLUMN IF NOT EXISTS not_modified boolean NOT NULL DEFAULT false;
@@ -0,0 +1,4 @@
+-- Content hash of the normalized vehicle_cache (see backend/app/lib/vehicle_diff.py).
+-- upsert_vehicles skips rewriting rows whose hash is unchanged.
+ALTER TABLE public.vehicles
+ADD COLUMN IF NOT EXISTS cache_hash text;
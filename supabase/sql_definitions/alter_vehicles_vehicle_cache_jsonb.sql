@@ -0,0 +1,36 @@
+-- Store vehicles.vehicle_cache as a native jsonb object.
+--
+-- The backend used to write json.dumps(vehicle), which ended up either as text
+-- or as a jsonb *string* holding the serialized object. Either way every read
+-- had to fetch and parse the whole blob. With a jsonb object the backend reads
+-- only the keys it needs (e.g. select=chargeState:vehicle_cache->chargeState).
+--
+-- Run this before deploying the backend that reads projections; it is
+-- idempotent and safe to re-run.
+
+-- 1) text column -> jsonb
+DO $$
+BEGIN
+  IF (
+    SELECT data_type
+    FROM information_schema.columns
+    WHERE table_schema = 'public' AND table_name = 'vehicles' AND column_name = 'vehicle_cache'
+  ) <> 'jsonb' THEN
+    ALTER TABLE public.vehicles
+    ALTER COLUMN vehicle_cache TYPE jsonb USING vehicle_cache::jsonb;
+  END IF;
+END;
+$$;
+
+-- 2) Backfill: unwrap rows stored as a jsonb string containing the serialized object.
+--    The update is idempotent, so it can be run in batches on a large table by
+--    adding e.g. "AND id IN (SELECT id ... LIMIT 5000)" and repeating.
+UPDATE public.vehicles
+SET vehicle_cache = (vehicle_cache #>> '{}')::jsonb
+WHERE jsonb_typeof(vehicle_cache) = 'string';
+
+-- 3) Only objects from now on.
+ALTER TABLE public.vehicles DROP CONSTRAINT IF EXISTS vehicles_vehicle_cache_is_object;
+ALTER TABLE public.vehicles
+ADD CONSTRAINT vehicles_vehicle_cache_is_object
+CHECK (vehicle_cache IS NULL OR jsonb_typeof(vehicle_cache) = 'object');
@@ -0,0 +1,33 @@
+-- Charging sessions that have not ended yet, one per vehicle.
+--
+-- The backend's session detector (backend/app/services/charging_sessions.py)
+-- keeps these in memory while it consumes charging samples and checkpoints
+-- them here, so a restart continues the session instead of splitting it.
+-- When a session ends it is inserted into charging_sessions (with the same
+-- session_id) and its row here is deleted. Locations are stored as they are
+-- written to charging_sessions.
+
+create table if not exists public.charging_sessions_open (
+  vehicle_id uuid not null,
+  session_id uuid not null,
+  user_id uuid null,
+  start_time timestamp with time zone not null,
+  last_sample_time timestamp with time zone not null,
+  last_charging_time timestamp with time zone not null,
+  last_is_charging boolean not null default true,
+  start_battery_level numeric null,
+  last_battery_level numeric null,
+  battery_capacity_kwh numeric null,
+  energy_added_kwh numeric not null default 0,
+  charging_seconds numeric not null default 0,
+  max_charge_rate_kw numeric null,
+  last_charge_rate_kw numeric null,
+  brand text null,
+  model text null,
+  year integer null,
+  start_location geography null,
+  last_location geography null,
+  updated_at timestamp with time zone not null default now(),
+  constraint charging_sessions_open_pkey primary key (vehicle_id),
+  constraint charging_sessions_open_session_id_key unique (session_id)
+) TABLESPACE pg_default;
@@ -0,0 +1,222 @@
+-- Incrementally maintained charging statistics.
+--
+-- /api/stats/global and /api/stats/user used to aggregate all of
+-- charging_sessions (global_stats_view, get_user_stats) on every call. These
+-- rollups hold the same figures and are updated by record_charging_sessions in
+-- the same statement that stores newly ended sessions, so reading them costs
+-- one primary-key lookup no matter how much history there is. The distinct
+-- user and vehicle counts are kept with the help of the membership tables.
+
+CREATE TABLE IF NOT EXISTS public.charging_stats_global (
+  id smallint NOT NULL DEFAULT 1,
+  unique_users bigint NOT NULL DEFAULT 0,
+  unique_vehicles bigint NOT NULL DEFAULT 0,
+  total_sessions bigint NOT NULL DEFAULT 0,
+  total_kwh_charged numeric NOT NULL DEFAULT 0,
+  total_minutes_charged numeric NOT NULL DEFAULT 0,
+  highest_max_charge_rate_kw numeric NULL,
+  highest_average_charge_rate_kw numeric NULL,
+  min_start_time timestamp with time zone NULL,
+  max_end_time timestamp with time zone NULL,
+  updated_at timestamp with time zone NOT NULL DEFAULT now(),
+  CONSTRAINT charging_stats_global_pkey PRIMARY KEY (id),
+  CONSTRAINT charging_stats_global_single_row CHECK (id = 1)
+) TABLESPACE pg_default;
+
+INSERT INTO public.charging_stats_global (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS public.charging_stats_user (
+  user_id uuid NOT NULL,
+  unique_vehicles bigint NOT NULL DEFAULT 0,
+  total_sessions bigint NOT NULL DEFAULT 0,
+  total_kwh_charged numeric NOT NULL DEFAULT 0,
+  total_minutes_charged numeric NOT NULL DEFAULT 0,
+  min_start_time timestamp with time zone NULL,
+  max_end_time timestamp with time zone NULL,
+  updated_at timestamp with time zone NOT NULL DEFAULT now(),
+  CONSTRAINT charging_stats_user_pkey PRIMARY KEY (user_id)
+) TABLESPACE pg_default;
+
+-- Vehicles with at least one session, overall and per user
+CREATE TABLE IF NOT EXISTS public.charging_stats_vehicles (
+  vehicle_id uuid NOT NULL,
+  CONSTRAINT charging_stats_vehicles_pkey PRIMARY KEY (vehicle_id)
+) TABLESPACE pg_default;
+
+CREATE TABLE IF NOT EXISTS public.charging_stats_user_vehicles (
+  user_id uuid NOT NULL,
+  vehicle_id uuid NOT NULL,
+  CONSTRAINT charging_stats_user_vehicles_pkey PRIMARY KEY (user_id, vehicle_id)
+) TABLESPACE pg_default;
+
+
+-- Stores ended sessions (p_sessions is a JSON array of charging_sessions rows)
+-- and adds the ones not stored before to the rollups. Sessions whose
+-- session_id already exists are skipped, so retries are not counted twice.
+-- Returns the number of sessions inserted.
+CREATE OR REPLACE FUNCTION public.record_charging_sessions(p_sessions jsonb)
+RETURNS integer
+LANGUAGE sql
+VOLATILE
+AS $$
+  WITH input AS (
+    SELECT *
+    FROM jsonb_populate_recordset(NULL::public.charging_sessions, p_sessions)
+  ),
+  inserted AS (
+    INSERT INTO public.charging_sessions (
+      session_id, vehicle_id, user_id, start_time, end_time,
+      start_battery_level, end_battery_level, energy_added_kwh, duration_minutes,
+      max_charge_rate_kw, average_charge_rate_kw, brand, model, year,
+      start_location, end_location
+    )
+    SELECT
+      i.session_id, i.vehicle_id, i.user_id, i.start_time, i.end_time,
+      i.start_battery_level, i.end_battery_level, i.energy_added_kwh, i.duration_minutes,
+      i.max_charge_rate_kw, i.average_charge_rate_kw, i.brand, i.model, i.year,
+      i.start_location, i.end_location
+    FROM input i
+    ON CONFLICT (session_id) DO NOTHING
+    RETURNING *
+  ),
+  new_vehicles AS (
+    INSERT INTO public.charging_stats_vehicles (vehicle_id)
+    SELECT DISTINCT s.vehicle_id FROM inserted s
+    ON CONFLICT DO NOTHING
+    RETURNING vehicle_id
+  ),
+  new_user_vehicles AS (
+    INSERT INTO public.charging_stats_user_vehicles (user_id, vehicle_id)
+    SELECT DISTINCT s.user_id, s.vehicle_id FROM inserted s WHERE s.user_id IS NOT NULL
+    ON CONFLICT DO NOTHING
+    RETURNING user_id
+  ),
+  per_user AS (
+    SELECT
+      s.user_id,
+      count(*) AS sessions,
+      COALESCE(sum(s.energy_added_kwh), 0) AS kwh,
+      COALESCE(sum(s.duration_minutes), 0) AS minutes,
+      min(s.start_time) AS min_start_time,
+      max(s.end_time) AS max_end_time
+    FROM inserted s
+    WHERE s.user_id IS NOT NULL
+    GROUP BY s.user_id
+  ),
+  users_upserted AS (
+    INSERT INTO public.charging_stats_user AS u (
+      user_id, unique_vehicles, total_sessions, total_kwh_charged, total_minutes_charged, min_start_time, max_end_time
+    )
+    SELECT
+      p.user_id,
+      (SELECT count(*) FROM new_user_vehicles n WHERE n.user_id = p.user_id),
+      p.sessions, p.kwh, p.minutes, p.min_start_time, p.max_end_time
+    FROM per_user p
+    ON CONFLICT (user_id) DO UPDATE
+      SET unique_vehicles       = u.unique_vehicles + EXCLUDED.unique_vehicles,
+          total_sessions        = u.total_sessions + EXCLUDED.total_sessions,
+          total_kwh_charged     = u.total_kwh_charged + EXCLUDED.total_kwh_charged,
+          total_minutes_charged = u.total_minutes_charged + EXCLUDED.total_minutes_charged,
+          min_start_time        = LEAST(u.min_start_time, EXCLUDED.min_start_time),
+          max_end_time          = GREATEST(u.max_end_time, EXCLUDED.max_end_time),
+          updated_at            = now()
+    RETURNING (u.xmax = 0) AS is_new
+  ),
+  global_updated AS (
+    UPDATE public.charging_stats_global g
+    SET unique_users                   = g.unique_users + (SELECT count(*) FROM users_upserted WHERE is_new),
+        unique_vehicles                = g.unique_vehicles + (SELECT count(*) FROM new_vehicles),
+        total_sessions                 = g.total_sessions + t.sessions,
+        total_kwh_charged              = g.total_kwh_charged + t.kwh,
+        total_minutes_charged          = g.total_minutes_charged + t.minutes,
+        highest_max_charge_rate_kw     = GREATEST(g.highest_max_charge_rate_kw, t.max_rate),
+        highest_average_charge_rate_kw = GREATEST(g.highest_average_charge_rate_kw, t.max_average_rate),
+        min_start_time                 = LEAST(g.min_start_time, t.min_start_time),
+        max_end_time                   = GREATEST(g.max_end_time, t.max_end_time),
+        updated_at                     = now()
+    FROM (
+      SELECT
+        count(*) AS sessions,
+        COALESCE(sum(s.energy_added_kwh), 0) AS kwh,
+        COALESCE(sum(s.duration_minutes), 0) AS minutes,
+        max(s.max_charge_rate_kw) AS max_rate,
+        max(s.average_charge_rate_kw) AS max_average_rate,
+        min(s.start_time) AS min_start_time,
+        max(s.end_time) AS max_end_time
+      FROM inserted s
+    ) t
+    WHERE g.id = 1 AND t.sessions > 0
+    RETURNING g.id
+  )
+  SELECT count(*)::integer FROM inserted;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.record_charging_sessions(jsonb) TO service_role;
+
+
+-- Recomputes all rollups from charging_sessions. Run once after creating the
+-- tables, and to repair them after sessions were changed by hand.
+CREATE OR REPLACE FUNCTION public.rebuild_charging_stats()
+RETURNS void
+LANGUAGE plpgsql
+VOLATILE
+AS $$
+BEGIN
+  LOCK TABLE public.charging_sessions IN SHARE MODE;
+
+  DELETE FROM public.charging_stats_user_vehicles;
+  INSERT INTO public.charging_stats_user_vehicles (user_id, vehicle_id)
+  SELECT DISTINCT user_id, vehicle_id FROM public.charging_sessions WHERE user_id IS NOT NULL;
+
+  DELETE FROM public.charging_stats_vehicles;
+  INSERT INTO public.charging_stats_vehicles (vehicle_id)
+  SELECT DISTINCT vehicle_id FROM public.charging_sessions;
+
+  DELETE FROM public.charging_stats_user;
+  INSERT INTO public.charging_stats_user (
+    user_id, unique_vehicles, total_sessions, total_kwh_charged, total_minutes_charged, min_start_time, max_end_time
+  )
+  SELECT
+    user_id,
+    count(DISTINCT vehicle_id),
+    count(*),
+    COALESCE(sum(energy_added_kwh), 0),
+    COALESCE(sum(duration_minutes), 0),
+    min(start_time),
+    max(end_time)
+  FROM public.charging_sessions
+  WHERE user_id IS NOT NULL
+  GROUP BY user_id;
+
+  INSERT INTO public.charging_stats_global AS g (
+    id, unique_users, unique_vehicles, total_sessions, total_kwh_charged, total_minutes_charged,
+    highest_max_charge_rate_kw, highest_average_charge_rate_kw, min_start_time, max_end_time, updated_at
+  )
+  SELECT
+    1,
+    count(DISTINCT user_id),
+    count(DISTINCT vehicle_id),
+    count(*),
+    COALESCE(sum(energy_added_kwh), 0),
+    COALESCE(sum(duration_minutes), 0),
+    max(max_charge_rate_kw),
+    max(average_charge_rate_kw),
+    min(start_time),
+    max(end_time),
+    now()
+  FROM public.charging_sessions
+  ON CONFLICT (id) DO UPDATE
+    SET unique_users                   = EXCLUDED.unique_users,
+        unique_vehicles                = EXCLUDED.unique_vehicles,
+        total_sessions                 = EXCLUDED.total_sessions,
+        total_kwh_charged              = EXCLUDED.total_kwh_charged,
+        total_minutes_charged          = EXCLUDED.total_minutes_charged,
+        highest_max_charge_rate_kw     = EXCLUDED.highest_max_charge_rate_kw,
+        highest_average_charge_rate_kw = EXCLUDED.highest_average_charge_rate_kw,
+        min_start_time                 = EXCLUDED.min_start_time,
+        max_end_time                   = EXCLUDED.max_end_time,
+        updated_at                     = EXCLUDED.updated_at;
+END;
+$$;
+
+-- SELECT public.rebuild_charging_stats();
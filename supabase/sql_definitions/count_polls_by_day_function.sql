@@ -0,0 +1,31 @@
+-- Daily poll counts used to seed and reconcile the in-process/Redis rate-limit counters.
+-- Filter by user, by vehicle, or both. Days are UTC calendar days.
+-- Polls answered with 304 Not Modified are left out unless p_include_not_modified.
+
+DROP FUNCTION IF EXISTS public.count_polls_by_day(timestamptz, uuid, uuid);
+
+CREATE OR REPLACE FUNCTION public.count_polls_by_day(
+  p_since timestamptz,
+  p_user_id uuid DEFAULT NULL,
+  p_vehicle_id uuid DEFAULT NULL,
+  p_include_not_modified boolean DEFAULT false
+)
+RETURNS TABLE (day date, poll_count bigint)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT (pl.created_at AT TIME ZONE 'UTC')::date AS day,
+         COUNT(*) AS poll_count
+  FROM public.poll_logs pl
+  WHERE pl.created_at >= p_since
+    AND (p_user_id IS NULL OR pl.user_id = p_user_id)
+    AND (p_vehicle_id IS NULL OR pl.vehicle_id = p_vehicle_id)
+    AND (p_include_not_modified OR NOT pl.not_modified)
+  GROUP BY 1
+  ORDER BY 1;
+$$;
+
+-- Supports the per-user window (the per-vehicle one uses idx_poll_logs_vehicle_time).
+CREATE INDEX IF NOT EXISTS idx_poll_logs_user_time ON public.poll_logs (user_id, created_at);
+
+GRANT EXECUTE ON FUNCTION public.count_polls_by_day(timestamptz, uuid, uuid, boolean) TO service_role;
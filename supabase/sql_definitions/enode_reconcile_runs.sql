@@ -0,0 +1,31 @@
+-- Passes of the Enode fleet reconciliation job (backend/app/services/enode_reconcile.py).
+--
+-- A pass pages through GET /vehicles and rewrites the vehicles rows whose
+-- content hash, owner or existence differs from Enode. It is processed in
+-- increments of a few pages; `cursor` is the Enode pagination cursor of the
+-- next page, so a pass interrupted by a deploy or an Enode outage resumes
+-- where it stopped. The counters are the drift statistics of the pass.
+
+CREATE TABLE IF NOT EXISTS public.enode_reconcile_runs (
+  id uuid NOT NULL DEFAULT gen_random_uuid(),
+  status text NOT NULL DEFAULT 'in_progress',  -- in_progress | completed | abandoned
+  cursor text,
+  pages integer NOT NULL DEFAULT 0,
+  vehicles_seen integer NOT NULL DEFAULT 0,
+  vehicles_unchanged integer NOT NULL DEFAULT 0,
+  vehicles_missing integer NOT NULL DEFAULT 0,
+  vehicles_changed integer NOT NULL DEFAULT 0,
+  vehicles_owner_changed integer NOT NULL DEFAULT 0,
+  vehicles_unknown_user integer NOT NULL DEFAULT 0,
+  vehicles_written integer NOT NULL DEFAULT 0,
+  -- Age of the oldest drifted row when it was found
+  max_drift_seconds integer NOT NULL DEFAULT 0,
+  last_error text,
+  started_at timestamp with time zone NOT NULL DEFAULT now(),
+  updated_at timestamp with time zone NOT NULL DEFAULT now(),
+  finished_at timestamp with time zone,
+  CONSTRAINT enode_reconcile_runs_pkey PRIMARY KEY (id)
+) TABLESPACE pg_default;
+
+CREATE INDEX IF NOT EXISTS idx_enode_reconcile_runs_status_started
+  ON public.enode_reconcile_runs (status, started_at DESC);
@@ -0,0 +1,29 @@
+-- Users with recent API polls whose cached vehicles are stale, most stale first.
+-- Used by the backend's vehicle refresher to update active users from Enode
+-- before they next open the dashboard. Relies on idx_poll_logs_user_time
+-- (count_polls_by_day_function.sql).
+
+CREATE OR REPLACE FUNCTION public.get_vehicle_refresh_candidates(
+  p_active_since timestamptz,
+  p_stale_before timestamptz,
+  p_limit integer DEFAULT 50
+)
+RETURNS TABLE (user_id uuid)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT v.user_id
+  FROM public.vehicles v
+  WHERE v.updated_at < p_stale_before
+    AND EXISTS (
+      SELECT 1
+      FROM public.poll_logs pl
+      WHERE pl.user_id = v.user_id
+        AND pl.created_at >= p_active_since
+    )
+  GROUP BY v.user_id
+  ORDER BY min(v.updated_at)
+  LIMIT p_limit;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.get_vehicle_refresh_candidates(timestamptz, timestamptz, integer) TO service_role;
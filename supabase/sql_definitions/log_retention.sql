@@ -0,0 +1,396 @@
+-- Retention and compaction of the high-volume log tables
+-- (backend/app/services/log_retention.py).
+--
+-- poll_logs, api_telemetry, webhook_logs, stripe_webhook_logs and status_logs
+-- are append-only. Once a UTC day has passed, compact_next_log_day rolls its
+-- raw rows into log_rollups, at hour and day granularity, per source, key,
+-- user and vehicle. log_compaction_state records the last day compacted per
+-- source. prune_log_rows then deletes raw rows in bounded batches, but only
+-- rows of days that are already compacted, and prune_log_payloads clears the
+-- request/response payloads of api_telemetry and stripe_webhook_logs earlier.
+-- get_log_activity reads rollups up to the compaction boundary and aggregates
+-- the raw rows after it, so callers see one series whatever has been pruned.
+--
+-- What `key` and `flagged` hold per source:
+--   poll_logs            endpoint      polls answered 304 Not Modified
+--   api_telemetry        endpoint      responses with status >= 400
+--   webhook_logs         event         events without a user
+--   stripe_webhook_logs  event_type    events logged with an error
+--   status_logs          category      failed checks
+-- Durations, bytes and cost_tokens are only recorded for api_telemetry.
+
+CREATE TABLE IF NOT EXISTS public.log_rollups (
+  source text NOT NULL,
+  granularity text NOT NULL,  -- hour | day
+  bucket_start timestamp with time zone NOT NULL,
+  key text,
+  user_id text,
+  vehicle_id text,
+  count bigint NOT NULL DEFAULT 0,
+  flagged bigint NOT NULL DEFAULT 0,
+  duration_p50_ms double precision,
+  duration_p95_ms double precision,
+  duration_max_ms double precision,
+  request_bytes bigint NOT NULL DEFAULT 0,
+  response_bytes bigint NOT NULL DEFAULT 0,
+  cost_tokens bigint NOT NULL DEFAULT 0,
+  CONSTRAINT log_rollups_granularity CHECK (granularity IN ('hour', 'day')),
+  CONSTRAINT log_rollups_bucket_key UNIQUE NULLS NOT DISTINCT (source, granularity, bucket_start, key, user_id, vehicle_id)
+) TABLESPACE pg_default;
+
+CREATE INDEX IF NOT EXISTS idx_log_rollups_user
+  ON public.log_rollups (source, granularity, user_id, bucket_start) WHERE user_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_log_rollups_vehicle
+  ON public.log_rollups (source, granularity, vehicle_id, bucket_start) WHERE vehicle_id IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS public.log_compaction_state (
+  source text NOT NULL,
+  -- Last UTC day whose raw rows are in log_rollups
+  compacted_through date NOT NULL,
+  rows_compacted bigint NOT NULL DEFAULT 0,
+  rows_pruned bigint NOT NULL DEFAULT 0,
+  updated_at timestamp with time zone NOT NULL DEFAULT now(),
+  CONSTRAINT log_compaction_state_pkey PRIMARY KEY (source)
+) TABLESPACE pg_default;
+
+-- Time-range scans for compaction and pruning, and the admin webhook log list
+CREATE INDEX IF NOT EXISTS idx_poll_logs_created_at ON public.poll_logs (created_at);
+CREATE INDEX IF NOT EXISTS idx_api_telemetry_timestamp ON public.api_telemetry ("timestamp");
+CREATE INDEX IF NOT EXISTS idx_api_telemetry_payload_timestamp ON public.api_telemetry ("timestamp")
+  WHERE request_payload IS NOT NULL OR response_payload IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_webhook_logs_created_at ON public.webhook_logs (created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_stripe_webhook_logs_created_at ON public.stripe_webhook_logs (created_at);
+CREATE INDEX IF NOT EXISTS idx_stripe_webhook_logs_payload_created_at ON public.stripe_webhook_logs (created_at)
+  WHERE payload IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_status_logs_category_checked_at ON public.status_logs (category, checked_at);
+
+-- Payloads older than their retention are cleared, not the whole row
+ALTER TABLE public.stripe_webhook_logs ALTER COLUMN payload DROP NOT NULL;
+
+
+-- Table and time column of a log source
+CREATE OR REPLACE FUNCTION public.log_source_table(p_source text, OUT table_name text, OUT time_column text)
+LANGUAGE plpgsql
+IMMUTABLE
+AS $$
+BEGIN
+  CASE p_source
+    WHEN 'poll_logs' THEN table_name := 'poll_logs'; time_column := 'created_at';
+    WHEN 'api_telemetry' THEN table_name := 'api_telemetry'; time_column := 'timestamp';
+    WHEN 'webhook_logs' THEN table_name := 'webhook_logs'; time_column := 'created_at';
+    WHEN 'stripe_webhook_logs' THEN table_name := 'stripe_webhook_logs'; time_column := 'created_at';
+    WHEN 'status_logs' THEN table_name := 'status_logs'; time_column := 'checked_at';
+    ELSE RAISE EXCEPTION 'Unknown log source: %', p_source;
+  END CASE;
+END;
+$$;
+
+
+-- Aggregates the raw rows of a source in [p_from, p_to) into hour or day
+-- buckets, in the shape of log_rollups.
+CREATE OR REPLACE FUNCTION public.aggregate_log_rows(
+  p_source text,
+  p_granularity text,
+  p_from timestamptz,
+  p_to timestamptz
+)
+RETURNS TABLE (
+  bucket_start timestamptz,
+  key text,
+  user_id text,
+  vehicle_id text,
+  count bigint,
+  flagged bigint,
+  duration_p50_ms double precision,
+  duration_p95_ms double precision,
+  duration_max_ms double precision,
+  request_bytes bigint,
+  response_bytes bigint,
+  cost_tokens bigint
+)
+LANGUAGE plpgsql
+STABLE
+AS $$
+#variable_conflict use_column
+BEGIN
+  IF p_granularity NOT IN ('hour', 'day') THEN
+    RAISE EXCEPTION 'Unknown granularity: %', p_granularity;
+  END IF;
+
+  IF p_source = 'api_telemetry' THEN
+    RETURN QUERY
+    SELECT date_trunc(p_granularity, t."timestamp", 'UTC'), t.endpoint, t.user_id::text, t.vehicle_id::text,
+           count(*), count(*) FILTER (WHERE t.status >= 400),
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY t.duration_ms),
+           percentile_cont(0.95) WITHIN GROUP (ORDER BY t.duration_ms),
+           max(t.duration_ms)::double precision,
+           COALESCE(sum(t.request_size), 0)::bigint,
+           COALESCE(sum(t.response_size), 0)::bigint,
+           COALESCE(sum(t.cost_tokens), 0)::bigint
+    FROM public.api_telemetry t
+    WHERE t."timestamp" >= p_from AND t."timestamp" < p_to
+    GROUP BY 1, 2, 3, 4;
+
+  ELSIF p_source = 'poll_logs' THEN
+    RETURN QUERY
+    SELECT date_trunc(p_granularity, t.created_at, 'UTC'), t.endpoint, t.user_id::text, t.vehicle_id::text,
+           count(*), count(*) FILTER (WHERE t.not_modified),
+           NULL::double precision, NULL::double precision, NULL::double precision, 0::bigint, 0::bigint, 0::bigint
+    FROM public.poll_logs t
+    WHERE t.created_at >= p_from AND t.created_at < p_to
+    GROUP BY 1, 2, 3, 4;
+
+  ELSIF p_source = 'webhook_logs' THEN
+    RETURN QUERY
+    SELECT date_trunc(p_granularity, t.created_at, 'UTC'), COALESCE(t.event, t.event_type), t.user_id::text, t.vehicle_id::text,
+           count(*), count(*) FILTER (WHERE t.user_id IS NULL),
+           NULL::double precision, NULL::double precision, NULL::double precision, 0::bigint, 0::bigint, 0::bigint
+    FROM public.webhook_logs t
+    WHERE t.created_at >= p_from AND t.created_at < p_to
+    GROUP BY 1, 2, 3, 4;
+
+  ELSIF p_source = 'stripe_webhook_logs' THEN
+    RETURN QUERY
+    SELECT date_trunc(p_granularity, t.created_at, 'UTC'), t.event_type, t.user_id::text, NULL::text,
+           count(*), count(*) FILTER (WHERE t.error IS NOT NULL),
+           NULL::double precision, NULL::double precision, NULL::double precision, 0::bigint, 0::bigint, 0::bigint
+    FROM public.stripe_webhook_logs t
+    WHERE t.created_at >= p_from AND t.created_at < p_to
+    GROUP BY 1, 2, 3, 4;
+
+  ELSIF p_source = 'status_logs' THEN
+    RETURN QUERY
+    SELECT date_trunc(p_granularity, t.checked_at, 'UTC'), t.category, NULL::text, NULL::text,
+           count(*), count(*) FILTER (WHERE NOT t.status),
+           NULL::double precision, NULL::double precision, NULL::double precision, 0::bigint, 0::bigint, 0::bigint
+    FROM public.status_logs t
+    WHERE t.checked_at >= p_from AND t.checked_at < p_to
+    GROUP BY 1, 2, 3, 4;
+
+  ELSE
+    RAISE EXCEPTION 'Unknown log source: %', p_source;
+  END IF;
+END;
+$$;
+
+
+-- Rolls up the oldest day of p_source not compacted yet, if it is before
+-- p_until, and returns it (NULL if there is nothing to compact). The rollups
+-- of the day are replaced, so compacting a day twice is harmless. Days
+-- without raw rows are skipped. One day per call keeps the transaction short.
+CREATE OR REPLACE FUNCTION public.compact_next_log_day(p_source text, p_until date)
+RETURNS date
+LANGUAGE plpgsql
+VOLATILE
+AS $$
+DECLARE
+  v_table text;
+  v_column text;
+  v_through date;
+  v_next timestamptz;
+  v_day date;
+  v_from timestamptz;
+  v_to timestamptz;
+  v_rows bigint;
+BEGIN
+  SELECT s.table_name, s.time_column INTO v_table, v_column FROM public.log_source_table(p_source) s;
+  -- Runs of the job in several processes take turns per source
+  PERFORM pg_advisory_xact_lock(hashtext('compact_next_log_day:' || p_source));
+
+  SELECT compacted_through INTO v_through FROM public.log_compaction_state WHERE source = p_source;
+  EXECUTE format('SELECT min(%I) FROM public.%I WHERE %I >= $1', v_column, v_table, v_column)
+    INTO v_next
+    USING COALESCE(((v_through + 1)::timestamp AT TIME ZONE 'UTC'), '-infinity'::timestamptz);
+  IF v_next IS NULL THEN
+    RETURN NULL;
+  END IF;
+
+  v_day := (v_next AT TIME ZONE 'UTC')::date;
+  IF v_day >= p_until THEN
+    RETURN NULL;
+  END IF;
+  v_from := v_day::timestamp AT TIME ZONE 'UTC';
+  v_to := (v_day + 1)::timestamp AT TIME ZONE 'UTC';
+
+  DELETE FROM public.log_rollups
+  WHERE source = p_source AND bucket_start >= v_from AND bucket_start < v_to;
+
+  INSERT INTO public.log_rollups (
+    source, granularity, bucket_start, key, user_id, vehicle_id, count, flagged,
+    duration_p50_ms, duration_p95_ms, duration_max_ms, request_bytes, response_bytes, cost_tokens
+  )
+  SELECT p_source, g.granularity, a.*
+  FROM (VALUES ('hour'), ('day')) AS g (granularity)
+  CROSS JOIN LATERAL public.aggregate_log_rows(p_source, g.granularity, v_from, v_to) a;
+
+  SELECT COALESCE(sum(r.count), 0) INTO v_rows
+  FROM public.log_rollups r
+  WHERE r.source = p_source AND r.granularity = 'day' AND r.bucket_start = v_from;
+
+  INSERT INTO public.log_compaction_state AS s (source, compacted_through, rows_compacted)
+  VALUES (p_source, v_day, v_rows)
+  ON CONFLICT (source) DO UPDATE
+    SET compacted_through = GREATEST(s.compacted_through, EXCLUDED.compacted_through),
+        rows_compacted    = s.rows_compacted + EXCLUDED.rows_compacted,
+        updated_at        = now();
+
+  RETURN v_day;
+END;
+$$;
+
+
+-- Deletes up to p_limit raw rows of p_source older than p_before, oldest
+-- first. Rows of days that are not compacted yet are never deleted.
+-- Returns the number of rows deleted.
+CREATE OR REPLACE FUNCTION public.prune_log_rows(p_source text, p_before timestamptz, p_limit integer)
+RETURNS integer
+LANGUAGE plpgsql
+VOLATILE
+AS $$
+DECLARE
+  v_table text;
+  v_column text;
+  v_through date;
+  v_before timestamptz;
+  v_deleted integer;
+BEGIN
+  SELECT s.table_name, s.time_column INTO v_table, v_column FROM public.log_source_table(p_source) s;
+  SELECT compacted_through INTO v_through FROM public.log_compaction_state WHERE source = p_source;
+  IF v_through IS NULL THEN
+    RETURN 0;
+  END IF;
+  v_before := LEAST(p_before, (v_through + 1)::timestamp AT TIME ZONE 'UTC');
+
+  EXECUTE format(
+    'DELETE FROM public.%I WHERE ctid = ANY (ARRAY(SELECT ctid FROM public.%I WHERE %I < $1 ORDER BY %I LIMIT $2))',
+    v_table, v_table, v_column, v_column
+  ) USING v_before, p_limit;
+  GET DIAGNOSTICS v_deleted = ROW_COUNT;
+
+  IF v_deleted > 0 THEN
+    UPDATE public.log_compaction_state
+    SET rows_pruned = rows_pruned + v_deleted, updated_at = now()
+    WHERE source = p_source;
+  END IF;
+  RETURN v_deleted;
+END;
+$$;
+
+
+-- Clears the stored payloads of up to p_limit rows older than p_before
+-- (api_telemetry request/response payloads, stripe_webhook_logs payloads).
+-- Returns the number of rows cleared.
+CREATE OR REPLACE FUNCTION public.prune_log_payloads(p_source text, p_before timestamptz, p_limit integer)
+RETURNS integer
+LANGUAGE plpgsql
+VOLATILE
+AS $$
+DECLARE
+  v_cleared integer;
+BEGIN
+  IF p_source = 'api_telemetry' THEN
+    UPDATE public.api_telemetry
+    SET request_payload = NULL, response_payload = NULL
+    WHERE ctid = ANY (ARRAY(
+      SELECT ctid FROM public.api_telemetry
+      WHERE "timestamp" < p_before AND (request_payload IS NOT NULL OR response_payload IS NOT NULL)
+      ORDER BY "timestamp"
+      LIMIT p_limit
+    ));
+  ELSIF p_source = 'stripe_webhook_logs' THEN
+    UPDATE public.stripe_webhook_logs
+    SET payload = NULL
+    WHERE ctid = ANY (ARRAY(
+      SELECT ctid FROM public.stripe_webhook_logs
+      WHERE created_at < p_before AND payload IS NOT NULL
+      ORDER BY created_at
+      LIMIT p_limit
+    ));
+  ELSE
+    RAISE EXCEPTION 'Log source % has no payloads to prune', p_source;
+  END IF;
+  GET DIAGNOSTICS v_cleared = ROW_COUNT;
+  RETURN v_cleared;
+END;
+$$;
+
+
+-- Activity of a log source per hour or day bucket and key, from the rollups
+-- before the compaction boundary and from the raw rows after it. p_from is
+-- rounded down to the start of its bucket. Optional filters on key, user and
+-- vehicle. Percentiles of buckets that combine several users or vehicles are
+-- the averages of theirs weighted by count, so they are approximate.
+CREATE OR REPLACE FUNCTION public.get_log_activity(
+  p_source text,
+  p_granularity text,
+  p_from timestamptz,
+  p_to timestamptz,
+  p_key text DEFAULT NULL,
+  p_user_id text DEFAULT NULL,
+  p_vehicle_id text DEFAULT NULL
+)
+RETURNS TABLE (
+  bucket_start timestamptz,
+  key text,
+  count bigint,
+  flagged bigint,
+  duration_p50_ms double precision,
+  duration_p95_ms double precision,
+  duration_max_ms double precision,
+  request_bytes bigint,
+  response_bytes bigint,
+  cost_tokens bigint
+)
+LANGUAGE plpgsql
+STABLE
+AS $$
+#variable_conflict use_column
+DECLARE
+  v_from timestamptz;
+  v_boundary timestamptz;
+BEGIN
+  PERFORM public.log_source_table(p_source);
+  v_from := date_trunc(p_granularity, p_from, 'UTC');
+  SELECT (compacted_through + 1)::timestamp AT TIME ZONE 'UTC' INTO v_boundary
+  FROM public.log_compaction_state WHERE source = p_source;
+  v_boundary := COALESCE(v_boundary, '-infinity'::timestamptz);
+
+  RETURN QUERY
+  WITH buckets AS (
+    SELECT r.bucket_start, r.key, r.count, r.flagged, r.duration_p50_ms, r.duration_p95_ms, r.duration_max_ms,
+           r.request_bytes, r.response_bytes, r.cost_tokens
+    FROM public.log_rollups r
+    WHERE r.source = p_source
+      AND r.granularity = p_granularity
+      AND r.bucket_start >= v_from
+      AND r.bucket_start < LEAST(p_to, v_boundary)
+      AND (p_key IS NULL OR r.key = p_key)
+      AND (p_user_id IS NULL OR r.user_id = p_user_id)
+      AND (p_vehicle_id IS NULL OR r.vehicle_id = p_vehicle_id)
+    UNION ALL
+    SELECT a.bucket_start, a.key, a.count, a.flagged, a.duration_p50_ms, a.duration_p95_ms, a.duration_max_ms,
+           a.request_bytes, a.response_bytes, a.cost_tokens
+    FROM public.aggregate_log_rows(p_source, p_granularity, GREATEST(v_from, v_boundary), p_to) a
+    WHERE (p_key IS NULL OR a.key = p_key)
+      AND (p_user_id IS NULL OR a.user_id = p_user_id)
+      AND (p_vehicle_id IS NULL OR a.vehicle_id = p_vehicle_id)
+  )
+  SELECT b.bucket_start, b.key,
+         sum(b.count)::bigint,
+         sum(b.flagged)::bigint,
+         sum(b.duration_p50_ms * b.count) / NULLIF(sum(b.count) FILTER (WHERE b.duration_p50_ms IS NOT NULL), 0),
+         sum(b.duration_p95_ms * b.count) / NULLIF(sum(b.count) FILTER (WHERE b.duration_p95_ms IS NOT NULL), 0),
+         max(b.duration_max_ms),
+         sum(b.request_bytes)::bigint,
+         sum(b.response_bytes)::bigint,
+         sum(b.cost_tokens)::bigint
+  FROM buckets b
+  GROUP BY b.bucket_start, b.key
+  ORDER BY b.bucket_start, b.key;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.compact_next_log_day(text, date) TO service_role;
+GRANT EXECUTE ON FUNCTION public.prune_log_rows(text, timestamptz, integer) TO service_role;
+GRANT EXECUTE ON FUNCTION public.prune_log_payloads(text, timestamptz, integer) TO service_role;
+GRANT EXECUTE ON FUNCTION public.get_log_activity(text, text, timestamptz, timestamptz, text, text, text) TO service_role;
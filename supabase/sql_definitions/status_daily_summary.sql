@@ -0,0 +1,29 @@
+-- Checks and failed checks per UTC day of one status_logs category, for the
+-- public status panel (backend/app/services/status_panel.py). p_to is
+-- inclusive. Goes through get_log_activity (log_retention.sql), so days that
+-- were compacted and pruned are read from log_rollups and the rest is
+-- aggregated from status_logs, all in one call.
+
+CREATE OR REPLACE FUNCTION public.get_status_daily_summary(
+  p_category text,
+  p_from date,
+  p_to date
+)
+RETURNS TABLE (day date, checks bigint, failed bigint)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT (a.bucket_start AT TIME ZONE 'UTC')::date AS day,
+         a.count AS checks,
+         a.flagged AS failed
+  FROM public.get_log_activity(
+    'status_logs',
+    'day',
+    p_from::timestamp AT TIME ZONE 'UTC',
+    (p_to + 1)::timestamp AT TIME ZONE 'UTC',
+    p_category
+  ) a
+  ORDER BY 1;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.get_status_daily_summary(text, date, date) TO service_role;
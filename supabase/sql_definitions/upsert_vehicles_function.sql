@@ -0,0 +1,94 @@
+-- Incremental maintenance of users.linked_vehicle_count.
+--
+-- The count changes only when a vehicle row is actually inserted, deleted or
+-- moved to another user, in the same transaction as the row change. Updates of
+-- an existing vehicle (every user:vehicle:updated webhook) never touch users.
+
+CREATE OR REPLACE FUNCTION public.maintain_linked_vehicle_count()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    UPDATE public.users
+    SET linked_vehicle_count = linked_vehicle_count + 1
+    WHERE id = NEW.user_id;
+  END IF;
+
+  IF TG_OP IN ('DELETE', 'UPDATE') THEN
+    UPDATE public.users
+    SET linked_vehicle_count = GREATEST(linked_vehicle_count - 1, 0)
+    WHERE id = OLD.user_id;
+  END IF;
+
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS vehicles_linked_count_insert_delete ON public.vehicles;
+CREATE TRIGGER vehicles_linked_count_insert_delete
+AFTER INSERT OR DELETE ON public.vehicles
+FOR EACH ROW EXECUTE FUNCTION public.maintain_linked_vehicle_count();
+
+DROP TRIGGER IF EXISTS vehicles_linked_count_owner_change ON public.vehicles;
+CREATE TRIGGER vehicles_linked_count_owner_change
+AFTER UPDATE OF user_id ON public.vehicles
+FOR EACH ROW
+WHEN (OLD.user_id IS DISTINCT FROM NEW.user_id)
+EXECUTE FUNCTION public.maintain_linked_vehicle_count();
+
+
+-- Bulk vehicle upsert used by the webhook pipeline and the Enode refresh.
+-- p_rows is a JSON array of vehicles rows (vehicle_id, user_id, vendor, online,
+-- vehicle_cache, cache_hash, updated_at). Existing rows are only rewritten when
+-- cache_hash changed or the row is older than p_refresh_seconds, so identical
+-- webhooks for idle vehicles cost no write. Returns one row per vehicle with its
+-- database id, whether it was inserted or written, and what its online flag was
+-- before, so the backend can send offline notifications and stream events
+-- without a separate select.
+
+DROP FUNCTION IF EXISTS public.upsert_vehicles(jsonb);
+-- The return type changed (id was added)
+DROP FUNCTION IF EXISTS public.upsert_vehicles(jsonb, integer);
+
+CREATE OR REPLACE FUNCTION public.upsert_vehicles(p_rows jsonb, p_refresh_seconds integer DEFAULT 0)
+RETURNS TABLE (id uuid, vehicle_id text, user_id uuid, inserted boolean, written boolean, online_old boolean)
+LANGUAGE sql
+VOLATILE
+AS $$
+  WITH input AS (
+    SELECT r.vehicle_id, r.user_id, r.vendor, r.online, r.vehicle_cache, r.cache_hash, r.updated_at
+    FROM jsonb_populate_recordset(NULL::public.vehicles, p_rows) AS r
+  ),
+  previous AS (
+    SELECT v.id, v.vehicle_id, v.online
+    FROM public.vehicles v
+    WHERE v.vehicle_id IN (SELECT i.vehicle_id FROM input i)
+  ),
+  upserted AS (
+    INSERT INTO public.vehicles AS v (vehicle_id, user_id, vendor, online, vehicle_cache, cache_hash, updated_at)
+    SELECT i.vehicle_id, i.user_id, i.vendor, i.online, i.vehicle_cache, i.cache_hash, i.updated_at
+    FROM input i
+    ON CONFLICT (vehicle_id) DO UPDATE
+      SET user_id       = EXCLUDED.user_id,
+          vendor        = EXCLUDED.vendor,
+          online        = EXCLUDED.online,
+          vehicle_cache = EXCLUDED.vehicle_cache,
+          cache_hash    = EXCLUDED.cache_hash,
+          updated_at    = EXCLUDED.updated_at
+      WHERE v.cache_hash IS DISTINCT FROM EXCLUDED.cache_hash
+         OR v.user_id IS DISTINCT FROM EXCLUDED.user_id
+         OR v.updated_at IS NULL
+         OR v.updated_at < EXCLUDED.updated_at - make_interval(secs => p_refresh_seconds)
+    RETURNING v.id, v.vehicle_id, (v.xmax = 0) AS inserted
+  )
+  SELECT COALESCE(u.id, p.id), i.vehicle_id, i.user_id, COALESCE(u.inserted, false), u.vehicle_id IS NOT NULL, p.online
+  FROM input i
+  LEFT JOIN upserted u ON u.vehicle_id = i.vehicle_id
+  LEFT JOIN previous p ON p.vehicle_id = i.vehicle_id;
+$$;
+
+GRANT EXECUTE ON FUNCTION public.upsert_vehicles(jsonb, integer) TO service_role;
+
+-- Run update_linked_vehicle_count.sql once after installing the triggers to
+-- bring existing counts in line. Requires alter_vehicles_add_cache_hash.sql.